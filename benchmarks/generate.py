@@ -0,0 +1,136 @@
+"""
+Deterministic synthetic test data for the benchmarks. The same seed and
+size always give the same features and cell values, so timings from
+different runs and machines are comparable.
+"""
+
+# import internals
+import math
+import os
+import random
+
+import numpy
+
+from ..raster import saver as raster_saver
+from ..raster.data import Band
+from ..vector import saver as vector_saver
+
+
+# all generated data falls within this lon/lat extent
+EXTENT = (-120.0, 30.0, -100.0, 45.0)
+
+
+def random_points(count, seed=0):
+    rand = random.Random(seed)
+    xmin, ymin, xmax, ymax = EXTENT
+    for _ in xrange(count):
+        yield (rand.uniform(xmin, xmax), rand.uniform(ymin, ymax))
+
+
+def point_geometries(count, seed=0):
+    return [{"type": "Point", "coordinates": point} for point in random_points(count, seed)]
+
+
+def line_geometries(count, vertices=20, step=0.05, seed=0):
+    """Random walks starting from random points."""
+    rand = random.Random(seed)
+    geometries = []
+    for x, y in random_points(count, seed):
+        coords = [(x, y)]
+        for _ in xrange(vertices - 1):
+            angle = rand.uniform(0, 2 * math.pi)
+            x, y = x + step * math.cos(angle), y + step * math.sin(angle)
+            coords.append((x, y))
+        geometries.append({"type": "LineString", "coordinates": coords})
+    return geometries
+
+
+def polygon_geometries(count, vertices=16, radius=0.1, seed=0):
+    """Star shaped polygons with jittered radii around random centres."""
+    rand = random.Random(seed)
+    geometries = []
+    for cx, cy in random_points(count, seed):
+        ring = []
+        for i in xrange(vertices):
+            angle = 2 * math.pi * i / vertices
+            r = radius * rand.uniform(0.5, 1.0)
+            ring.append((cx + r * math.cos(angle), cy + r * math.sin(angle)))
+        ring.append(ring[0])
+        geometries.append({"type": "Polygon", "coordinates": [ring]})
+    return geometries
+
+
+GEOMETRIES = {
+    "Point": point_geometries,
+    "LineString": line_geometries,
+    "Polygon": polygon_geometries,
+    }
+
+
+def attributes(count, seed=0):
+    """Fields and rows with an id, a float and a text attribute."""
+    rand = random.Random(seed)
+    fields = ["id", "value", "name"]
+    rows = [[i, round(rand.uniform(0, 1000), 3), "feature_%i" % i] for i in xrange(count)]
+    return fields, rows
+
+
+def vector_file(directory, geomtype, count, extension=".shp", seed=0):
+    """Write a synthetic vector file if it doesn't exist yet, returning its path."""
+    filepath = os.path.join(directory, "%s_%i%s" % (geomtype.lower(), count, extension))
+    if not os.path.lexists(filepath):
+        fields, rows = attributes(count, seed)
+        geometries = GEOMETRIES[geomtype](count, seed=seed)
+        vector_saver.to_file(fields, rows, geometries, filepath)
+    return filepath
+
+
+def raster_array(width, height, nodata=-9999.0, nodata_fraction=0.1, seed=0):
+    """
+    A smooth float surface, like a dem, with a blob of nodata cells
+    covering roughly the given fraction of the raster.
+    """
+    rng = numpy.random.RandomState(seed)
+    xs = numpy.linspace(0, 4 * math.pi, width)
+    ys = numpy.linspace(0, 4 * math.pi, height)
+    surface = 500 + 100 * numpy.sin(xs)[None, :] * numpy.cos(ys)[:, None]
+    surface += rng.normal(0, 5, (height, width))
+    # a circular nodata hole in one corner
+    rows, cols = numpy.indices((height, width))
+    radius = math.sqrt(nodata_fraction * width * height / math.pi)
+    surface[(rows ** 2 + cols ** 2) < radius ** 2] = nodata
+    return surface.astype(numpy.float32)
+
+
+def raster_info(width, height, nodata=-9999.0):
+    xmin, ymin, xmax, ymax = EXTENT
+    xres = (xmax - xmin) / float(width)
+    yres = (ymin - ymax) / float(height)
+    return {"transform_coeffs": [xres, 0, xmin, 0, yres, ymax],
+            "nodata_value": nodata, "cell_anchor": "center"}
+
+
+def raster_file(directory, width, height, extension=".tif", seed=0):
+    """Write a synthetic single band float raster if it doesn't exist yet, returning its path."""
+    filepath = os.path.join(directory, "raster_%ix%i%s" % (width, height, extension))
+    if os.path.lexists(filepath):
+        return filepath
+    info = raster_info(width, height)
+    array = raster_array(width, height, info["nodata_value"], seed=seed)
+    if extension == ".asc":
+        xscale, xskew, xoff, yskew, yscale, yoff = info["transform_coeffs"]
+        xmin, ymin, xmax, ymax = EXTENT
+        with open(filepath, "w") as writer:
+            writer.write("ncols %i\nnrows %i\n" % (width, height))
+            writer.write("xllcorner %r\nyllcorner %r\n" % (xmin, ymin))
+            writer.write("cellsize %r\nNODATA_value %r\n" % (xscale, info["nodata_value"]))
+            for row in array:
+                writer.write(" ".join("%.3f" % value for value in row) + "\n")
+        # world file params are ordered a, d, b, e, c, f
+        with open(filepath[:-4] + ".wld", "w") as writer:
+            writer.write("\n".join(repr(value) for value in
+                                   (xscale, yskew, xskew, yscale, xoff, yoff)))
+    else:
+        raster_saver.to_tiled_geotiff(filepath, info, bands=[Band.from_array(array)],
+                                      compression=None)
+    return filepath
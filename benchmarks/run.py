@@ -0,0 +1,239 @@
+"""
+Benchmarks for the vector and raster hot paths.
+
+Run from the directory containing the package, eg:
+
+    python -m PythonGIS.benchmarks.run --sizes small --output results.json
+    python -m PythonGIS.benchmarks.run --baseline baseline.json
+
+Each case reports its best wall time over a few repeats, its throughput
+in features or cells per second and the peak memory allocated while it
+ran. Results are written as json, and when a baseline file is given any
+case that got slower than the allowed tolerance is reported and the run
+exits with a non-zero status.
+"""
+
+# import internals
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import timeit
+
+try:
+    import tracemalloc
+except ImportError:
+    # python 2 has no allocation tracing, so each call runs in a fork
+    tracemalloc = None
+    import resource
+
+from . import generate
+from ..raster import loader as raster_loader
+from ..raster import saver as raster_saver
+from ..raster.data import RasterData, Band
+from ..vector import loader as vector_loader
+from ..vector import saver as vector_saver
+from ..vector.data import VectorData
+
+
+SIZES = {
+    "small": {"features": [1000], "cells": [256]},
+    "medium": {"features": [1000, 10000], "cells": [256, 1024]},
+    "large": {"features": [1000, 10000, 100000], "cells": [256, 1024, 4096]},
+    }
+
+
+def forked_peak(func):
+    """
+    Peak bytes a call adds to the resident size of a forked child. The
+    child starts its own peak from the pages it touches, so earlier cases
+    and the parent's own allocations don't count, unlike ru_maxrss here.
+    """
+    reader, writer = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(reader)
+            gc.collect()
+            # ru_maxrss is in kilobytes on linux
+            start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            func()
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            os.write(writer, str((peak - start) * 1024).encode())
+        finally:
+            os._exit(0)
+    os.close(writer)
+    with os.fdopen(reader) as output:
+        result = output.read()
+    os.waitpid(pid, 0)
+    if not result:
+        raise Exception("The forked benchmark call failed")
+    return int(result)
+
+
+def measure(func, repeats=3):
+    """Best wall time in seconds over the repeats, and the peak bytes allocated by one call."""
+    times = []
+    for _ in xrange(repeats):
+        gc.collect()
+        start = timeit.default_timer()
+        func()
+        times.append(timeit.default_timer() - start)
+    gc.collect()
+    if tracemalloc:
+        tracemalloc.start()
+        func()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    elif hasattr(os, "fork"):
+        peak = forked_peak(func)
+    else:
+        # no way to measure a single call
+        peak = None
+    return min(times), peak
+
+
+def vector_cases(directory, counts):
+    """Yields (name, size, items, func) for every vector benchmark."""
+    for geomtype in ("Point", "LineString", "Polygon"):
+        for count in counts:
+            for extension in (".shp", ".geojson"):
+                path = generate.vector_file(directory, geomtype, count, extension)
+                fmt = extension.lstrip(".")
+                yield ("vector.loader.from_file[%s,%s]" % (geomtype, fmt), count, count,
+                       lambda path=path: vector_loader.from_file(path))
+
+                fields, rows, geometries, crs = vector_loader.from_file(path)
+                savepath = os.path.join(directory, "saved" + extension)
+                yield ("vector.saver.to_file[%s,%s]" % (geomtype, fmt), count, count,
+                       lambda fields=fields, rows=rows, geometries=geometries, savepath=savepath:
+                       vector_saver.to_file(fields, rows, geometries, savepath))
+
+            path = generate.vector_file(directory, geomtype, count, ".shp")
+            vector_data = VectorData(path)
+            yield ("VectorData.create_spatial_index[%s]" % geomtype, count, count,
+                   vector_data.create_spatial_index)
+
+            queries = [(x, y, x + 0.5, y + 0.5) for x, y in generate.random_points(1000, seed=1)]
+            yield ("VectorData.quick_overlap[%s]" % geomtype, count, len(queries),
+                   lambda vector_data=vector_data, queries=queries:
+                   [list(vector_data.quick_overlap(bbox)) for bbox in queries])
+            yield ("VectorData.quick_nearest[%s]" % geomtype, count, len(queries),
+                   lambda vector_data=vector_data, queries=queries:
+                   [list(vector_data.quick_nearest(bbox, n=5)) for bbox in queries])
+
+
+def raster_cases(directory, sizes):
+    """Yields (name, size, items, func) for every raster benchmark."""
+    for size in sizes:
+        cells = size * size
+        for extension, name in ((".tif", "geotiff"), (".asc", "ascii")):
+            path = generate.raster_file(directory, size, size, extension)
+            yield ("raster.loader.from_file[%s]" % name, size, cells,
+                   lambda path=path: raster_loader.from_file(path))
+
+        raster = RasterData(generate.raster_file(directory, size, size, ".tif"))
+
+        def mask(raster=raster):
+            if hasattr(raster, "_cached_mask"):
+                del raster._cached_mask
+            return raster.mask
+        yield ("RasterData.mask", size, cells, mask)
+
+        raster.mask
+        view = generate.EXTENT[0], generate.EXTENT[3], generate.EXTENT[2], generate.EXTENT[1]
+        yield ("RasterData.positioned", size, 512 * 512,
+               lambda raster=raster: raster.positioned(512, 512, view, cache=None))
+
+        for compression in (None, "deflate"):
+            savepath = os.path.join(directory, "saved.tif")
+            yield ("raster.saver.to_tiled_geotiff[%s]" % compression, size, cells,
+                   lambda raster=raster, savepath=savepath, compression=compression:
+                   raster_saver.to_tiled_geotiff(savepath, raster.info, bands=raster.bands,
+                                                 compression=compression))
+
+        savepath = os.path.join(directory, "saved.asc")
+        yield ("raster.saver.to_file[ascii]", size, cells,
+               lambda raster=raster, savepath=savepath:
+               raster_saver.to_file(raster.bands, raster.info, savepath))
+
+        # 8 bit bands, scaled down from the float surface, take the plain PIL writers
+        img = raster.bands[0].img.point(lambda value: value * 0.25).convert("L")
+        bands = [Band(img, img.load())]
+        info = dict(raster.info, nodata_value=0)
+        for extension, name in ((".tif", "geotiff"), (".png", "image")):
+            savepath = os.path.join(directory, "saved8bit" + extension)
+            yield ("raster.saver.to_file[%s]" % name, size, cells,
+                   lambda bands=bands, info=info, savepath=savepath:
+                   raster_saver.to_file(bands, info, savepath))
+
+
+def run(sizes="small", directory=None, repeats=3, select=None):
+    """Run all benchmark cases, returning a list of result dicts."""
+    directory = directory or os.path.join(tempfile.gettempdir(), "pythongis_benchmarks")
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    preset = SIZES[sizes]
+    cases = list(vector_cases(directory, preset["features"]))
+    cases += list(raster_cases(directory, preset["cells"]))
+
+    results = []
+    for name, size, items, func in cases:
+        if select and select not in name:
+            continue
+        seconds, peak = measure(func, repeats)
+        result = {"name": name, "size": size, "seconds": seconds,
+                  "throughput": items / seconds if seconds else None,
+                  "peak_bytes": peak}
+        results.append(result)
+        sys.stdout.write("%-55s %8i %10.4fs %14.0f/s %10.1f MB\n" % (
+            name, size, seconds, result["throughput"] or 0, (peak or 0) / 1048576.0))
+    return results
+
+
+def compare(results, baseline, tolerance=0.25):
+    """The cases that are more than tolerance slower than in the baseline results."""
+    previous = dict(((result["name"], result["size"]), result) for result in baseline)
+    regressions = []
+    for result in results:
+        before = previous.get((result["name"], result["size"]))
+        if before and result["seconds"] > before["seconds"] * (1 + tolerance):
+            regressions.append((result, before))
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark the vector and raster hot paths")
+    parser.add_argument("--sizes", choices=sorted(SIZES), default="small")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--select", help="only run cases whose name contains this text")
+    parser.add_argument("--data", help="directory for the generated data (reused between runs)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown relative to the baseline (default 0.25 = 25%%)")
+    options = parser.parse_args(args)
+
+    results = run(options.sizes, options.data, options.repeats, options.select)
+    with open(options.output, "w") as writer:
+        json.dump({"python": platform.python_version(), "platform": platform.platform(),
+                   "sizes": options.sizes, "results": results}, writer, indent=2)
+
+    if options.baseline:
+        with open(options.baseline) as reader:
+            baseline = json.load(reader)["results"]
+        regressions = compare(results, baseline, options.tolerance)
+        for result, before in regressions:
+            sys.stdout.write("REGRESSION %s [%s]: %.4fs -> %.4fs (%+.0f%%)\n" % (
+                result["name"], result["size"], before["seconds"], result["seconds"],
+                100 * (result["seconds"] / before["seconds"] - 1)))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""
+File format drivers and lazy imports of their backend libraries.
+
+Each format registers the file extensions it handles, the functions that
+read and write it, and what it is capable of. The functions may be given
+as "module:function" strings, which are only imported the first time the
+format is used, so that eg shapely or PIL are not loaded by a program that
+never needs them:
+
+    from PythonGIS.vector import drivers
+    drivers.registry.register("fastformat", (".ff",), read="fastformat.io:read",
+                              streaming=True)
+"""
+
+# import internals
+import importlib
+
+from collections import OrderedDict
+
+
+CAPABILITIES = ("read", "write", "metadata")
+
+
+class LazyModule(object):
+    """
+    Stand-in for a module that imports it on first attribute access.
+    Submodules are imported the same way, so a lazy PIL gives PIL.Image.
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        # only called for attributes of the real module
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        try:
+            return getattr(self._module, attr)
+        except AttributeError:
+            return importlib.import_module("%s.%s" % (self._name, attr))
+
+    def __repr__(self):
+        return "<lazy module %r>" % self._name
+
+
+def lazy_import(name):
+    """
+    A LazyModule for the named module. This is returned even if the module
+    is already imported, so that its submodules are still imported on access.
+    """
+    return LazyModule(name)
+
+
+def resolve(target, package=None):
+    """Import a "module:function" target, relative to the package if it starts with a dot."""
+    modname, attr = target.split(":")
+    return getattr(importlib.import_module(modname, package), attr)
+
+
+class Driver(object):
+    """
+    One file format: the extensions it handles, its read, write and
+    metadata functions (callables or "module:function" strings), and
+    capability flags describing its reader. Streaming means the reader
+    yields the data piece by piece without holding the whole file in
+    memory, windowed that it can read part of the file without the rest.
+    """
+    def __init__(self, name, extensions, package=None, streaming=False, windowed=False, **functions):
+        self.name = name
+        self.extensions = tuple(extension.lower() for extension in extensions)
+        self.package = package
+        self.streaming = streaming
+        self.windowed = windowed
+        self._functions = dict((capability, functions.get(capability)) for capability in CAPABILITIES)
+
+    def __repr__(self):
+        return "<Driver %s %s>" % (self.name, ",".join(capability for capability in CAPABILITIES
+                                                        if self.can(capability)))
+
+    def can(self, capability):
+        return self._functions.get(capability) is not None
+
+    def function(self, capability):
+        func = self._functions.get(capability)
+        if func is None:
+            raise Exception("The %s driver does not support %s" % (self.name, capability))
+        if isinstance(func, basestring):
+            func = self._functions[capability] = resolve(func, self.package)
+        return func
+
+    def read(self, *args, **kwargs):
+        return self.function("read")(*args, **kwargs)
+
+    def write(self, *args, **kwargs):
+        return self.function("write")(*args, **kwargs)
+
+    def metadata(self, *args, **kwargs):
+        return self.function("metadata")(*args, **kwargs)
+
+
+class Registry(object):
+    """
+    The drivers of one kind of data. Relative "module:function" targets
+    are imported from the given package. Drivers registered later take
+    precedence, so a plugin can take over the extensions of a built in one.
+    """
+    def __init__(self, package=None):
+        self.package = package
+        self.drivers = OrderedDict()
+
+    def __iter__(self):
+        for driver in self.drivers.itervalues():
+            yield driver
+
+    def register(self, name, extensions, **options):
+        options.setdefault("package", self.package)
+        driver = Driver(name, extensions, **options)
+        self.drivers.pop(name, None)
+        self.drivers[name] = driver
+        return driver
+
+    def unregister(self, name):
+        del self.drivers[name]
+
+    def find(self, filepath, capability="read"):
+        """The driver that handles the filepath's extension with the given capability, or None."""
+        filepath = filepath.lower()
+        for driver in reversed(self.drivers.values()):
+            if filepath.endswith(driver.extensions) and driver.can(capability):
+                return driver
+
+    def extensions(self, capability=None):
+        return tuple(extension for driver in self
+                     if capability is None or driver.can(capability)
+                     for extension in driver.extensions)
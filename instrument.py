@@ -0,0 +1,163 @@
+"""
+Lightweight timing and counting of the main processing stages.
+
+Instrumentation is off by default, in which case every hook returns a
+shared do-nothing object and costs about one function call. Turn it on
+with a sink that receives the measurements:
+
+    from PythonGIS import instrument
+    sink = instrument.enable(instrument.PrometheusSink())
+    ... load, index, query, render ...
+    print sink.report()
+    print sink.dump()
+    instrument.disable()
+
+Each stage records its wall time, a call, and optionally a count of the
+items it handled (features, cells, ...) and an estimate of the bytes it
+allocated.
+"""
+
+# import internals
+import logging
+import threading
+import timeit
+
+
+enabled = False
+_sink = None
+
+
+class _NullStage(object):
+    """Stand-in returned while instrumentation is disabled."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, items=0, nbytes=0):
+        pass
+
+
+NULL_STAGE = _NullStage()
+
+
+class Stage(object):
+    """Times a block of code and sends the measurement to the sink on exit."""
+    __slots__ = ("name", "items", "nbytes", "sink", "start")
+
+    def __init__(self, name, items=0, nbytes=0, sink=None):
+        self.name = name
+        self.items = items
+        self.nbytes = nbytes
+        self.sink = sink
+
+    def __enter__(self):
+        self.start = timeit.default_timer()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = timeit.default_timer() - self.start
+        self.sink.record(self.name, seconds, self.items, self.nbytes)
+        return False
+
+    def add(self, items=0, nbytes=0):
+        """Add to the item and byte counts once they are known inside the block."""
+        self.items += items
+        self.nbytes += nbytes
+
+
+def stage(name, items=0, nbytes=0):
+    """Context manager timing the named stage, see Stage.add for counting."""
+    if not enabled:
+        return NULL_STAGE
+    return Stage(name, items, nbytes, _sink)
+
+
+def count(name, items=0, nbytes=0):
+    """Record a call of the named stage without timing it, eg cache hits."""
+    if enabled:
+        _sink.record(name, 0.0, items, nbytes)
+
+
+def record(name, seconds, items=0, nbytes=0):
+    """Record a stage the caller timed itself, eg time summed over the steps of a loop."""
+    if enabled:
+        _sink.record(name, seconds, items, nbytes)
+
+
+def enable(sink=None):
+    """Start sending measurements to the sink (a new MemorySink by default), and return it."""
+    global enabled, _sink
+    _sink = sink or MemorySink()
+    enabled = True
+    return _sink
+
+
+def disable():
+    global enabled, _sink
+    enabled = False
+    _sink = None
+
+
+class MemorySink(object):
+    """Accumulates totals per stage: calls, seconds, max seconds, items and bytes."""
+    def __init__(self):
+        self.stats = dict()
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, items=0, nbytes=0):
+        with self._lock:
+            stat = self.stats.get(name)
+            if stat is None:
+                stat = self.stats[name] = dict(calls=0, seconds=0.0, max_seconds=0.0,
+                                               items=0, bytes=0)
+            stat["calls"] += 1
+            stat["seconds"] += seconds
+            stat["max_seconds"] = max(stat["max_seconds"], seconds)
+            stat["items"] += items
+            stat["bytes"] += nbytes
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+
+    def report(self):
+        """A text table of the stages, slowest total first."""
+        lines = ["%-40s %8s %12s %12s %14s %12s" % (
+            "stage", "calls", "total s", "max s", "items", "MB")]
+        for name, stat in sorted(self.stats.items(), key=lambda item: -item[1]["seconds"]):
+            lines.append("%-40s %8i %12.6f %12.6f %14i %12.2f" % (
+                name, stat["calls"], stat["seconds"], stat["max_seconds"],
+                stat["items"], stat["bytes"] / 1048576.0))
+        return "\n".join(lines)
+
+
+class LoggingSink(object):
+    """Logs every measurement as it happens."""
+    def __init__(self, logger=None, level=logging.DEBUG):
+        self.logger = logger or logging.getLogger("PythonGIS.instrument")
+        self.level = level
+
+    def record(self, name, seconds, items=0, nbytes=0):
+        self.logger.log(self.level, "%s took %.6fs (items=%i, bytes=%i)",
+                        name, seconds, items, nbytes)
+
+
+class PrometheusSink(MemorySink):
+    """In-memory totals that can be dumped in the Prometheus text exposition format."""
+    METRICS = [
+        ("calls", "pythongis_stage_calls_total", "Number of times the stage ran"),
+        ("seconds", "pythongis_stage_seconds_total", "Total wall time spent in the stage"),
+        ("items", "pythongis_stage_items_total", "Features or cells handled by the stage"),
+        ("bytes", "pythongis_stage_bytes_total", "Estimated bytes allocated by the stage"),
+        ]
+
+    def dump(self):
+        lines = []
+        for key, metric, help in self.METRICS:
+            lines.append("# HELP %s %s" % (metric, help))
+            lines.append("# TYPE %s counter" % metric)
+            for name, stat in sorted(self.stats.items()):
+                lines.append('%s{stage="%s"} %r' % (metric, name, stat[key]))
+        return "\n".join(lines) + "\n"
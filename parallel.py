@@ -0,0 +1,120 @@
+# import internals
+import atexit
+import multiprocessing
+import multiprocessing.pool
+import os
+import threading
+
+
+# default number of workers, None means one per cpu
+WORKERS = None
+
+# the shared thread and process pools, created on first use and kept between calls
+_thread_pool = None
+_thread_pool_key = None
+_process_pool = None
+_process_pool_key = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+
+def set_workers(workers):
+    """Set the default number of workers used by all parallel operations."""
+    global WORKERS
+    WORKERS = workers
+
+
+def get_workers(workers=None):
+    """Resolve an explicit worker count, falling back to the global default."""
+    return workers or WORKERS or multiprocessing.cpu_count()
+
+
+def _mark_pool_thread():
+    _local.in_pool = True
+
+
+def thread_pool(workers=None):
+    """
+    The shared pool of threads, created on first use and only rebuilt when
+    the number of workers changes, or in a forked child that can't use
+    the parent's threads.
+    """
+    global _thread_pool, _thread_pool_key
+    key = (get_workers(workers), os.getpid())
+    with _pool_lock:
+        if _thread_pool_key != key:
+            if _thread_pool is not None and _thread_pool_key[1] == key[1]:
+                _thread_pool.close()
+            _thread_pool = multiprocessing.pool.ThreadPool(key[0], _mark_pool_thread)
+            _thread_pool_key = key
+        return _thread_pool
+
+
+def map_threads(func, iterable, workers=None):
+    """
+    Map func over the items on the shared pool of threads, keeping the
+    input order. Meant for work that releases the GIL, such as PIL image
+    operations. Runs serially when there is only one worker or one item,
+    or when called from one of the pool's own threads, which would
+    otherwise wait on the pool they occupy.
+    """
+    items = list(iterable)
+    if min(get_workers(workers), len(items)) <= 1 or getattr(_local, "in_pool", False):
+        return [func(item) for item in items]
+    return thread_pool(workers).map(func, items)
+
+
+def process_pool(workers=None):
+    """
+    The shared pool of processes, created on first use and only rebuilt
+    when the number of workers changes, or in a forked child.
+    """
+    global _process_pool, _process_pool_key
+    key = (get_workers(workers), os.getpid())
+    with _pool_lock:
+        if _process_pool_key != key:
+            if _process_pool is not None and _process_pool_key[1] == key[1]:
+                _process_pool.close()
+            _process_pool = multiprocessing.Pool(key[0])
+            _process_pool_key = key
+        return _process_pool
+
+
+def map_processes(func, iterable, workers=None, initializer=None, initargs=()):
+    """
+    Map func over the items on a pool of processes, keeping the input order.
+    Meant for cpu bound pure python or numpy work; func and the items must
+    be picklable, so func has to be a module level function. Runs on the
+    shared pool of processes, except with an initializer, which runs once
+    in each worker, eg to set up shared lookup data, and so needs a pool
+    of its own started for the call. Runs serially in this process when
+    there is only one worker or one item.
+    """
+    items = list(iterable)
+    workers = min(get_workers(workers), len(items))
+    if workers <= 1:
+        if initializer:
+            initializer(*initargs)
+        return [func(item) for item in items]
+    if not initializer:
+        return process_pool(workers).map(func, items)
+    pool = multiprocessing.Pool(workers, initializer, initargs)
+    try:
+        return pool.map(func, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+@atexit.register
+def _close_pools():
+    if _thread_pool is not None and _thread_pool_key[1] == os.getpid():
+        _thread_pool.close()
+    if _process_pool is not None and _process_pool_key[1] == os.getpid():
+        _process_pool.terminate()
+
+
+def chunks(items, size):
+    """Split a sequence into consecutive lists of at most size items."""
+    items = list(items)
+    return [items[i:i+size] for i in xrange(0, len(items), size)]
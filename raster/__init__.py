@@ -0,0 +1,5 @@
+from . import data
+from . import loader
+from . import saver
+from . import zonal
+from . import catalog
@@ -0,0 +1,69 @@
+# import internals
+import threading
+
+from collections import OrderedDict
+
+from .. import instrument
+
+
+# rough bytes per pixel for each PIL image mode
+MODE_BYTES = {"1": 1, "L": 1, "P": 1, "I;16": 2, "I": 4, "F": 4, "RGB": 3, "RGBA": 4}
+
+
+def image_bytes(img):
+    width, height = img.size
+    return width * height * MODE_BYTES.get(img.mode, 4)
+
+
+class RenderCache(object):
+    """
+    Least recently used store of rendered views, bounded by the total
+    estimated size of the images it holds rather than by entry count.
+    Each entry is a (band_images, mask_image) pair.
+    """
+    def __init__(self, max_bytes=256*1024*1024):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                instrument.count("raster.render_cache.miss")
+                return None
+            instrument.count("raster.render_cache.hit")
+            # reinsert to mark as most recently used
+            self._entries[key] = entry
+            return entry[0]
+
+    def put(self, key, value):
+        band_imgs, mask = value
+        size = sum(image_bytes(img) for img in band_imgs) + image_bytes(mask)
+        if size > self.max_bytes:
+            # would evict everything else and still not fit
+            return
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                oldkey, (oldvalue, oldsize) = self._entries.popitem(last=False)
+                self.nbytes -= oldsize
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+
+# shared by all rasters, entries are keyed by each raster's unique id and version
+render_cache = RenderCache()
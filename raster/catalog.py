@@ -0,0 +1,151 @@
+# import internals
+import itertools
+import json
+import logging
+import os
+
+from collections import OrderedDict
+
+from . import data
+from . import drivers
+from . import loader
+from ..drivers import lazy_import
+
+PIL = lazy_import("PIL")
+rtree = lazy_import("rtree")
+
+
+class RasterCatalog(object):
+    """
+    Spatial index over a directory of raster files, built from their
+    headers alone. Views over the whole archive are mosaicked from only
+    the files that intersect them, and a bounded number of recently used
+    rasters are kept open between requests.
+    """
+    def __init__(self, directory=None, indexpath=None, max_open=16):
+        self.max_open = max_open
+        self.entries = OrderedDict()
+        self.errors = []
+        self._open = OrderedDict()
+        self._id_generator = itertools.count()
+
+        if indexpath and os.path.lexists(indexpath + ".json"):
+            self.load(indexpath)
+        else:
+            self.spindex = rtree.index.Index()
+            if directory:
+                self.scan(directory)
+                if indexpath:
+                    self.save(indexpath)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        for entry in self.entries.itervalues():
+            yield entry
+
+    def scan(self, directory):
+        """
+        Add every supported raster under a directory, skipping files already
+        indexed and files that aren't georeferenced. Files that fail to load
+        for any other reason are logged and kept as (filepath, error) in errors.
+        """
+        known = set(entry["filepath"] for entry in self)
+        for dirpath, dirnames, filenames in os.walk(directory):
+            for filename in sorted(filenames):
+                filepath = os.path.join(dirpath, filename)
+                if drivers.registry.find(filename, "metadata") and filepath not in known:
+                    try:
+                        self.add(filepath)
+                    except loader.NotGeoreferenced:
+                        # eg a plain image, so can't be placed in the catalog
+                        continue
+                    except Exception as err:
+                        logging.getLogger("PythonGIS.catalog").warning("Couldn't index %s: %s", filepath, err)
+                        self.errors.append((filepath, err))
+
+    def add(self, filepath):
+        """Index one raster file by its header info."""
+        info, (width, height), bandcount, crs = loader.read_metadata(filepath)
+        a, b, c, d, e, f = data.transform_from_info(info)
+        corners = [(col*a + row*b + c, col*d + row*e + f)
+                   for col, row in ((0, 0), (width, 0), (0, height), (width, height))]
+        xs, ys = zip(*corners)
+        entry = dict(filepath=filepath, bbox=[min(xs), min(ys), max(xs), max(ys)],
+                     width=width, height=height, bandcount=bandcount, crs=crs,
+                     nodata_value=info.get("nodata_value"))
+        id = next(self._id_generator)
+        self.entries[id] = entry
+        self.spindex.insert(id, entry["bbox"])
+        return entry
+
+    def save(self, indexpath):
+        """
+        Persist the catalog as an on-disk R-tree (indexpath.dat/.idx) plus
+        the file entries (indexpath.json), so it doesn't have to be rescanned.
+        """
+        stream = ((id, entry["bbox"], None) for id, entry in self.entries.iteritems())
+        disk_index = rtree.index.Index(indexpath, stream, overwrite=True)
+        disk_index.close()
+        with open(indexpath + ".json", "w") as writer:
+            json.dump([[id, entry] for id, entry in self.entries.iteritems()], writer)
+
+    def load(self, indexpath):
+        with open(indexpath + ".json") as reader:
+            self.entries = OrderedDict((id, entry) for id, entry in json.load(reader))
+        self.spindex = rtree.index.Index(indexpath)
+        # continue numbering after the stored ids
+        self._id_generator = itertools.count(max(self.entries) + 1 if self.entries else 0)
+
+    def query(self, bbox):
+        """The entries whose bbox overlaps the given bbox, in catalog order."""
+        xs = bbox[0], bbox[2]
+        ys = bbox[1], bbox[3]
+        bbox = [min(xs), min(ys), max(xs), max(ys)]
+        return [self.entries[id] for id in sorted(self.spindex.intersection(bbox))]
+
+    def get_raster(self, filepath):
+        """Open a raster through the pool of recently used rasters."""
+        raster = self._open.pop(filepath, None)
+        if raster is None:
+            raster = data.RasterData(filepath)
+            while len(self._open) >= self.max_open:
+                self._open.popitem(last=False)
+        self._open[filepath] = raster
+        return raster
+
+    def mosaic(self, coordspace_bbox, width, height, resample="nearest", nodata_value=None, workers=None):
+        """
+        Render a width x height view of the given (xleft, ytop, xright, ybottom)
+        bbox from the intersecting files only, later files drawn over earlier
+        ones where they have data. Cells without data get nodata_value, by
+        default that of the first file that has one. Returns the mosaic raster
+        and its mask, like RasterData.positioned.
+        """
+        entries = self.query(coordspace_bbox)
+        bandcount = entries[0]["bandcount"] if entries else 1
+        crs = entries[0]["crs"] if entries else "+proj=longlat +ellps=WGS84 +datum=WGS84 +no_defs"
+        if nodata_value is None:
+            # indexes saved before nodata was recorded don't have it
+            nodatas = [entry.get("nodata_value") for entry in entries]
+            nodata_value = next((nodata for nodata in nodatas if nodata is not None), 0)
+
+        xleft, ytop, xright, ybottom = coordspace_bbox
+        xres = (xright - xleft) / float(width)
+        yres = (ybottom - ytop) / float(height)
+        mosaic = data.RasterData(width=width, height=height, bands=bandcount, crs=crs,
+                                 nodata_value=nodata_value, transform_coeffs=[xres, 0, xleft, 0, yres, ytop])
+        mask = PIL.Image.new("1", (width, height), 0)
+        for entry in entries:
+            raster = self.get_raster(entry["filepath"])
+            view, viewmask = raster.positioned(width, height, coordspace_bbox,
+                                               resample=resample, workers=workers)
+            for band, viewband in zip(mosaic.bands, view.bands):
+                if band.img.mode != viewband.img.mode:
+                    band.img = band.img.convert(viewband.img.mode)
+                band.img.paste(viewband.img, (0, 0), viewmask)
+                band.cells = band.img.load()
+            mask.paste(1, (0, 0), viewmask)
+        mosaic._cached_mask = mask
+        return mosaic, mask
@@ -3,8 +3,60 @@ import operator
 import os
 import sys
 
-import PIL.Image
-import PIL.ImageMath
+import numpy
+
+from . import cache
+from . import focal
+from . import loader
+from . import polygonize
+from . import rasterize
+from . import saver
+from .. import instrument
+from .. import parallel
+from ..drivers import lazy_import
+from ..vector.data import VectorData
+
+PIL = lazy_import("PIL")
+
+
+def resampling_method(name):
+    """Translate a resampling name into the matching PIL filter constant."""
+    methods = {
+        "nearest": PIL.Image.NEAREST,
+        "bilinear": PIL.Image.BILINEAR,
+        "bicubic": PIL.Image.BICUBIC,
+        # box filter averages all contributing cells, older PIL only has antialias
+        "average": getattr(PIL.Image, "BOX", None) or PIL.Image.ANTIALIAS,
+        }
+    if name not in methods:
+        raise Exception("Resampling method must be one of: %s" % ", ".join(sorted(methods)))
+    return methods[name]
+
+
+def transform_from_info(info):
+    """The affine coeffs a,b,c,d,e,f from either the transform coeffs or tiepoint info."""
+    if info.get('transform_coeffs', None):
+        [xscale, xskew, xoffset, yscale, yskew, yoffset] = info['transform_coeffs']
+    else:
+        # the tiepoint ties a cell position to a geographic position
+        xcell, ycell = info['xy_cell']
+        xgeo, ygeo = info['xy_geo']
+        # note that in this coeff order the y cell size sits in the e (yskew) slot
+        xscale, yskew = info['cellwidth'], info['cellheight']
+        xoffset, yoffset = xgeo - xcell*xscale, ygeo - ycell*yskew
+        xskew, yscale = 0, 0
+    return [xscale, xskew, xoffset, yscale, yskew, yoffset]
+
+
+def ID_generator():
+    i = 0
+    while True:
+        yield i
+        i += 1
+
+
+# unique raster ids, so the shared render cache can tell rasters apart
+_raster_ids = ID_generator()
 
 
 class Cell(object):
@@ -54,13 +106,42 @@ class Band(object):
         cells = img.load()
         return Band(img, cells)
 
+    def to_array(self, nodata=None):
+        """Get the cell values as a 2D float array, with nodata cells as nan."""
+        array = numpy.asarray(self.img, dtype=numpy.float64)
+        if nodata is not None:
+            array = numpy.where(array == nodata, numpy.nan, array)
+        return array
+
+    @classmethod
+    def from_array(cls, array, nodata=None):
+        """Create a float band from a 2D array, writing nan cells as nodata."""
+        array = numpy.asarray(array, dtype=numpy.float32)
+        if nodata is not None:
+            array = numpy.where(numpy.isnan(array), nodata, array).astype(numpy.float32)
+        img = PIL.Image.fromarray(array, "F")
+        return cls(img, img.load())
+
+    def focal(self, operation, size=3, kernel=None, nodata=None, cellsize=(1.0, 1.0),
+              workers=None, **params):
+        """
+        Neighbourhood operation over the band, returning a new float band.
+        See focal.focal for the available operations and parameters.
+        """
+        array = self.to_array(nodata)
+        result = focal.focal(array, operation, size=size, kernel=kernel,
+                             cellsize=cellsize, workers=workers, **params)
+        return Band.from_array(result, nodata)
+
 
 class RasterData(object):
     def __init__(self, filepath=None, data=None, image=None, **kwargs):
         self.filepath = filepath
 
         if filepath:
-            info, bands, crs = loader.from_file(filepath)
+            with instrument.stage("raster.loader.read", nbytes=os.path.getsize(filepath)) as stage:
+                info, bands, crs = loader.from_file(filepath)
+                stage.add(items=sum(img.size[0] * img.size[1] for img, cells in bands))
         elif data:
             info, bands, crs = loader.from_lists(data, **kwargs)
         elif image:
@@ -72,6 +153,16 @@ class RasterData(object):
         self.info = info
         self.crs = crs
 
+        # the version is bumped whenever cell values change, which retires cached renders
+        self.uid = next(_raster_ids)
+        self.version = 0
+
+        # overview levels keyed by reduction factor, eg {2: [Band, ...], 4: [...]}
+        self.overviews = dict()
+        if filepath:
+            for factor, ovbands in loader.overviews_from_file(filepath):
+                self.overviews[factor] = [Band(img, cells) for img, cells in ovbands]
+
         self.update_geotransform()
     
     def __iter__(self):
@@ -89,9 +180,73 @@ class RasterData(object):
     def copy(self):
         new = RasterData(height=self.height, width=self.width, **self.info)
         new.bands = [band.copy() for band in self.bands]
-        new._cached_mask = self._cached_mask
+        new.overviews = dict(self.overviews)
+        if hasattr(self, "_cached_mask"):
+            new._cached_mask = self._cached_mask
+        return new
+
+    def focal(self, operation, size=3, kernel=None, workers=None, **params):
+        """
+        Neighbourhood operation (mean, min, max, sum, std, kernel, slope,
+        aspect or hillshade) over every band, returned as a new raster.
+        Nodata cells are ignored and terrain derivatives use the cell size.
+        """
+        # cell width and height are the a and e affine coefficients
+        a, b, c, d, e, f = self.transform_coeffs
+        cellsize = (a, e)
+        nodata = self.info.get("nodata_value")
+        new = RasterData(width=self.width, height=self.height, bands=0, crs=self.crs, **self.info)
+        new.bands = [band.focal(operation, size=size, kernel=kernel, nodata=nodata,
+                                cellsize=cellsize, workers=workers, **params)
+                     for band in self.bands]
         return new
 
+    def rasterize(self, vector_data, value_field=None, value=1, band=0, all_touched=False,
+                  workers=None):
+        """
+        Burn the features of a VectorData into one of the bands, using each
+        feature's value_field attribute or else the fixed value. Polygons
+        burn the cells whose centres they contain (or every cell they touch
+        with all_touched), lines the cells along them and points their cell.
+        """
+        target = self.bands[band]
+        array = numpy.array(target.img)
+        shapes = [(feat.geometry, feat.bbox, feat[value_field] if value_field else value)
+                  for feat in vector_data]
+        rasterize.burn(array, shapes, self.inv_transform_coeffs, all_touched=all_touched,
+                       workers=workers)
+        target.img = PIL.Image.fromarray(array)
+        target.cells = target.img.load()
+        self.invalidate()
+
+    def polygonize(self, band=0, connectivity=4, tilesize=1024, workers=None):
+        """
+        Trace connected regions of equal cell value into polygons (with
+        holes), returned as a VectorData with a value field. Masked cells
+        are left out. Regions are labeled tile by tile on a process pool
+        and merged where they continue across tile edges.
+        """
+        values = numpy.asarray(self.bands[band].img)
+        valid = numpy.asarray(self.mask, dtype=bool)
+        vector_data = VectorData(feature_type="Polygon")
+        vector_data.fields = ["value"]
+        vector_data.crs = self.crs
+        for value, polygons in polygonize.polygonize(values, valid, connectivity, tilesize, workers):
+            coordinates = []
+            for rings in polygons:
+                georings = []
+                for ring in rings:
+                    columns, rows = numpy.array(ring, dtype=numpy.float64).T
+                    xs, ys = self.cell_to_geo(columns, rows)
+                    georings.append(zip(xs.tolist(), ys.tolist()))
+                coordinates.append(georings)
+            if len(coordinates) == 1:
+                geometry = {"type": "Polygon", "coordinates": coordinates[0]}
+            else:
+                geometry = {"type": "MultiPolygon", "coordinates": coordinates}
+            vector_data.add_feature([value.item()], geometry)
+        return vector_data
+
     def cell_to_geo(self, column, row):
         [xscale, xskew, xoffset, yscale, yskew, yoffset] = self.transform_coeffs
         x, y = column, row
@@ -100,14 +255,119 @@ class RasterData(object):
         return x_coord, y_coord
 
     def geo_to_cell(self, x, y, fraction=False):
+        """x and y may also be numpy arrays, to convert many coordinates at once."""
         [xscale, xskew, xoffset, yscale, yskew, yoffset] = self.inv_transform_coeffs
         column = x*xscale + y*xskew + xoffset
-        row = x*yskew + y*yscale + yoffset
+        row = x*yscale + y*yskew + yoffset
         if not fraction:
             # round to nearest cell
-            column, row = int(round(column)), int(round(row))
+            if isinstance(column, numpy.ndarray):
+                column, row = numpy.round(column).astype(int), numpy.round(row).astype(int)
+            else:
+                column, row = int(round(column)), int(round(row))
         return column, row
 
+    def sample(self, xs, ys=None, bands=None, method="nearest"):
+        """
+        Read the cell values at many points at once. Takes arrays of x and
+        y coordinates, or a point VectorData in place of xs. Values can be
+        read from the nearest cell or bilinearly interpolated between the
+        four surrounding cell centres. Points outside the raster or on
+        masked cells, and features that aren't points, come out as nan.
+        Returns a float array of values per point, or one row per band if
+        bands is a list or None (all bands).
+        """
+        if ys is None:
+            # point vector data, other geometries are kept in place as nan
+            geometries = [feat.geometry for feat in xs]
+            ispoint = numpy.array([bool(geom) and geom["type"] == "Point" for geom in geometries], dtype=bool)
+            coords = [geom["coordinates"] for geom, point in zip(geometries, ispoint) if point]
+            xs, ys = zip(*coords) if coords else ([], [])
+            pointvalues = self.sample(xs, ys, bands, method)
+            values = numpy.full(pointvalues.shape[:-1] + (len(geometries),), numpy.nan)
+            values[..., ispoint] = pointvalues
+            return values
+        xs = numpy.asarray(xs, dtype=numpy.float64)
+        ys = numpy.asarray(ys, dtype=numpy.float64)
+        columns, rows = self.geo_to_cell(xs, ys, fraction=True)
+
+        single = isinstance(bands, int)
+        if bands is None:
+            bands = range(len(self.bands))
+        elif single:
+            bands = [bands]
+        values = numpy.full((len(bands), len(xs)), numpy.nan)
+
+        # the band values in their own type, read once and shared with the validity check
+        arrays = [None] * len(self.bands)
+
+        def band_array(index):
+            if arrays[index] is None:
+                arrays[index] = numpy.asarray(self.bands[index].img)
+            return arrays[index]
+
+        # an existing mask is used as is, otherwise nodata is only checked at the sampled cells
+        mask = numpy.asarray(self._cached_mask, dtype=bool) if hasattr(self, "_cached_mask") else None
+
+        def valid(cellrows, cellcols):
+            if mask is not None:
+                return mask[cellrows, cellcols]
+            nodata = self.info.get("nodata_value")
+            if nodata is None:
+                return numpy.ones(len(cellrows), dtype=bool)
+            # the same rules as the mask, float and int cells need data in any band, others in all
+            hasdata = [band_array(index)[cellrows, cellcols] != nodata for index in xrange(len(self.bands))]
+            if self.bands[0].img.mode in ("F", "I"):
+                return numpy.logical_or.reduce(hasdata)
+            return numpy.logical_and.reduce(hasdata)
+
+        if method == "nearest":
+            cellcols = numpy.floor(columns).astype(numpy.int64)
+            cellrows = numpy.floor(rows).astype(numpy.int64)
+            inside = ((cellcols >= 0) & (cellcols < self.width) &
+                      (cellrows >= 0) & (cellrows < self.height))
+            cellcols, cellrows = cellcols[inside], cellrows[inside]
+            usable = valid(cellrows, cellcols)
+            for i, band in enumerate(bands):
+                bandvalues = band_array(band)[cellrows, cellcols].astype(numpy.float64)
+                bandvalues[~usable] = numpy.nan
+                values[i, inside] = bandvalues
+
+        elif method == "bilinear":
+            # offsets from the cell centre up and left of each point
+            fcols, frows = columns - 0.5, rows - 0.5
+            col0 = numpy.floor(fcols).astype(numpy.int64)
+            row0 = numpy.floor(frows).astype(numpy.int64)
+            dx, dy = fcols - col0, frows - row0
+            inside = (columns >= 0) & (columns < self.width) & (rows >= 0) & (rows < self.height)
+            corners = [(0, 0, (1 - dx) * (1 - dy)), (1, 0, dx * (1 - dy)),
+                       (0, 1, (1 - dx) * dy), (1, 1, dx * dy)]
+            neighbours = []
+            for coloffset, rowoffset, weight in corners:
+                cellcols = numpy.clip(col0 + coloffset, 0, self.width - 1)
+                cellrows = numpy.clip(row0 + rowoffset, 0, self.height - 1)
+                # edge cells and masked neighbours drop out of the weighting
+                usable = valid(cellrows, cellcols) & inside & (weight > 0)
+                neighbours.append((cellcols, cellrows, weight, usable))
+            for i, band in enumerate(bands):
+                array = band_array(band)
+                total = numpy.zeros(len(xs))
+                weights = numpy.zeros(len(xs))
+                for cellcols, cellrows, weight, usable in neighbours:
+                    total += numpy.where(usable, array[cellrows, cellcols] * weight, 0)
+                    weights += numpy.where(usable, weight, 0)
+                with numpy.errstate(invalid="ignore", divide="ignore"):
+                    values[i] = numpy.where(weights > 0, total / weights, numpy.nan)
+            # a point on a masked cell stays masked even if its neighbours are valid
+            cellcols = numpy.clip(numpy.floor(columns).astype(numpy.int64), 0, self.width - 1)
+            cellrows = numpy.clip(numpy.floor(rows).astype(numpy.int64), 0, self.height - 1)
+            values[:, ~(inside & valid(cellrows, cellcols))] = numpy.nan
+
+        else:
+            raise Exception("Sampling method must be either nearest or bilinear")
+
+        return values[0] if single else values
+
     @property
     def bbox(self):
         x_left_coord, y_top_coord = self.cell_to_geo(0, 0)
@@ -115,18 +375,8 @@ class RasterData(object):
         return [x_left_coord, y_top_coord, x_right_coord, y_bottom_coord]
 
     def update_geotransform(self):
-        info = self.info
-
         # Get the cooefs needed to convert from raster to geographic space
-        if info.get('transform_coeffs', None):
-            [xscale, xskew, xoffset, yscale, yskew, yoffset] = info['transform_coeffs']
-        else:
-            xcell, ycell = info['xy_cell']
-            xgeo, ygeo = info['xy_geo']
-            xoffset, yoffset = xgeo - xcell, ygeo - ycell
-            xscale, yscale = info['cellwidth'], info['cellheight']
-            xskew, yskew = 0, 0
-        self.transform_coeffs = [xscale, xskew, xoffset, yscale, yskew, yoffset]
+        self.transform_coeffs = transform_from_info(self.info)
 
         # Get the cooefs needed to convert from geographic space to rater
         # Sean Gilles affine.py : https://github.com/sgillies/affine
@@ -138,12 +388,166 @@ class RasterData(object):
             rb = -b * idet
             rd = -d * idet
             re = a * idet
-            a,b,c,d,e,f = (ra, rb, -c*ra - f*rb, rd, re, -c*rd, f*re)
+            a,b,c,d,e,f = (ra, rb, -c*ra - f*rb, rd, re, -c*rd - f*re)
             self.inv_transform_coeffs = a,b,c,d,e,f
         else:
             raise Exception("Error with the transform matrix")
 
-    def positioned(self, width, height, coordspace_bbox):
+    def build_overviews(self, factors=(2, 4, 8, 16), resample="nearest", workers=None):
+        """
+        Build reduced resolution copies of each band, one level per factor,
+        so that zoomed out views can be rendered from a small image.
+        Levels and bands are resized concurrently on a thread pool.
+        Note that resampling methods other than nearest will blend nodata
+        values into neighbouring cells along data edges.
+        """
+        method = resampling_method(resample)
+        factors = sorted(set(int(factor) for factor in factors if factor > 1))
+
+        def resize(job):
+            factor, band = job
+            size = (max(1, -(-self.width // factor)), max(1, -(-self.height // factor)))
+            img = band.img.resize(size, method)
+            return Band(img, img.load())
+
+        jobs = [(factor, band) for factor in factors for band in self.bands]
+        results = parallel.map_threads(resize, jobs, workers)
+
+        self.overviews = dict()
+        for (factor, band), result in itertools.izip(jobs, results):
+            self.overviews.setdefault(factor, []).append(result)
+        self._cached_overview_masks = dict()
+        # renders may now come from different levels
+        self.version += 1
+
+    def invalidate(self):
+        """
+        Call after editing cell values in place, so that the cached mask
+        and any cached renders of the old values are no longer used.
+        Overviews are not rebuilt automatically.
+        """
+        self.version += 1
+        if hasattr(self, "_cached_mask"):
+            del self._cached_mask
+        self._cached_overview_masks = dict()
+
+    def save_overviews(self, filepath=None):
+        """Store the overview levels in a sidecar .ovr file next to the raster."""
+        filepath = filepath or self.filepath
+        if not filepath:
+            raise Exception("Need a filepath to store the overviews next to")
+        saver.overviews_to_file(self.overviews, filepath)
+
+    def overview_mask(self, factor):
+        """The nodata mask reduced to the size of the given overview level."""
+        if not hasattr(self, "_cached_overview_masks"):
+            self._cached_overview_masks = dict()
+        if factor not in self._cached_overview_masks:
+            size = self.overviews[factor][0].img.size
+            self._cached_overview_masks[factor] = self.mask.resize(size, PIL.Image.NEAREST)
+        return self._cached_overview_masks[factor]
+
+    def select_overview(self, source_cells_per_pixel):
+        """
+        Get the coarsest overview factor whose cells are still no larger than
+        the requested view pixels, or None if full resolution is needed.
+        """
+        best = None
+        for factor in sorted(self.overviews):
+            if factor <= source_cells_per_pixel:
+                best = factor
+        return best
+
+    def positioned(self, width, height, coordspace_bbox, resample="nearest",
+                   tiled=False, tilesize=256, cache=cache.render_cache, workers=None):
+        """
+        Render the raster into a new width x height raster covering the
+        given view bbox, returning the new raster and its nodata mask.
+        Renders are kept in the given cache (pass None to disable it).
+        With tiled=True the view is assembled from tiles aligned to a fixed
+        grid at the view resolution, so panning only renders the new tiles,
+        and the view is snapped to the nearest whole cell of that grid.
+        Bands, or tiles in tiled mode, are transformed on a thread pool of
+        the given number of workers (see parallel.set_workers).
+        """
+        xleft, ytop, xright, ybottom = coordspace_bbox
+        xres = (xright - xleft) / float(width)
+        yres = (ybottom - ytop) / float(height)
+        transform_coeffs = [xres, 0, xleft, 0, yres, ytop]
+        with instrument.stage("raster.positioned", items=width * height):
+            if tiled:
+                band_imgs, mask_trans, transform_coeffs = self._render_tiled(
+                    width, height, coordspace_bbox, resample, tilesize, cache, workers)
+            else:
+                band_imgs, mask_trans = self._render_cached(
+                    width, height, coordspace_bbox, resample, cache, workers)
+                if cache is not None:
+                    # hand out copies so edits to the view don't leak into the cache
+                    band_imgs = [img.copy() for img in band_imgs]
+                    mask_trans = mask_trans.copy()
+
+        # Create the view raster directly from the rendered images
+        new_raster = RasterData(width=width, height=height, bands=0, crs=self.crs,
+                                nodata_value=self.info.get("nodata_value"),
+                                cell_anchor=self.info.get("cell_anchor", "center"),
+                                transform_coeffs=transform_coeffs)
+        new_raster.bands = [Band(img, img.load()) for img in band_imgs]
+        new_raster._cached_mask = mask_trans
+
+        return new_raster, mask_trans
+
+    def _render_cached(self, width, height, coordspace_bbox, resample, cache, workers=None):
+        if cache is None:
+            return self._render(width, height, coordspace_bbox, resample, workers)
+        key = (self.uid, self.version, (width, height), tuple(coordspace_bbox), resample)
+        rendered = cache.get(key)
+        if rendered is None:
+            rendered = self._render(width, height, coordspace_bbox, resample, workers)
+            cache.put(key, rendered)
+        return rendered
+
+    def _render_tiled(self, width, height, coordspace_bbox, resample, tilesize, cache, workers=None):
+        """
+        Render the view from tiles of a grid anchored at the raster's own
+        top left corner, returning the band images, the mask and the
+        transform of the view snapped onto that grid.
+        """
+        xleft, ytop, xright, ybottom = coordspace_bbox
+        # snap the view resolution so that panned views share the same tile grid
+        xres = float("%.9g" % ((xright - xleft) / float(width)))
+        yres = float("%.9g" % ((ybottom - ytop) / float(height)))
+        # view origin in whole grid pixels from the anchor
+        xanchor, yanchor = self.transform_coeffs[2], self.transform_coeffs[5]
+        xorig = int(round((xleft - xanchor) / xres))
+        yorig = int(round((ytop - yanchor) / yres))
+
+        tiles = [(tilecol, tilerow)
+                 for tilerow in xrange(yorig // tilesize, (yorig + height - 1) // tilesize + 1)
+                 for tilecol in xrange(xorig // tilesize, (xorig + width - 1) // tilesize + 1)]
+
+        def render_tile(tile):
+            tilecol, tilerow = tile
+            tilebbox = (xanchor + tilecol * tilesize * xres, yanchor + tilerow * tilesize * yres,
+                        xanchor + (tilecol + 1) * tilesize * xres, yanchor + (tilerow + 1) * tilesize * yres)
+            # tiles already run in parallel, so render each tile's bands serially
+            return self._render_cached(tilesize, tilesize, tilebbox, resample, cache, workers=1)
+
+        # build the lazily cached mask once, rather than in every tile thread
+        self.mask
+        rendered = parallel.map_threads(render_tile, tiles, workers)
+
+        band_imgs = [PIL.Image.new(band.img.mode, (width, height)) for band in self.bands]
+        mask_trans = PIL.Image.new("1", (width, height), 0)
+        for (tilecol, tilerow), (tile_imgs, tile_mask) in itertools.izip(tiles, rendered):
+            offset = (tilecol * tilesize - xorig, tilerow * tilesize - yorig)
+            for img, tile_img in itertools.izip(band_imgs, tile_imgs):
+                img.paste(tile_img, offset)
+            mask_trans.paste(tile_mask, offset)
+        # the view raster uses the same origin the tiles were snapped to
+        transform_coeffs = [xres, 0, xanchor + xorig * xres, 0, yres, yanchor + yorig * yres]
+        return band_imgs, mask_trans, transform_coeffs
+
+    def _render(self, width, height, coordspace_bbox, resample="nearest", workers=None):
         # Get coords of view corners
         xleft, ytop, xright, ybottom = coordspace_bbox
         view_corners = [
@@ -152,62 +556,89 @@ class RasterData(object):
         # Get pixel location of view corners
         view_corner_pixels = [self.geo_to_cell(*point, fraction=True) for point in view_corners]
 
+        # Pick the coarsest overview level that still resolves the view pixels
+        (tlx, tly), (blx, bly), _, (trx, try_) = view_corner_pixels
+        xspan = ((trx - tlx)**2 + (try_ - tly)**2) ** 0.5 / float(width)
+        yspan = ((blx - tlx)**2 + (bly - tly)**2) ** 0.5 / float(height)
+        factor = self.select_overview(min(xspan, yspan))
+        if factor:
+            source_bands = self.overviews[factor]
+            mask = self.overview_mask(factor)
+            # rescale corner pixels to the overview grid
+            xratio = source_bands[0].img.size[0] / float(self.width)
+            yratio = source_bands[0].img.size[1] / float(self.height)
+            view_corner_pixels = [(x*xratio, y*yratio) for x, y in view_corner_pixels]
+        else:
+            source_bands = self.bands
+            mask = self.mask
+
         flattened = [xory for point in view_corner_pixels for xory in point]
-        new_raster = self.copy()
+        method = resampling_method(resample)
 
-        mask = self.mask
+        # PIL releases the GIL while transforming, so the mask and
+        # every band can be transformed at the same time
+        jobs = [(mask, PIL.Image.NEAREST)] + [(source.img, method) for source in source_bands]
 
-        mask_trans = mask.transform(
-            (width, height), PIL.Image.QUAD, flattened, resample=PIL.Image.NEAREST
-            )
+        def transform(job):
+            img, jobmethod = job
+            return img.transform((width, height), PIL.Image.QUAD, flattened, resample=jobmethod)
 
-        for band in new_raster.bands:
-            data_trans = band.img.transform(
-                (width, height), PIL.Image.QUAD, flattened, resample=PIL.Image.NEAREST)
-                )
-        
+        with instrument.stage("raster.transform", items=width * height * len(jobs)) as stage:
+            transformed = parallel.map_threads(transform, jobs, workers)
+            stage.add(nbytes=sum(cache.image_bytes(img) for img in transformed))
+        mask_trans, data_transformed = transformed[0], transformed[1:]
+
+        band_imgs = []
+        for data_trans in data_transformed:
+            # Only keep the data where the mask is valid
             trans = PIL.Image.new(data_trans.mode, data_trans.size)
-            trans.paste(datatrans, (0,0), mask_trans)
-            # Store image and cells
-            band.img = trans
-            band.cells = band.img.load()
+            trans.paste(data_trans, (0,0), mask_trans)
+            band_imgs.append(trans)
 
-        return new_raster, mask_trans
+        return band_imgs, mask_trans
 
     @property
     def mask(self):
         if hasattr(self, "_cached_mask"):
             return self._cached_mask
         else:
-            nodata = self.info.get("nodata_value")
-            if nodata != None:
-                # mask out the nodata
-                if self.bands[0].img.mode in ("F", "I"):
-                    # if 32bit float or int values, need to chech each one
-                    mask = PIL.Image.new("1", (self.width, self.height), 1)
-                    px = mask.load()
-                    for col in xrange(self.width):
-                        for row in xrange(self.height):
-                            value = (band.cells[col, row] for band in self.bands)
-                            # mask if all bands have no data
-                            if all((val == nodata for val in value)):
-                                px[col, row] = 0
+            with instrument.stage("raster.mask", items=self.width * self.height):
+                nodata = self.info.get("nodata_value")
+                if nodata != None:
+                    # mask out the nodata
+                    if self.bands[0].img.mode in ("F", "I"):
+                        # if 32bit float or int values, need to chech each one
+                        mask = PIL.Image.new("1", (self.width, self.height), 1)
+                        px = mask.load()
+                        for col in xrange(self.width):
+                            for row in xrange(self.height):
+                                value = (band.cells[col, row] for band in self.bands)
+                                # mask if all bands have no data
+                                if all((val == nodata for val in value)):
+                                    px[col, row] = 0
+                    else:
+                        # Use the faster point method
+                        masks = []
+                        for band in self.bands:
+                            mask = band.img.point(lambda px: 1 if px != nodata else 0, "1")
+                            masks.append(mask)
+                        # Mask out where all bands have nodata value
+                        masks_namedict = dict([("mask%i"%i, mask) for i, mask in enumerate(masks)])   
+                        expr = " & ".join(masks_namedict.keys())
+                        mask = PIL.ImageMath.eval(expr, **masks_namedict).convert("1")
                 else:
-                    # Use the faster point method
-                    masks = []
-                    for band in self.bands:
-                        mask = band.img.point(lambda px: 1 if px != nodata else 0, "1")
-                        masks.append(mask)
-                    # Mask out where all bands have nodata value
-                    masks_namedict = dict(["mask%i"%i, mask) for i, mask in enumerate(masks)])   
-                    expr = " & ".join(masks_namedict.keys())
-                    mask = PIL.ImageMath.eval(expr, **masks_namedict).convert("1")
-            else:
-                # Even if no nodata, need to create mask to prevent infininte outside border after geotransform
-                nodata = 0
-                mask = PIL.Image.new("1", self.bands[0].img.size, 1)
+                    # Even if no nodata, need to create mask to prevent infininte outside border after geotransform
+                    nodata = 0
+                    mask = PIL.Image.new("1", self.bands[0].img.size, 1)
             self._cached_mask = mask
             return self._cached_mask
 
-    def save(self, filepath):
-        saver.to_file(self.bands, self.info, filepath)
\ No newline at end of file
+    def save(self, filepath, overviews=False, tiled=False, **options):
+        """
+        Save the raster, optionally embedding the overview levels (geotiff only).
+        With tiled=True geotiffs are streamed tile by tile, taking the tilesize,
+        compression, bigtiff and workers options of saver.to_tiled_geotiff.
+        """
+        saver.to_file(self.bands, self.info, filepath,
+                      overviews=self.overviews if overviews else None,
+                      tiled=tiled, **options)
\ No newline at end of file
@@ -0,0 +1,16 @@
+from .. import drivers
+
+
+# the raster formats, their backends are imported on first use
+# the built in readers load whole files, so none are streaming or windowed
+registry = drivers.Registry(__name__.rpartition(".")[0])
+
+registry.register("ascii", (".asc", ".ascii"),
+                  read=".loader:from_ascii", write=".saver:to_ascii",
+                  metadata=".loader:ascii_metadata")
+registry.register("geotiff", (".tif", ".tiff", ".geotiff"),
+                  read=".loader:from_geotiff", write=".saver:to_geotiff",
+                  metadata=".loader:geotiff_metadata")
+registry.register("image", (".jpg", ".jpeg", ".png", ".bmp", ".gif"),
+                  read=".loader:from_image_file", write=".saver:to_image_file",
+                  metadata=".loader:image_metadata")
@@ -0,0 +1,178 @@
+# import internals
+import math
+
+# import numpy for the vectorized neighbourhood math
+import numpy
+
+from .. import parallel
+
+
+STATISTICS = ("mean", "min", "max", "sum", "std", "kernel")
+TERRAIN = ("slope", "aspect", "hillshade")
+
+
+def tile_windows(height, width, tilesize):
+    """Yields (rowstart, rowend, colstart, colend) for each tile of the grid."""
+    for rowstart in xrange(0, height, tilesize):
+        for colstart in xrange(0, width, tilesize):
+            yield (rowstart, min(rowstart + tilesize, height),
+                   colstart, min(colstart + tilesize, width))
+
+
+def neighbourhood(padded, size):
+    """
+    Yields (rowoffset, coloffset, view) for every cell position in a size x size
+    window, where view is the padded array shifted so that each output cell
+    lines up with that neighbour. The halo is size // 2 cells on every side.
+    """
+    height = padded.shape[0] - size + 1
+    width = padded.shape[1] - size + 1
+    for rowoffset in xrange(size):
+        for coloffset in xrange(size):
+            yield rowoffset, coloffset, padded[rowoffset:rowoffset+height, coloffset:coloffset+width]
+
+
+def focal_statistic(padded, operation, size=3, kernel=None):
+    """
+    Neighbourhood statistic over a nan padded array, ignoring nan cells.
+    Cells whose neighbourhood has no valid values come out as nan.
+    """
+    halo = size // 2
+    centre = padded[halo:padded.shape[0]-halo, halo:padded.shape[1]-halo]
+    total = numpy.zeros(centre.shape)
+    count = numpy.zeros(centre.shape)
+    if operation == "std":
+        squares = numpy.zeros(centre.shape)
+    elif operation == "min":
+        result = numpy.full(centre.shape, numpy.nan)
+    elif operation == "max":
+        result = numpy.full(centre.shape, numpy.nan)
+
+    for rowoffset, coloffset, view in neighbourhood(padded, size):
+        valid = ~numpy.isnan(view)
+        values = numpy.where(valid, view, 0)
+        if operation == "kernel":
+            weight = kernel[rowoffset, coloffset]
+            total += values * weight
+        else:
+            total += values
+        count += valid
+        if operation == "std":
+            squares += values ** 2
+        elif operation == "min":
+            result = numpy.fmin(result, view)
+        elif operation == "max":
+            result = numpy.fmax(result, view)
+
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        if operation == "mean":
+            result = total / count
+        elif operation in ("sum", "kernel"):
+            result = numpy.where(count > 0, total, numpy.nan)
+        elif operation == "std":
+            mean = total / count
+            result = numpy.sqrt(numpy.maximum(squares / count - mean ** 2, 0))
+    return result
+
+
+def horn_gradients(padded, cellwidth, cellheight, zfactor=1.0):
+    """
+    Horn's 3x3 estimate of the east-west and north-south surface gradients.
+    Missing neighbours take the value of the centre cell, so edges and
+    nodata borders still get a (flattened) estimate.
+    """
+    centre = padded[1:-1, 1:-1]
+    window = dict()
+    for rowoffset, coloffset, view in neighbourhood(padded, 3):
+        window[rowoffset, coloffset] = numpy.where(numpy.isnan(view), centre, view)
+    a, b, c = window[0, 0], window[0, 1], window[0, 2]
+    d, f = window[1, 0], window[1, 2]
+    g, h, i = window[2, 0], window[2, 1], window[2, 2]
+    dzdx = ((c + 2*f + i) - (a + 2*d + g)) / (8.0 * cellwidth) * zfactor
+    dzdy = ((g + 2*h + i) - (a + 2*b + c)) / (8.0 * cellheight) * zfactor
+    return dzdx, dzdy
+
+
+def focal_terrain(padded, operation, cellwidth, cellheight, zfactor=1.0,
+                  azimuth=315.0, altitude=45.0):
+    """Slope in degrees, aspect in compass degrees (-1 for flat) or hillshade 0-255."""
+    dzdx, dzdy = horn_gradients(padded, cellwidth, cellheight, zfactor)
+    slope = numpy.arctan(numpy.hypot(dzdx, dzdy))
+    if operation == "slope":
+        return numpy.degrees(slope)
+
+    # math angle of the downslope direction, counterclockwise from east
+    aspect = numpy.arctan2(dzdy, -dzdx)
+    if operation == "aspect":
+        # convert to compass degrees clockwise from north
+        compass = numpy.mod(90.0 - numpy.degrees(aspect), 360.0)
+        return numpy.where((dzdx == 0) & (dzdy == 0), -1.0, compass)
+
+    elif operation == "hillshade":
+        zenith = math.radians(90.0 - altitude)
+        sun = math.radians(numpy.mod(360.0 - azimuth + 90.0, 360.0))
+        shade = (math.cos(zenith) * numpy.cos(slope) +
+                 math.sin(zenith) * numpy.sin(slope) * numpy.cos(sun - aspect))
+        return numpy.clip(255.0 * shade, 0, 255)
+
+
+def _focal_tile(job):
+    # module level so it can be sent to worker processes
+    padded, operation, params = job
+    if operation in TERRAIN:
+        result = focal_terrain(padded, operation, **params)
+    else:
+        result = focal_statistic(padded, operation, **params)
+    # nodata cells stay nodata
+    halo = (padded.shape[0] - result.shape[0]) // 2
+    centre = padded[halo:padded.shape[0]-halo, halo:padded.shape[1]-halo]
+    result[numpy.isnan(centre)] = numpy.nan
+    return result
+
+
+def focal(array, operation, size=3, kernel=None, cellsize=(1.0, 1.0),
+          tilesize=512, workers=None, **params):
+    """
+    Run a neighbourhood operation over a 2D float array where nodata is nan.
+
+    Operations are the statistics mean, min, max, sum, std and kernel (a
+    weighted sum with the given size x size weights), and the 3x3 terrain
+    derivatives slope, aspect and hillshade, which take cellsize as
+    (cellwidth, cellheight) plus optional zfactor, azimuth and altitude.
+
+    The array is split into tiles that carry a halo of neighbouring cells,
+    and the tiles are processed on a pool of worker processes.
+    """
+    if operation == "kernel":
+        if kernel is None:
+            raise Exception("The kernel operation needs a kernel of weights")
+        kernel = numpy.asarray(kernel, dtype=numpy.float64)
+        size = kernel.shape[0]
+        if kernel.shape != (size, size):
+            raise Exception("The kernel must be a square array")
+    if operation in TERRAIN:
+        size = 3
+        params["cellwidth"], params["cellheight"] = [abs(float(c)) for c in cellsize]
+    elif operation in STATISTICS:
+        params["size"] = size
+        params["kernel"] = kernel
+    else:
+        raise Exception("Focal operation must be one of: %s" % ", ".join(STATISTICS + TERRAIN))
+    if size % 2 == 0:
+        raise Exception("The neighbourhood size must be an odd number")
+
+    # pad the edges with nan so border cells see missing neighbours
+    halo = size // 2
+    padded = numpy.pad(numpy.asarray(array, dtype=numpy.float64), halo,
+                       mode="constant", constant_values=numpy.nan)
+
+    height, width = array.shape
+    windows = list(tile_windows(height, width, tilesize))
+    jobs = [(padded[rowstart:rowend+2*halo, colstart:colend+2*halo], operation, params)
+            for rowstart, rowend, colstart, colend in windows]
+    results = parallel.map_processes(_focal_tile, jobs, workers)
+
+    output = numpy.empty((height, width))
+    for (rowstart, rowend, colstart, colend), result in zip(windows, results):
+        output[rowstart:rowend, colstart:colend] = result
+    return output
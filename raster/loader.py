@@ -1,258 +1,544 @@
 
 # import internals
 import sys, os, itertools, operator
+import struct
+import zlib
 
-# import PIL as the image loader
-import PIL.Image
+# import numpy for decoding float tiff tiles
+import numpy
 
+from . import drivers
+from ..drivers import lazy_import
 
-def from_file(filepath):
+# PIL is the image loader, imported on first use
+PIL = lazy_import("PIL")
 
-    def check_world_file(filepath):
-        worldfilepath = None
-        
-        # try to find worldfile
-        dir, filename_and_ext = os.path.split(filepath)
-        filename, extension = os.path.splitext(filename_and_ext)
-        dir_and_filename = os.path.join(dir, filename)
-        
-        # first check generic .wld extension
-        if os.path.lexists(dir_and_filename + ".wld"):
-            worldfilepath = dir_and_filename + ".wld"
-            
-        # if not, check filetype-specific world file extensions
+
+class NotGeoreferenced(Exception):
+    "raised when a file has no geotiff tags or world file to position it in space"
+    pass
+
+
+def check_world_file(filepath):
+    worldfilepath = None
+
+    # try to find worldfile
+    dir, filename_and_ext = os.path.split(filepath)
+    filename, extension = os.path.splitext(filename_and_ext)
+    dir_and_filename = os.path.join(dir, filename)
+
+    # first check generic .wld extension
+    if os.path.lexists(dir_and_filename + ".wld"):
+        worldfilepath = dir_and_filename + ".wld"
+
+    # if not, check filetype-specific world file extensions
+    else:
+        # get filetype-specific world file extension
+        extension = extension.lower().lstrip(".")
+        if extension in ("tif","tiff","geotiff"):
+            extension = ".tfw"
+        elif extension in ("jpg","jpeg"):
+            extension = ".jgw"
+        elif extension == "png":
+            extension = ".pgw"
+        elif extension == "bmp":
+            extension = ".bpw"
+        elif extension == "gif":
+            extension = ".gfw"
         else:
-            # get filetype-specific world file extension
-            if extension in ("tif","tiff","geotiff"):
-                extension = ".tfw"
-            elif extension in ("jpg","jpeg"):
-                extension = ".jgw"
-            elif extension == "png":
-                extension = ".pgw"
-            elif extension == "bmp":
-                extension = ".bpw"
-            elif extension == "gif":
-                extension = ".gfw"
-            else:
-                return None
-            # check if exists
-            if os.path.lexists(dir_and_filename + extension):
-                worldfilepath = dir_and_filename + extension
-
-        # then return contents if file found
-        if worldfilepath:
-            with open(worldfilepath) as worldfile:
-                # note that the params are arranged slightly differently
-                # ...in the world file from the usual affine a,b,c,d,e,f
-                # ...so remember to rearrange their sequence later
-                xscale, yskew,x skew, yscale,x off,y off = worldfile.read().split()
-            return [xscale,y skew,x skew,y scale,x off,y off]
-
-    if filepath.lower().endswith((".asc",".ascii")):
-        with open(filepath) as tempfile:
-            ### Step 1: check header for file info
-            info = dict()
-            def _nextheader(headername=None, force2length=True):
-                "returns a two-list of headername and headervalue"
-                nextline = False
-                while not nextline:
-                    nextline = tempfile.readline().strip()
-                nextline = nextline.split()
-                if force2length:
-                    if len(nextline) != 2:
-                        raise Exception("Each header line must contain exactly two elements")
-                if headername:
-                    if nextline[0].lower() != headername:
-                        raise Exception("The required headername was not found: %s instead of %s"%(nextline[0].lower(),headername))
-                return nextline
-            
-            # dimensions
-            cols = int(_nextheader(headername="ncols")[1])
-            rows = int(_nextheader(headername="nrows")[1])
-            
-            # x/y origin
-            _next = _nextheader()
-            if _next[0].lower() in ("xllcenter","xllcorner"):
-                xorig = float(_next[1])
-                xorigtype = _next[0].lower()
-            _next = _nextheader()
-            if _next[0].lower() in ("yllcenter","yllcorner"):
-                yorig = float(_next[1])
-                yorigtype = _next[0].lower()
-            info["xy_cell"] = (0, rows)
-            info["xy_geo"] = (xorig, yorig)
-            if "corner" in xorigtype and "corner" in yorigtype:
-                info["cell_anchor"] = "sw"
-            elif "corner" in xorigtype:
-                info["cell_anchor"] = "w"
-            elif "corner" in yorigtype:
-                info["cell_anchor"] = "s"
-            else:
-                info["cell_anchor"] = "center"
-            
-            # cellsize
-            cellsize = float(_nextheader(headername="cellsize")[1])
-            info["cellwidth"] = cellsize
-            info["cellheight"] = cellsize
-            
-            # nodata
-            prevline = tempfile.tell()
-            _next = _nextheader(force2length=False)
-            if _next[0].lower() == "nodata_value":
-                nodata = float(_next[1])
-            else:
-                # nodata header missing, so set to default and go back to previous header line
-                nodata = -9999.0
-                tempfile.seek(prevline)
+            return None
+        # check if exists
+        if os.path.lexists(dir_and_filename + extension):
+            worldfilepath = dir_and_filename + extension
+
+    # then return contents if file found
+    if worldfilepath:
+        with open(worldfilepath) as worldfile:
+            # note that the params are arranged slightly differently
+            # ...in the world file from the usual affine a,b,c,d,e,f
+            # ...so remember to rearrange their sequence later
+            xscale, yskew, xskew, yscale, xoff, yoff = map(float, worldfile.read().split())
+        return [xscale, yskew, xskew, yscale, xoff, yoff]
+
+
+def read_ascii_header(tempfile):
+    """Parse the header of an open esri ascii grid file, returning info, cols and rows."""
+    info = dict()
+    def _nextheader(headername=None, force2length=True):
+        "returns a two-list of headername and headervalue"
+        nextline = False
+        while not nextline:
+            nextline = tempfile.readline().strip()
+        nextline = nextline.split()
+        if force2length:
+            if len(nextline) != 2:
+                raise Exception("Each header line must contain exactly two elements")
+        if headername:
+            if nextline[0].lower() != headername:
+                raise Exception("The required headername was not found: %s instead of %s"%(nextline[0].lower(),headername))
+        return nextline
+
+    # dimensions
+    cols = int(_nextheader(headername="ncols")[1])
+    rows = int(_nextheader(headername="nrows")[1])
+
+    # x/y origin
+    _next = _nextheader()
+    if _next[0].lower() in ("xllcenter","xllcorner"):
+        xorig = float(_next[1])
+        xorigtype = _next[0].lower()
+    _next = _nextheader()
+    if _next[0].lower() in ("yllcenter","yllcorner"):
+        yorig = float(_next[1])
+        yorigtype = _next[0].lower()
+    info["xy_cell"] = (0, rows)
+    info["xy_geo"] = (xorig, yorig)
+    if "corner" in xorigtype and "corner" in yorigtype:
+        info["cell_anchor"] = "sw"
+    elif "corner" in xorigtype:
+        info["cell_anchor"] = "w"
+    elif "corner" in yorigtype:
+        info["cell_anchor"] = "s"
+    else:
+        info["cell_anchor"] = "center"
+
+    # cellsize
+    cellsize = float(_nextheader(headername="cellsize")[1])
+    info["cellwidth"] = cellsize
+    info["cellheight"] = cellsize
+
+    # nodata
+    prevline = tempfile.tell()
+    _next = _nextheader(force2length=False)
+    if _next[0].lower() == "nodata_value":
+        nodata = float(_next[1])
+    else:
+        # nodata header missing, so set to default and go back to previous header line
+        nodata = -9999.0
+        tempfile.seek(prevline)
+    info["nodata_value"] = nodata
+    return info, cols, rows
+
+
+def tiff_metadata(raw_tags):
+    "returns the georeferencing info in a dict of geotiff tags"
+    # check tag definitions here
+    info = dict()
+    if raw_tags.has_key(1025):
+        # GTRasterTypeGeoKey, aka midpoint pixels vs topleft area pixels
+        if raw_tags.get(1025) == (1,):
+            # is area
+            info["cell_anchor"] = "center"
+        elif raw_tags.get(1025) == (2,):
+            # is point
+            info["cell_anchor"] = "nw"
+    if raw_tags.has_key(34264):
+        # ModelTransformationTag, aka 4x4 transform coeffs...
+        (a,b,c,d,
+         e,f,g,h,
+         i,j,k,l,
+         m,n,o,p) = raw_tags.get(34264)
+        # But we don't want to meddle with 3-D transforms,
+        # ...so for now only get the 2-D affine parameters
+        xscale, xskew, xoff = a,b,d
+        yskew, yscale, yoff = e,f,h
+        info["transform_coeffs"] = xscale, xskew, xoff, yskew, yscale, yoff
+    else:
+        if raw_tags.has_key(33922):
+            # ModelTiepointTag
+            x, y, z, geo_x, geo_y, geo_z = raw_tags.get(33922)
+            info["xy_cell"] = x, y
+            info["xy_geo"] = geo_x, geo_y
+        if raw_tags.has_key(33550):
+            # ModelPixelScaleTag
+            scalex,scaley,scalez = raw_tags.get(33550)
+            info["cellwidth"] = scalex
+            # note: cellheight must be inversed because geotiff has a reversed y-axis (ie 0,0 is in upperleft corner)
+            info["cellheight"] = -scaley 
+    if raw_tags.get(42113):
+        nodata = parse_nodata(raw_tags.get(42113))
+        if nodata is not None:
             info["nodata_value"] = nodata
-            
-            ### Step 2: read data into lists
-            # make sure filereading is set to first data row (in case there are spaces or gaps in between header and data)
-            nextline = False
-            while not nextline:
-                prevline = tempfile.tell()
-                nextline = tempfile.readline().strip()
-            tempfile.seek(prevline)
-            # collect flat list of cells instead of rows (because according to the ASCII format, the rows in the grid could be but aren't necessarily organized into separate lines)
-            data = []
-            for line in tempfile.readlines():
-                data.extend(float(cell) for cell in line.split())
-            # reshape values to correspond with row lists, and flatten again
-            def grouper(iterable, n):
-                args = [iter(iterable)] * n
-                return itertools.izip(*args)
-            reshaped = itertools.izip(*grouper(data, cols))
-            data = [cell for row in reshaped for cell in row]
-
-            ### Step 3: Read worldfile geotransform
-            transform_coeffs = check_world_file(filepath)
-            if transform_coeffs:
-                # rearrange the world file param sequence to match affine transform
-                xscale,yskew,xskew,yscale,xoff,yoff = transform_coeffs
-                info["transform_coeffs"] = xscale,xskew,xoff,yskew,yscale,yoff
-            else:
-                raise Exception("Couldn't find the world file needed to position the image in space")
-
-            ### Step 4: Read coordinate ref system
-            # esri ascii doesnt have any crs so assume default
-            crs = "+proj=longlat +ellps=WGS84 +datum=WGS84 +no_defs"
-            
-        # load the data as an image
-        tempfile.close()
-        img = PIL.Image.new("F", (rows, cols))
-        img.putdata(data=data)
-        # create the cell access object
-        cells = img.load()
-        # make a single-band tuple
-        bands = [(img,cells)]
+    return info
 
-        return info, bands, crs
 
-    elif filepath.lower().endswith((".tif",".tiff",".geotiff")):
-        main_img = PIL.Image.open(filepath)
-        raw_tags = dict(main_img.tag.items())
-        
-        def process_metadata(raw_tags):
-            # check tag definitions here
-            info = dict()
-            if raw_tags.has_key(1025):
-                # GTRasterTypeGeoKey, aka midpoint pixels vs topleft area pixels
-                if raw_tags.get(1025) == (1,):
-                    # is area
-                    info["cell_anchor"] = "center"
-                elif raw_tags.get(1025) == (2,):
-                    # is point
-                    info["cell_anchor"] = "nw"
-            if raw_tags.has_key(34264):
-                # ModelTransformationTag, aka 4x4 transform coeffs...
-                a,b,c,d,
-                e,f,g,h,
-                i,j,k,l,
-                m,n,o,p = raw_tags.get(34264)
-                # But we don't want to meddle with 3-D transforms,
-                # ...so for now only get the 2-D affine parameters
-                xscale, xskew, xoff = a,b,d
-                yskew, yscale, yoff = e,f,h
-                info["transform_coeffs"] = xscale, xskew, xoff, yskew, yscale, yoff
+def parse_nodata(value):
+    """
+    The GDAL_NODATA tag as a number, or None if it is empty. Depending on
+    the PIL version the tag comes as a string or a tuple holding one,
+    null terminated or not.
+    """
+    if isinstance(value, (tuple, list)):
+        value = "".join(value)
+    value = value.strip("\0").strip()
+    if not value:
+        return None
+    return float(value)
+
+
+# tiff field types and their struct formats
+TIFF_FORMATS = {1: "B", 2: "s", 3: "H", 4: "I", 6: "b", 8: "h", 9: "i", 11: "f", 12: "d", 16: "Q", 17: "q"}
+
+
+def read_tiff_directories(filepath):
+    """
+    The tags of every image in a little endian tiff or bigtiff, as a list
+    of {tag: values} dicts like PIL gives them, for the files PIL can't open.
+    """
+    with open(filepath, "rb") as reader:
+        byteorder, version = struct.unpack("<2sH", reader.read(4))
+        if byteorder != b"II":
+            raise Exception("Only little endian tiffs can be read without PIL")
+        if version == 43:
+            reader.read(4)
+            countformat, entryformat, offsetformat, inline = "<Q", "<HHQ", "<Q", 8
+        else:
+            countformat, entryformat, offsetformat, inline = "<H", "<HHI", "<I", 4
+        offset, = struct.unpack(offsetformat, reader.read(inline))
+        directories = []
+        while offset:
+            reader.seek(offset)
+            count, = struct.unpack(countformat, reader.read(struct.calcsize(countformat)))
+            entrysize = struct.calcsize(entryformat) + inline
+            entries = [reader.read(entrysize) for _ in xrange(count)]
+            offset, = struct.unpack(offsetformat, reader.read(inline))
+            raw_tags = dict()
+            for entry in entries:
+                tag, fieldtype, valuecount = struct.unpack(entryformat, entry[:-inline])
+                fmt = TIFF_FORMATS.get(fieldtype)
+                if fmt is None:
+                    continue
+                size = struct.calcsize(fmt) * valuecount
+                data = entry[-inline:]
+                if size > inline:
+                    # values that don't fit in the entry are stored elsewhere
+                    position, = struct.unpack(offsetformat, data)
+                    reader.seek(position)
+                    data = reader.read(size)
+                if fmt == "s":
+                    raw_tags[tag] = data[:size]
+                else:
+                    raw_tags[tag] = struct.unpack("<%i%s" % (valuecount, fmt), data[:size])
+            directories.append(raw_tags)
+    return directories
+
+
+def lzw_decompress(data):
+    """Decode TIFF flavoured LZW, the reverse of saver.lzw_compress."""
+    output = []
+    table = [chr(code) for code in xrange(256)] + [None, None]
+    width, bits, nbits = 9, 0, 0
+    previous = None
+    for byte in bytearray(data):
+        bits = (bits << 8) | byte
+        nbits += 8
+        while nbits >= width:
+            nbits -= width
+            code = (bits >> nbits) & ((1 << width) - 1)
+            bits &= (1 << nbits) - 1
+            if code == 256:
+                table = table[:258]
+                width = 9
+                previous = None
+                continue
+            elif code == 257:
+                return b"".join(output)
+            if previous is None:
+                entry = table[code]
             else:
-                if raw_tags.has_key(33922):
-                    # ModelTiepointTag
-                    x, y, z, geo_x, geo_y, geo_z = raw_tags.get(33922)
-                    info["xy_cell"] = x, y
-                    info["xy_geo"] = geo_x, geo_y
-                if raw_tags.has_key(33550):
-                    # ModelPixelScaleTag
-                    scalex,scaley,scalez = raw_tags.get(33550)
-                    info["cellwidth"] = scalex
-                    # note: cellheight must be inversed because geotiff has a reversed y-axis (ie 0,0 is in upperleft corner)
-                    info["cellheight"] = -scaley 
-            if raw_tags.get(42113):
-                info["nodata_value"] = eval(raw_tags.get(42113)) # eval from string to nr
-            return info
-
-        def read_crs(raw_tags):
-            crs = dict()
-            if raw_tags.get(34735):
-                # GeoKeyDirectoryTag
-                crs["proj_params"] = raw_tags.get(34735)
-            if raw_tags.get(34737):
-                # GeoAsciiParamsTag
-                crs["proj_name"] = raw_tags.get(34737)
-            return crs          
-
-        # read geotiff metadata tags
-        info = process_metadata(raw_tags)
-
-        # if no geotiff tag info look for world file transform coefficients
+                entry = table[code] if code < len(table) else previous + previous[0]
+                table.append(previous + entry[0])
+                # the code width grows one code early
+                if len(table) + 1 >= (1 << width) and width < 12:
+                    width += 1
+            output.append(entry)
+            previous = entry
+    return b"".join(output)
+
+
+# tiff compression tag values and the function to decompress each tile with
+DECOMPRESSION = {1: None, 5: lzw_decompress, 8: zlib.decompress}
+
+
+def read_float_tiff_bands(filepath, raw_tags):
+    """
+    Decode the bands of one tiled float32 tiff image, with one band or
+    separate band planes, as written by saver.to_tiled_geotiff.
+    """
+    bandcount = raw_tags.get(277, (1,))[0]
+    if (322 not in raw_tags or raw_tags.get(258, (0,))[0] != 32 or raw_tags.get(339, (1,))[0] != 3
+            or (bandcount > 1 and raw_tags.get(284, (1,))[0] != 2)):
+        raise Exception("Without PIL only tiled float32 tiffs with separate band planes can be read")
+    width, height = raw_tags[256][0], raw_tags[257][0]
+    tilewidth, tilelength = raw_tags[322][0], raw_tags[323][0]
+    decompress = DECOMPRESSION[raw_tags.get(259, (1,))[0]]
+    tilesacross = -(-width // tilewidth)
+    tilesdown = -(-height // tilelength)
+    offsets, bytecounts = raw_tags[324], raw_tags[325]
+
+    bands = []
+    with open(filepath, "rb") as reader:
+        for band in xrange(bandcount):
+            array = numpy.empty((tilesdown * tilelength, tilesacross * tilewidth), dtype=numpy.float32)
+            for tilerow in xrange(tilesdown):
+                for tilecol in xrange(tilesacross):
+                    index = (band * tilesdown + tilerow) * tilesacross + tilecol
+                    reader.seek(offsets[index])
+                    data = reader.read(bytecounts[index])
+                    if decompress:
+                        data = decompress(data)
+                    tile = numpy.frombuffer(data, dtype="<f4").reshape(tilelength, tilewidth)
+                    array[tilerow * tilelength:(tilerow + 1) * tilelength,
+                          tilecol * tilewidth:(tilecol + 1) * tilewidth] = tile
+            img = PIL.Image.fromarray(numpy.ascontiguousarray(array[:height, :width]), "F")
+            bands.append((img, img.load()))
+    return bands
+
+
+def tiff_crs(raw_tags):
+    crs = dict()
+    if raw_tags.get(34735):
+        # GeoKeyDirectoryTag
+        crs["proj_params"] = raw_tags.get(34735)
+    if raw_tags.get(34737):
+        # GeoAsciiParamsTag
+        crs["proj_name"] = raw_tags.get(34737)
+    return crs
+
+
+def world_file_transform(filepath):
+    "returns the world file params rearranged into affine transform coeffs, or None"
+    transform_coeffs = check_world_file(filepath)
+    if transform_coeffs:
+        [xscale, yskew, xskew, yscale, xoff, yoff] = transform_coeffs
+        return [xscale, xskew, xoff, yskew, yscale, yoff]
+
+
+def ascii_metadata(filepath):
+    with open(filepath) as tempfile:
+        info, cols, rows = read_ascii_header(tempfile)
+    info["transform_coeffs"] = world_file_transform(filepath)
+    if not info["transform_coeffs"]:
+        raise NotGeoreferenced("Couldn't find the world file needed to position the image in space")
+    # esri ascii doesnt have any crs so assume default
+    crs = "+proj=longlat +ellps=WGS84 +datum=WGS84 +no_defs"
+    return info, (cols, rows), 1, crs
+
+
+def geotiff_metadata(filepath):
+    try:
+        img = PIL.Image.open(filepath)
+    except IOError:
+        # eg multiband float or bigtiff, which PIL can't read
+        raw_tags = read_tiff_directories(filepath)[0]
+        info = tiff_metadata(raw_tags)
         if len(info) <= 1 and not info.get("transform_coeffs"):
-            transform_coeffs = check_world_file(filepath)
-            if transform_coeffs:
-                # rearrange the world file param sequence to match affine transform
-                [xscale, yskew, xskew, yscale, xoff, yoff] = transform_coeffs
-                info["transform_coeffs"] = [xscale, xskew, xoff, yskew, yscale, yoff]
-            else:
-                raise Exception("Missing geotiff tags or world file needed to position image in space")
+            info["transform_coeffs"] = world_file_transform(filepath)
+            if not info["transform_coeffs"]:
+                raise NotGeoreferenced("Missing geotiff tags or world file needed to position image in space")
+        size = raw_tags[256][0], raw_tags[257][0]
+        return info, size, raw_tags.get(277, (1,))[0], tiff_crs(raw_tags)
+    raw_tags = dict(img.tag.items())
+    info = tiff_metadata(raw_tags)
+    if len(info) <= 1 and not info.get("transform_coeffs"):
+        info["transform_coeffs"] = world_file_transform(filepath)
+        if not info["transform_coeffs"]:
+            raise NotGeoreferenced("Missing geotiff tags or world file needed to position image in space")
+    return info, img.size, len(img.getbands()), tiff_crs(raw_tags)
 
-        # group image bands and pixel access into band tuples
-        bands = []
-        for img in main_img.split():
-            cells = img.load()
-            bands.append((img,cells))
 
-        # read coordinate ref system
-        crs = read_crs(raw_tags)
+def image_metadata(filepath):
+    img = PIL.Image.open(filepath)
+    info = dict(transform_coeffs=world_file_transform(filepath))
+    if not info["transform_coeffs"]:
+        raise NotGeoreferenced("Couldn't find the world file needed to position the image in space")
+    # normal images have no crs, so just assume default crs
+    crs = "+proj=longlat +ellps=WGS84 +datum=WGS84 +no_defs"
+    return info, img.size, len(img.getbands()), crs
 
-        return info, bands, crs
 
-    elif filepath.lower().endswith((".jpg",".jpeg",".png",".bmp",".gif")):
+def read_metadata(filepath):
+    """
+    Read only the georeferencing info, size, band count and crs of a raster
+    file, without loading any cell values. PIL only parses the image header
+    until the pixels are asked for, and ascii grids stop after the header.
+    Returns info, (width, height), bandcount, crs.
+    """
+    driver = drivers.registry.find(filepath, "metadata")
+    if not driver:
+        raise Exception(
+            "Could not read raster metadata from the given filepath: "
+            "the filetype extension is either missing or not supported"
+            )
+    return driver.metadata(filepath)
+
+
+def from_ascii(filepath):
+    with open(filepath) as tempfile:
+        ### Step 1: check header for file info
+        info, cols, rows = read_ascii_header(tempfile)
+
+        ### Step 2: read data into lists
+        # make sure filereading is set to first data row (in case there are spaces or gaps in between header and data)
+        nextline = False
+        while not nextline:
+            prevline = tempfile.tell()
+            nextline = tempfile.readline().strip()
+        tempfile.seek(prevline)
+        # collect flat list of cells instead of rows (because according to the ASCII format, the rows in the grid could be but aren't necessarily organized into separate lines)
+        # the cells are already in row by row order, as the image wants them
+        data = []
+        for line in tempfile.readlines():
+            data.extend(float(cell) for cell in line.split())
+
+        ### Step 3: Read worldfile geotransform
+        transform_coeffs = check_world_file(filepath)
+        if transform_coeffs:
+            # rearrange the world file param sequence to match affine transform
+            xscale,yskew,xskew,yscale,xoff,yoff = transform_coeffs
+            info["transform_coeffs"] = xscale,xskew,xoff,yskew,yscale,yoff
+        else:
+            raise NotGeoreferenced("Couldn't find the world file needed to position the image in space")
+
+        ### Step 4: Read coordinate ref system
+        # esri ascii doesnt have any crs so assume default
+        crs = "+proj=longlat +ellps=WGS84 +datum=WGS84 +no_defs"
         
-        # pure image, so only read if has a world file
+    # load the data as an image
+    tempfile.close()
+    img = PIL.Image.new("F", (cols, rows))
+    img.putdata(data=data)
+    # create the cell access object
+    cells = img.load()
+    # make a single-band tuple
+    bands = [(img,cells)]
+
+    return info, bands, crs
+
+
+def from_geotiff(filepath):
+    try:
+        main_img = PIL.Image.open(filepath)
+    except IOError:
+        # eg multiband float or bigtiff, which PIL can't read
+        main_img = None
+        raw_tags = read_tiff_directories(filepath)[0]
+    else:
+        raw_tags = dict(main_img.tag.items())
+    
+    # read geotiff metadata tags
+    info = tiff_metadata(raw_tags)
+
+    # if no geotiff tag info look for world file transform coefficients
+    if len(info) <= 1 and not info.get("transform_coeffs"):
         transform_coeffs = check_world_file(filepath)
         if transform_coeffs:
-            # rearrange the param sequence to match affine transform
+            # rearrange the world file param sequence to match affine transform
             [xscale, yskew, xskew, yscale, xoff, yoff] = transform_coeffs
             info["transform_coeffs"] = [xscale, xskew, xoff, yskew, yscale, yoff]
-            
-            # group image bands and pixel access into band tuples
-            bands = []
-            for img in main_img.split():
-                cells = img.load()
-                bands.append((img,cells))
+        else:
+            raise NotGeoreferenced("Missing geotiff tags or world file needed to position image in space")
+
+    # group image bands and pixel access into band tuples
+    if main_img is None:
+        bands = read_float_tiff_bands(filepath, raw_tags)
+    else:
+        bands = []
+        for img in main_img.split():
+            cells = img.load()
+            bands.append((img,cells))
 
-            # read crs
-            # normal images have no crs, so just assume default crs
-            crs = "+proj=longlat +ellps=WGS84 +datum=WGS84 +no_defs"
+    # read coordinate ref system
+    crs = tiff_crs(raw_tags)
 
-            return info, bands, crs
+    return info, bands, crs
 
-        else:
-            raise Exception("Couldn't find the world file needed to position the image in space")
+
+def from_image_file(filepath):
     
+    # pure image, so only read if has a world file
+    transform_coeffs = check_world_file(filepath)
+    if transform_coeffs:
+        main_img = PIL.Image.open(filepath)
+        # rearrange the param sequence to match affine transform
+        [xscale, yskew, xskew, yscale, xoff, yoff] = transform_coeffs
+        info = dict()
+        info["transform_coeffs"] = [xscale, xskew, xoff, yskew, yscale, yoff]
+        
+        # group image bands and pixel access into band tuples
+        bands = []
+        for img in main_img.split():
+            cells = img.load()
+            bands.append((img,cells))
+
+        # read crs
+        # normal images have no crs, so just assume default crs
+        crs = "+proj=longlat +ellps=WGS84 +datum=WGS84 +no_defs"
+
+        return info, bands, crs
+
     else:
+        raise NotGeoreferenced("Couldn't find the world file needed to position the image in space")
+
+
+def from_file(filepath):
+    driver = drivers.registry.find(filepath, "read")
+    if not driver:
         raise Exception(
             "Could not create a raster from the given filepath: "
             "the filetype extension is either missing or not supported"
             )
+    return driver.read(filepath)
+
+
+def overviews_from_file(filepath):
+    """
+    Read any overview levels stored with a raster, either as extra pages
+    inside the GeoTIFF itself or in a sidecar .ovr file next to it.
+    Returns a list of (factor, bands) pairs, largest images first.
+    """
+    def read_pages(img, fullwidth, start):
+        overviews = []
+        page = start
+        while True:
+            try:
+                img.seek(page)
+            except EOFError:
+                break
+            factor = int(round(fullwidth / float(img.size[0])))
+            bands = []
+            for band in img.split():
+                cells = band.load()
+                bands.append((band, cells))
+            overviews.append((factor, bands))
+            page += 1
+        return overviews
+
+    overviews = []
+    if filepath.lower().endswith((".tif",".tiff",".geotiff")):
+        try:
+            main_img = PIL.Image.open(filepath)
+        except IOError:
+            directories = read_tiff_directories(filepath)
+            fullwidth = directories[0][256][0]
+            for raw_tags in directories[1:]:
+                factor = int(round(fullwidth / float(raw_tags[256][0])))
+                overviews.append((factor, read_float_tiff_bands(filepath, raw_tags)))
+        else:
+            # page 0 is the full resolution raster itself
+            overviews = read_pages(main_img, main_img.size[0], 1)
+
+    if not overviews and os.path.lexists(filepath + ".ovr"):
+        if filepath.lower().endswith((".asc",".ascii")):
+            # ascii grids have no image header, so read ncols from the text header
+            with open(filepath) as tempfile:
+                fullwidth = int(tempfile.readline().split()[1])
+        else:
+            fullwidth = read_metadata(filepath)[1][0]
+        ovr_img = PIL.Image.open(filepath + ".ovr")
+        overviews = read_pages(ovr_img, fullwidth, 0)
+
+    return overviews
 
 
 def from_lists(data, nodata_value=-9999.0, cell_anchor="center", **geoargs):
@@ -0,0 +1,273 @@
+# import numpy for the vectorized labeling passes
+import numpy
+
+from .. import parallel
+
+
+# neighbour offsets as (rowoffset, coloffset), only one of each opposing pair is needed
+OFFSETS = {
+    4: [(0, 1), (1, 0)],
+    8: [(0, 1), (1, 0), (1, 1), (1, -1)],
+    }
+
+# directions of travel in pixel space and the turn to the right of each
+RIGHT_TURN = {(1, 0): (0, 1), (0, 1): (-1, 0), (-1, 0): (0, -1), (0, -1): (1, 0)}
+
+
+def neighbour_pairs(values, valid, connectivity):
+    """Flat index arrays of every pair of neighbouring valid cells with equal values."""
+    height, width = values.shape
+    index = numpy.arange(height * width).reshape(height, width)
+    firsts, seconds = [], []
+    for rowoffset, coloffset in OFFSETS[connectivity]:
+        colstart, colend = max(0, -coloffset), width - max(0, coloffset)
+        first = (slice(0, height - rowoffset), slice(colstart, colend))
+        second = (slice(rowoffset, height), slice(colstart + coloffset, colend + coloffset))
+        same = valid[first] & valid[second] & (values[first] == values[second])
+        firsts.append(index[first][same])
+        seconds.append(index[second][same])
+    return numpy.concatenate(firsts), numpy.concatenate(seconds)
+
+
+def compress(parent):
+    """Point every entry directly at the root of its tree."""
+    while True:
+        grandparent = parent[parent]
+        if numpy.array_equal(grandparent, parent):
+            return parent
+        parent = grandparent
+
+
+def merge(parent, firsts, seconds):
+    """
+    Union the trees of each pair of entries until every pair shares a
+    root, always hooking the larger root under the smaller one so that
+    each region ends up labeled by its lowest index.
+    """
+    parent = compress(parent)
+    while True:
+        firstroots, secondroots = parent[firsts], parent[seconds]
+        differ = firstroots != secondroots
+        if not differ.any():
+            return parent
+        low = numpy.minimum(firstroots[differ], secondroots[differ])
+        high = numpy.maximum(firstroots[differ], secondroots[differ])
+        numpy.minimum.at(parent, high, low)
+        parent = compress(parent)
+
+
+def label_regions(values, valid, connectivity=4):
+    """
+    Label connected regions of equal value in a 2D array, where each
+    region's label is the flat index of its first cell. Invalid cells
+    keep their own index and are ignored by the caller.
+    """
+    height, width = values.shape
+    parent = numpy.arange(height * width)
+    firsts, seconds = neighbour_pairs(values, valid, connectivity)
+    return merge(parent, firsts, seconds).reshape(height, width)
+
+
+def _label_tile(job):
+    # module level so it can be sent to worker processes
+    values, valid, connectivity = job
+    return label_regions(values, valid, connectivity)
+
+
+def seam_pairs(values, valid, connectivity, tilesize):
+    """Neighbouring pairs of cells that lie on opposite sides of a tile edge."""
+    height, width = values.shape
+    index = numpy.arange(height * width).reshape(height, width)
+    rows, cols = numpy.indices((height, width))
+    tilerows, tilecols = rows // tilesize, cols // tilesize
+    firsts, seconds = [], []
+    for rowoffset, coloffset in OFFSETS[connectivity]:
+        colstart, colend = max(0, -coloffset), width - max(0, coloffset)
+        first = (slice(0, height - rowoffset), slice(colstart, colend))
+        second = (slice(rowoffset, height), slice(colstart + coloffset, colend + coloffset))
+        across = ((tilerows[first] != tilerows[second]) | (tilecols[first] != tilecols[second]))
+        same = across & valid[first] & valid[second] & (values[first] == values[second])
+        firsts.append(index[first][same])
+        seconds.append(index[second][same])
+    return numpy.concatenate(firsts), numpy.concatenate(seconds)
+
+
+def label_tiled(values, valid, connectivity=4, tilesize=1024, workers=None):
+    """
+    Label regions tile by tile on a process pool, then merge the regions
+    that continue across tile edges into single labels.
+    """
+    height, width = values.shape
+    windows = [(rowstart, min(rowstart + tilesize, height), colstart, min(colstart + tilesize, width))
+               for rowstart in xrange(0, height, tilesize)
+               for colstart in xrange(0, width, tilesize)]
+    jobs = [(values[rowstart:rowend, colstart:colend], valid[rowstart:rowend, colstart:colend],
+             connectivity) for rowstart, rowend, colstart, colend in windows]
+    results = parallel.map_processes(_label_tile, jobs, workers)
+
+    # translate the tile local labels into flat indexes of the whole array
+    parent = numpy.empty((height, width), dtype=numpy.int64)
+    for (rowstart, rowend, colstart, colend), labels in zip(windows, results):
+        tilewidth = colend - colstart
+        labelrows, labelcols = labels // tilewidth, labels % tilewidth
+        parent[rowstart:rowend, colstart:colend] = (labelrows + rowstart) * width + labelcols + colstart
+
+    if len(windows) == 1:
+        return parent
+    firsts, seconds = seam_pairs(values, valid, connectivity, tilesize)
+    return merge(parent.ravel(), firsts, seconds).reshape(height, width)
+
+
+def boundary_edges(labels, valid):
+    """
+    Unit edges between each valid cell and any differently labeled
+    neighbour, as arrays of start x, start y, end x, end y and label.
+    Edges run clockwise around regions (on screen, rows growing down),
+    so that the region is always on the right hand side.
+    """
+    height, width = labels.shape
+    padded = numpy.full((height + 2, width + 2), -1, dtype=numpy.int64)
+    padded[1:-1, 1:-1] = numpy.where(valid, labels, -1)
+    centre = padded[1:-1, 1:-1]
+    rows, cols = numpy.indices((height, width))
+    edges = []
+    # neighbour slice, then edge start and end corners relative to the cell
+    sides = [
+        (padded[:-2, 1:-1], (0, 0), (1, 0)),  # top, heading east
+        (padded[1:-1, 2:], (1, 0), (1, 1)),  # right, heading south
+        (padded[2:, 1:-1], (1, 1), (0, 1)),  # bottom, heading west
+        (padded[1:-1, :-2], (0, 1), (0, 0)),  # left, heading north
+        ]
+    for neighbour, (startx, starty), (endx, endy) in sides:
+        boundary = valid & (neighbour != centre)
+        edgecols, edgerows = cols[boundary], rows[boundary]
+        edges.append((edgecols + startx, edgerows + starty,
+                      edgecols + endx, edgerows + endy, centre[boundary]))
+    return [numpy.concatenate(parts) for parts in zip(*edges)]
+
+
+def split_loops(vertices):
+    """
+    Split a closed walk of vertices into simple loops wherever a vertex
+    repeats, so no loop touches itself. Each loop is left unclosed.
+    """
+    loops = []
+    stack = []
+    positions = dict()
+    for vertex in vertices:
+        if vertex in positions:
+            # the walk came back here, so everything since is a loop of its own
+            start = positions[vertex]
+            loop = stack[start:]
+            for other in loop[1:]:
+                del positions[other]
+            del stack[start + 1:]
+            loops.append(loop)
+        else:
+            positions[vertex] = len(stack)
+            stack.append(vertex)
+    if stack:
+        loops.append(stack)
+    return loops
+
+
+def corners(loop):
+    """The vertices of an unclosed loop where the direction changes, closed."""
+    kept = []
+    for i, (x, y) in enumerate(loop):
+        (prevx, prevy), (nextx, nexty) = loop[i - 1], loop[(i + 1) % len(loop)]
+        if (x - prevx, y - prevy) != (nextx - x, nexty - y):
+            kept.append((x, y))
+    kept.append(kept[0])
+    return kept
+
+
+def trace_rings(x0, y0, x1, y1):
+    """
+    Chain the boundary edges of one region into closed rings of pixel
+    corner coordinates. Where a region touches itself at a corner the
+    trace turns right, and the walk is split at every vertex it passes
+    twice, so each ring is simple and becomes its own exterior or hole.
+    Only the corners where the direction changes are kept.
+    """
+    outgoing = dict()
+    for edge in xrange(len(x0)):
+        outgoing.setdefault((x0[edge], y0[edge]), []).append(edge)
+    used = numpy.zeros(len(x0), dtype=bool)
+    rings = []
+    for first in xrange(len(x0)):
+        if used[first]:
+            continue
+        walk = []
+        edge = first
+        while True:
+            used[edge] = True
+            direction = (x1[edge] - x0[edge], y1[edge] - y0[edge])
+            vertex = (x1[edge], y1[edge])
+            # the first edge stays a candidate so the ring can close on it
+            candidates = [other for other in outgoing[vertex] if not used[other] or other == first]
+            if len(candidates) > 1:
+                right = RIGHT_TURN[direction]
+                candidates.sort(key=lambda other: (x1[other] - x0[other], y1[other] - y0[other]) != right)
+            walk.append((x0[edge], y0[edge]))
+            if not candidates or candidates[0] == first:
+                break
+            edge = candidates[0]
+        rings.extend(corners(loop) for loop in split_loops(walk))
+    return rings
+
+
+def ring_area(ring):
+    """Shoelace area, positive for exterior rings traced clockwise on screen."""
+    return sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(ring[:-1], ring[1:])) / 2.0
+
+
+def point_in_ring(x, y, ring):
+    inside = False
+    for (x0, y0), (x1, y1) in zip(ring[:-1], ring[1:]):
+        if (y0 > y) != (y1 > y) and x < x0 + (y - y0) * (x1 - x0) / float(y1 - y0):
+            inside = not inside
+    return inside
+
+
+def assemble_polygons(rings):
+    """Group a region's rings into a list of polygons, each an exterior followed by its holes."""
+    exteriors = [ring for ring in rings if ring_area(ring) > 0]
+    holes = [ring for ring in rings if ring_area(ring) < 0]
+    polygons = [[exterior] for exterior in exteriors]
+    for hole in holes:
+        if len(polygons) == 1:
+            polygons[0].append(hole)
+            continue
+        # a point just to the right of the first hole edge lies inside the region
+        (x0, y0), (x1, y1) = hole[0], hole[1]
+        dx, dy = numpy.sign(x1 - x0), numpy.sign(y1 - y0)
+        testx, testy = x0 + dx * 0.5 - dy * 0.25, y0 + dy * 0.5 + dx * 0.25
+        # split rings can leave an exterior inside another's hole, so take the innermost
+        containing = [polygon for polygon in polygons if point_in_ring(testx, testy, polygon[0])]
+        if containing:
+            min(containing, key=lambda polygon: ring_area(polygon[0])).append(hole)
+    return polygons
+
+
+def polygonize(values, valid, connectivity=4, tilesize=1024, workers=None):
+    """
+    Yields (value, polygons) for every connected region of equal value
+    among the valid cells of a 2D array, where polygons is a list of rings
+    (exterior first, then holes) in pixel corner coordinates.
+    """
+    if connectivity not in OFFSETS:
+        raise Exception("Connectivity must be either 4 or 8")
+    labels = label_tiled(values, valid, connectivity, tilesize, workers)
+    x0, y0, x1, y1, edgelabels = boundary_edges(labels, valid)
+
+    order = numpy.argsort(edgelabels, kind="mergesort")
+    x0, y0, x1, y1, edgelabels = x0[order], y0[order], x1[order], y1[order], edgelabels[order]
+    starts = numpy.flatnonzero(numpy.r_[True, edgelabels[1:] != edgelabels[:-1]])
+    ends = numpy.r_[starts[1:], len(edgelabels)]
+    flatvalues = values.ravel()
+    for start, end in zip(starts, ends):
+        region = slice(start, end)
+        rings = trace_rings(x0[region].tolist(), y0[region].tolist(),
+                            x1[region].tolist(), y1[region].tolist())
+        yield flatvalues[edgelabels[start]], assemble_polygons(rings)
@@ -0,0 +1,225 @@
+# import internals
+import math
+
+# import numpy for the vectorized scanline math
+import numpy
+
+from .. import parallel
+
+
+def geo_to_pixel(inv_transform_coeffs, xs, ys):
+    """Fractional column and row arrays for arrays of geographic coordinates."""
+    a, b, c, d, e, f = inv_transform_coeffs
+    xs = numpy.asarray(xs, dtype=numpy.float64)
+    ys = numpy.asarray(ys, dtype=numpy.float64)
+    return a*xs + b*ys + c, d*xs + e*ys + f
+
+
+def bbox_window(inv_transform_coeffs, bbox, width, height):
+    """
+    The (colstart, rowstart, colend, rowend) cell window covering a
+    geographic bbox, clipped to the raster, or None if they don't overlap.
+    """
+    xmin, ymin, xmax, ymax = bbox
+    cols, rows = geo_to_pixel(inv_transform_coeffs,
+                              [xmin, xmin, xmax, xmax], [ymin, ymax, ymin, ymax])
+    colstart = max(int(math.floor(cols.min())), 0)
+    rowstart = max(int(math.floor(rows.min())), 0)
+    colend = min(int(math.floor(cols.max())) + 1, width)
+    rowend = min(int(math.floor(rows.max())) + 1, height)
+    if colstart >= colend or rowstart >= rowend:
+        return None
+    return colstart, rowstart, colend, rowend
+
+
+def polygon_rings(geometry):
+    """All exterior and hole rings of a geojson Polygon or MultiPolygon."""
+    if geometry["type"] == "Polygon":
+        return list(geometry["coordinates"])
+    elif geometry["type"] == "MultiPolygon":
+        return [ring for polygon in geometry["coordinates"] for ring in polygon]
+    else:
+        raise TypeError("Expected a Polygon or MultiPolygon geometry, not %s" % geometry["type"])
+
+
+def polygon_mask(rings, window, inv_transform_coeffs):
+    """
+    Scanline fill of polygon rings over a cell window, giving a boolean
+    array where cells whose centre falls inside the polygon are True.
+    Holes and multiple parts are handled by the even-odd rule.
+    """
+    colstart, rowstart, colend, rowend = window
+    width, height = colend - colstart, rowend - rowstart
+
+    # collect every ring edge in window pixel coordinates
+    x0s, y0s, x1s, y1s = [], [], [], []
+    for ring in rings:
+        if len(ring) < 3:
+            continue
+        xs, ys = zip(*ring)
+        cols, rows = geo_to_pixel(inv_transform_coeffs, xs, ys)
+        cols, rows = cols - colstart, rows - rowstart
+        # close the ring if needed by wrapping around to the first vertex
+        x0s.append(cols)
+        y0s.append(rows)
+        x1s.append(numpy.roll(cols, -1))
+        y1s.append(numpy.roll(rows, -1))
+    if not x0s:
+        return numpy.zeros((height, width), dtype=bool)
+    x0, y0 = numpy.concatenate(x0s), numpy.concatenate(y0s)
+    x1, y1 = numpy.concatenate(x1s), numpy.concatenate(y1s)
+
+    # row centres crossed by each edge, half open so shared vertices count once
+    ytop, ybottom = numpy.minimum(y0, y1), numpy.maximum(y0, y1)
+    firstrow = numpy.clip(numpy.ceil(ytop - 0.5), 0, height).astype(numpy.int64)
+    lastrow = numpy.clip(numpy.ceil(ybottom - 0.5), 0, height).astype(numpy.int64)
+    nrows = lastrow - firstrow
+    crossing = nrows > 0
+    x0, y0, x1, y1 = x0[crossing], y0[crossing], x1[crossing], y1[crossing]
+    firstrow, nrows = firstrow[crossing], nrows[crossing]
+
+    # one entry per (edge, row) crossing
+    edge = numpy.repeat(numpy.arange(len(nrows)), nrows)
+    rows = firstrow[edge] + (numpy.arange(nrows.sum()) - numpy.repeat(nrows.cumsum() - nrows, nrows))
+    ycentre = rows + 0.5
+    xcross = x0[edge] + (ycentre - y0[edge]) * (x1[edge] - x0[edge]) / (y1[edge] - y0[edge])
+
+    # toggle insideness at the first cell centre right of each crossing
+    cols = numpy.clip(numpy.ceil(xcross - 0.5), 0, width).astype(numpy.int64)
+    toggles = numpy.zeros((height, width + 1), dtype=numpy.int32)
+    numpy.add.at(toggles, (rows, cols), 1)
+    return (numpy.cumsum(toggles, axis=1)[:, :width] % 2) == 1
+
+
+def segment_arrays(lines, inv_transform_coeffs):
+    """Start and end pixel coordinate arrays of every segment in a list of coordinate lists."""
+    x0s, y0s, x1s, y1s = [], [], [], []
+    for coords in lines:
+        if len(coords) < 2:
+            continue
+        xs, ys = zip(*coords)
+        cols, rows = geo_to_pixel(inv_transform_coeffs, xs, ys)
+        x0s.append(cols[:-1])
+        y0s.append(rows[:-1])
+        x1s.append(cols[1:])
+        y1s.append(rows[1:])
+    if not x0s:
+        empty = numpy.empty(0)
+        return empty, empty, empty, empty
+    return (numpy.concatenate(x0s), numpy.concatenate(y0s),
+            numpy.concatenate(x1s), numpy.concatenate(y1s))
+
+
+def _ranges(starts, counts):
+    # segment index and offset within the segment for every item of variable length runs
+    segment = numpy.repeat(numpy.arange(len(counts)), counts)
+    offset = numpy.arange(counts.sum()) - numpy.repeat(counts.cumsum() - counts, counts)
+    return segment, starts[segment] + offset
+
+
+def line_cells(lines, inv_transform_coeffs, all_touched=False):
+    """
+    The (rows, cols) of cells along lines given as lists of coordinates.
+    By default one cell is taken per step along the major axis of each
+    segment, like Bresenham's algorithm. With all_touched every cell that
+    a segment passes through is included.
+    """
+    x0, y0, x1, y1 = segment_arrays(lines, inv_transform_coeffs)
+    dx, dy = x1 - x0, y1 - y0
+    if not all_touched:
+        steps = numpy.ceil(numpy.maximum(numpy.abs(dx), numpy.abs(dy))).astype(numpy.int64) + 1
+        segment, step = _ranges(numpy.zeros(len(steps), dtype=numpy.int64), steps)
+        t = step / numpy.maximum(steps[segment] - 1, 1).astype(numpy.float64)
+    else:
+        # parameters where each segment crosses a vertical or horizontal cell edge
+        ts, segments = [numpy.zeros(len(x0)), numpy.ones(len(x0))], [numpy.arange(len(x0))] * 2
+        for p0, p1, d in ((x0, x1, dx), (y0, y1, dy)):
+            first = numpy.floor(numpy.minimum(p0, p1)).astype(numpy.int64) + 1
+            count = numpy.maximum(numpy.ceil(numpy.maximum(p0, p1)).astype(numpy.int64) - first, 0)
+            count[d == 0] = 0
+            segment, gridline = _ranges(first, count)
+            ts.append((gridline - p0[segment]) / d[segment])
+            segments.append(segment)
+        t, segment = numpy.concatenate(ts), numpy.concatenate(segments)
+        order = numpy.lexsort((t, segment))
+        t, segment = t[order], segment[order]
+        # cells are sampled halfway between consecutive crossings of the same segment
+        same = segment[1:] == segment[:-1]
+        t = ((t[1:] + t[:-1]) / 2.0)[same]
+        segment = segment[1:][same]
+    cols = numpy.floor(x0[segment] + t * dx[segment]).astype(numpy.int64)
+    rows = numpy.floor(y0[segment] + t * dy[segment]).astype(numpy.int64)
+    return rows, cols
+
+
+def point_cells(points, inv_transform_coeffs):
+    """The (rows, cols) of the cells containing each point."""
+    xs, ys = zip(*points)
+    cols, rows = geo_to_pixel(inv_transform_coeffs, xs, ys)
+    return numpy.floor(rows).astype(numpy.int64), numpy.floor(cols).astype(numpy.int64)
+
+
+def geometry_lines(geometry):
+    """The coordinate lists making up a geojson line or the rings of a polygon."""
+    geotype = geometry["type"]
+    coords = geometry["coordinates"]
+    if geotype == "LineString":
+        return [coords]
+    elif geotype == "MultiLineString":
+        return list(coords)
+    else:
+        return polygon_rings(geometry)
+
+
+def burn_geometry(array, geometry, bbox, value, inv_transform_coeffs,
+                  rowstart=0, rowend=None, all_touched=False):
+    """
+    Write value into the array cells covered by a geojson geometry,
+    limited to the rows from rowstart up to rowend.
+    Polygons take the cells whose centres fall inside them (plus every
+    cell touched by their boundary with all_touched), lines take the
+    cells along them and points the cell they fall in.
+    """
+    height, width = array.shape
+    rowend = height if rowend is None else rowend
+    window = bbox_window(inv_transform_coeffs, bbox, width, height)
+    if window is None:
+        return
+    colstart, winrowstart, colend, winrowend = window
+    window = colstart, max(winrowstart, rowstart), colend, min(winrowend, rowend)
+    if window[1] >= window[3]:
+        return
+
+    geotype = geometry["type"]
+    if "Polygon" in geotype:
+        inside = polygon_mask(polygon_rings(geometry), window, inv_transform_coeffs)
+        array[window[1]:window[3], window[0]:window[2]][inside] = value
+        if not all_touched:
+            return
+    if "Point" in geotype:
+        points = [geometry["coordinates"]] if geotype == "Point" else geometry["coordinates"]
+        rows, cols = point_cells(points, inv_transform_coeffs)
+    else:
+        rows, cols = line_cells(geometry_lines(geometry), inv_transform_coeffs, all_touched)
+    keep = (rows >= window[1]) & (rows < window[3]) & (cols >= 0) & (cols < width)
+    array[rows[keep], cols[keep]] = value
+
+
+def burn(array, shapes, inv_transform_coeffs, all_touched=False, stripheight=256, workers=None):
+    """
+    Burn (geometry, bbox, value) shapes into a 2D array in place, later
+    shapes overwriting earlier ones. The array is split into horizontal
+    strips that are burned concurrently, each only touching its own rows.
+    """
+    height = array.shape[0]
+    strips = [(rowstart, min(rowstart + stripheight, height))
+              for rowstart in xrange(0, height, stripheight)]
+
+    def burn_strip(strip):
+        rowstart, rowend = strip
+        for geometry, bbox, value in shapes:
+            burn_geometry(array, geometry, bbox, value, inv_transform_coeffs,
+                          rowstart, rowend, all_touched)
+
+    parallel.map_threads(burn_strip, strips, workers)
+    return array
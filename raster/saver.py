@@ -1,115 +1,436 @@
 
-# import PIL as the saver
-import PIL
-import PIL.TiffImagePlugin
-import PIL.TiffTags
-
-def to_file(bands, info, filepath):
-    def combine_bands(bands):
-        # saving in image-like format, so combine and prep final image
-        if len(bands) == 1:
-            img = bands[0].img
-            return img
-        elif len(bands) == 3:
-            # merge all images together
-            mode = "RGB"
-            bands = [band.img for band in bands]
-            img = PIL.Image.merge(mode, bands)
-            return img
-        elif len(bands) == 4:
-            # merge all images together
-            mode = "RGBA"
-            bands = [band.img for band in bands]
-            img = PIL.Image.merge(mode, bands)
-            return img
-        else:
-            # raise error if more than 4 bands, because PIL cannot save such images
-            raise Exception("Cannot save more than 4 bands to one file; split and save each band separately")
-    def create_world_file(savepath, geotrans):
-        dir, filename_and_ext = os.path.split(savepath)
-        filename, extension = os.path.splitext(filename_and_ext)
-        world_file_path = os.path.join(dir, filename) + ".wld"
-        with open(world_file_path, "w") as writer:
-            # rearrange transform coefficients and write
-            xscale,xskew,xoff,yskew,yscale,yoff = geotrans
-            writer.writelines([xscale,yskew,xskew,yscale,xoff,yoff])
-
-    if filepath.endswith((".ascii",".asc")):
-        # create header
-        width, height = img.size()
-        xorig, yorig = info["xy_geo"]
-        if info["cell_anchor"] == "center":
-            xorigtype = "xllcenter"
-            yorigtype = "yllcenter"
-        elif info["cell_anchor"] == "sw":
-            xorigtype = "xllcorner"
-            yorigtype = "yllcorner"
-        else:
-            raise Exception("Currently not saving rasters with anchor points other than sw or center")
-        header = ""
-        header += "NCOLS %s \n"%width
-        header += "NROWS %s \n"%height
-        header += "%s %s \n"%(xorigtype,xorig)
-        header += "CELLSIZE %s \n"%info["cellwidth"]
-        header += "NODATA_VALUE %s \n"%info["nodata_value"]
-        # write bands
-        filename_root, ext = os.path.splitext(filepath)
-        for i, band in enumerate(bands):
-            (img, cells) = band
-            newpath = filename_root + "_" + i + ext
-            with open(newpath, "w") as tempfile:
-                # write header
-                tempfile.write(header)
-                # write cells
-                for y in xrange(height):
-                    row = " ".join((str(cells[x,y]) for x in xrange(width)))+"\n"
-                    tempfile.write(row)
-            # finally create world file for the geotransform
-            create_world_file(newpath, info["transform_coeffs"])
-
-    elif filepath.endswith((".tif", ".tiff", ".geotiff")):
-        # write directly to tag info
-        PIL.TiffImagePlugin.WRITE_LIBTIFF = False
-        tags = PIL.TiffImagePlugin.ImageFileDirectory()
-        if info.get("cell_anchor"):
-            # GTRasterTypeGeoKey, aka midpoint pixels vs topleft area pixels
-            if info.get("cell_anchor") == "center":
-                # is area
-                tags[1025] = 1.0
-                tags.tagtype[1025] = 12 #double, only works with PIL patch
-            elif info.get("cell_anchor") == "nw":
-                # is point
-                tags[1025] = 2.0
-                tags.tagtype[1025] = 12 #double, only works with PIL patch
-        if info.get("transform_coeffs"):
-            # ModelTransformationTag, aka 4x4 transform coeffs...
-            tags[34264] = tuple(map(float,info.get("transform_coeffs")))
-            tags.tagtype[34264] = 12 #double, only works with PIL patch
+# import internals
+import os
+import struct
+import zlib
+
+# import numpy for packing tile data
+import numpy
+
+from . import drivers
+from .. import parallel
+from ..drivers import lazy_import
+
+# PIL is the saver, imported on first use
+PIL = lazy_import("PIL")
+
+
+def combine_bands(bands):
+    # saving in image-like format, so combine and prep final image
+    if len(bands) == 1:
+        img = bands[0].img
+        return img
+    elif len(bands) == 3:
+        # merge all images together
+        mode = "RGB"
+        bands = [band.img for band in bands]
+        img = PIL.Image.merge(mode, bands)
+        return img
+    elif len(bands) == 4:
+        # merge all images together
+        mode = "RGBA"
+        bands = [band.img for band in bands]
+        img = PIL.Image.merge(mode, bands)
+        return img
+    else:
+        # raise error if more than 4 bands, because PIL cannot save such images
+        raise Exception("Cannot save more than 4 bands to one file; split and save each band separately")
+
+
+def overviews_to_file(overviews, filepath):
+    """
+    Write overview levels to a sidecar .ovr file next to the raster,
+    as a multipage tiff with one page per level, largest first.
+    """
+    levels = [combine_bands(bands) for factor, bands in sorted(overviews.items())]
+    if levels:
+        first, rest = levels[0], levels[1:]
+        first.save(filepath + ".ovr", format="TIFF", save_all=True, append_images=rest)
+
+
+def lzw_compress(data):
+    """
+    TIFF flavoured LZW: msb first codes of 9 to 12 bits, with clear code
+    256, end of information code 257 and early change of the code width.
+    """
+    codes = [(256, 9)]
+    table = dict()
+    next_code, width = 258, 9
+    prefix = None
+    for byte in bytearray(data):
+        if prefix is None:
+            prefix = byte
+            continue
+        code = table.get((prefix, byte))
+        if code is not None:
+            prefix = code
+            continue
+        codes.append((prefix, width))
+        table[(prefix, byte)] = next_code
+        next_code += 1
+        if next_code == 4094:
+            # table is full, so start over
+            codes.append((256, width))
+            table = dict()
+            next_code, width = 258, 9
+        elif next_code > (1 << width) - 1:
+            width += 1
+        prefix = byte
+    if prefix is not None:
+        codes.append((prefix, width))
+    codes.append((257, width))
+
+    # pack the variable width codes into bytes
+    output = bytearray()
+    bits, nbits = 0, 0
+    for code, width in codes:
+        bits = (bits << width) | code
+        nbits += width
+        while nbits >= 8:
+            nbits -= 8
+            output.append((bits >> nbits) & 0xFF)
+        bits &= (1 << nbits) - 1
+    if nbits:
+        output.append((bits << (8 - nbits)) & 0xFF)
+    return bytes(output)
+
+
+# tiff compression tag values and the function to compress each tile with
+COMPRESSION = {
+    None: (1, None),
+    "lzw": (5, lzw_compress),
+    "deflate": (8, zlib.compress),
+    }
+
+# tiff field types as (type code, struct format, size in bytes)
+SHORT = (3, "H", 2)
+LONG = (4, "I", 4)
+DOUBLE = (12, "d", 8)
+ASCII = (2, "s", 1)
+LONG8 = (16, "Q", 8)
+
+# offsets in a classic tiff are 32 bit, so it can't grow past 4 GB
+CLASSIC_MAX_BYTES = 2**32
+
+
+def _pack_tile(job):
+    # module level so it can be sent to worker processes
+    array, tilesize, compression = job
+    # tiles are always full size, so pad the right and bottom edge tiles
+    tile = numpy.zeros((tilesize, tilesize), dtype="<f4")
+    tile[:array.shape[0], :array.shape[1]] = array
+    data = tile.tobytes()
+    compress = COMPRESSION[compression][1]
+    return compress(data) if compress else data
+
+
+def geotiff_tags(info):
+    """The geotiff georeferencing tags for a raster's info, as {tag: (fieldtype, values)}."""
+    tags = dict()
+    if info.get("transform_coeffs"):
+        # ModelTransformationTag, the affine coeffs as a 4x4 matrix
+        a, b, c, d, e, f = map(float, info["transform_coeffs"])
+        tags[34264] = (DOUBLE, [a, b, 0, c, d, e, 0, f, 0, 0, 0, 0, 0, 0, 0, 1])
+    else:
+        if info.get("xy_cell") and info.get("xy_geo"):
+            # ModelTiepointTag
+            x, y = info["xy_cell"]
+            geo_x, geo_y = info["xy_geo"]
+            tags[33922] = (DOUBLE, map(float, [x, y, 0, geo_x, geo_y, 0]))
+        if info.get("cellwidth") and info.get("cellheight"):
+            # ModelPixelScaleTag, the loader flips the y scale back on reading
+            tags[33550] = (DOUBLE, map(float, [info["cellwidth"], -info["cellheight"], 0]))
+    # GeoKeyDirectoryTag with just the GTRasterTypeGeoKey, area or point cells
+    rastertype = 2 if info.get("cell_anchor") == "nw" else 1
+    tags[34735] = (SHORT, [1, 1, 0, 1, 1025, 0, 1, rastertype])
+    if info.get("nodata_value") is not None:
+        # GDAL_NODATA as a null terminated string
+        tags[42113] = (ASCII, [str(info["nodata_value"]) + "\0"])
+    return tags
+
+
+class TiledTiffWriter(object):
+    """
+    Streams tiled float32 images into a tiff file. Tile data is written
+    as soon as it has been compressed, and the directories describing
+    each image are written at the end once all tile offsets are known.
+    Bands are stored as separate planes, so any number of bands works.
+    """
+    def __init__(self, filepath, tilesize=256, compression="deflate", bigtiff=False, workers=None):
+        if compression not in COMPRESSION:
+            raise Exception("Compression must be one of: None, lzw, deflate")
+        if tilesize % 16:
+            raise Exception("The tiff tile size must be a multiple of 16")
+        self.tilesize = tilesize
+        self.compression = compression
+        self.bigtiff = bigtiff
+        self.workers = workers
+        self.images = []
+        self.file = open(filepath, "wb")
+        if bigtiff:
+            # byte order, version 43, offset size 8, then the first directory offset
+            self.file.write(struct.pack("<2sHHHQ", b"II", 43, 8, 0, 0))
         else:
-            if info.get("xy_cell") and info.get("xy_geo"):
-                # ModelTiepointTag
-                x,y = info["xy_cell"]
-                geo_x,geo_y = info["xy_geo"]
-                tags[33922] = tuple(map(float,[x,y,0,geo_x,geo_y,0]))
-                tags.tagtype[33922] = 12 #double, only works with PIL patch
-            if info.get("cellwidth") and info.get("cellheight"):
-                # ModelPixelScaleTag
-                scalex,scaley = info["cellwidth"],info["cellheight"]
-                tags[33550] = tuple(map(float,[scalex,scaley,0]))
-                tags.tagtype[33550] = 12 #double, only works with PIL patch
-        if info.get("nodata_value"):
-            tags[42113] = bytes(info.get("nodata_value"))
-            tags.tagtype[42113] = 2 #ascii
-            
-        # finally save the file using tiffinfo headers
-        img = combine_bands(bands)
+            self.file.write(struct.pack("<2sHI", b"II", 42, 0))
+
+    def write_image(self, tiles, width, height, bandcount, tags=None, overview=False):
+        """
+        Write one image from an iterable of 2D tile arrays, given band by
+        band and within each band row by row. Tiles are compressed in
+        batches on a pool of workers to bound memory use.
+        """
+        offsets, bytecounts = [], []
+        # deflate releases the GIL, pure python lzw needs processes
+        mapper = parallel.map_processes if self.compression == "lzw" else parallel.map_threads
+        batchsize = parallel.get_workers(self.workers) * 4
+        batch = []
+
+        def flush(batch):
+            jobs = [(array, self.tilesize, self.compression) for array in batch]
+            for data in mapper(_pack_tile, jobs, self.workers):
+                offsets.append(self.file.tell())
+                bytecounts.append(len(data))
+                self.file.write(data)
+                if not self.bigtiff and self.file.tell() >= CLASSIC_MAX_BYTES:
+                    raise Exception("The file is larger than 4 GB, save it with bigtiff=True")
+
+        for array in tiles:
+            batch.append(array)
+            if len(batch) >= batchsize:
+                flush(batch)
+                batch = []
+        flush(batch)
+
+        tilesacross = -(-width // self.tilesize)
+        tilesdown = -(-height // self.tilesize)
+        if len(offsets) != tilesacross * tilesdown * bandcount:
+            raise Exception("Expected %i tiles but got %i" % (tilesacross * tilesdown * bandcount, len(offsets)))
+
+        offsettype = LONG8 if self.bigtiff else LONG
+        entries = dict(tags or {})
+        entries.update({
+            254: (LONG, [1 if overview else 0]),  # NewSubfileType, reduced resolution or not
+            256: (LONG, [width]),  # ImageWidth
+            257: (LONG, [height]),  # ImageLength
+            258: (SHORT, [32] * bandcount),  # BitsPerSample
+            259: (SHORT, [COMPRESSION[self.compression][0]]),  # Compression
+            262: (SHORT, [1]),  # PhotometricInterpretation, BlackIsZero
+            277: (SHORT, [bandcount]),  # SamplesPerPixel
+            284: (SHORT, [2]),  # PlanarConfiguration, separate band planes
+            322: (LONG, [self.tilesize]),  # TileWidth
+            323: (LONG, [self.tilesize]),  # TileLength
+            324: (offsettype, offsets),  # TileOffsets
+            325: (offsettype, bytecounts),  # TileByteCounts
+            339: (SHORT, [3] * bandcount),  # SampleFormat, floating point
+            })
+        self.images.append(entries)
+
+    def _write_directory(self, entries, next_offset_position):
+        # point the previous directory (or the header) at this one
+        if self.file.tell() % 2:
+            self.file.write(b"\0")
+        start = self.file.tell()
+        self.file.seek(next_offset_position)
+        self.file.write(struct.pack("<Q" if self.bigtiff else "<I", start))
+        self.file.seek(start)
+
+        countformat, entryformat, offsetformat, inline = (
+            ("<Q", "<HHQ", "<Q", 8) if self.bigtiff else ("<H", "<HHI", "<I", 4))
+        entrysize = struct.calcsize(entryformat) + inline
+        overflow = start + struct.calcsize(countformat) + len(entries) * entrysize + inline
+        header, extra = [struct.pack(countformat, len(entries))], []
+        for tag in sorted(entries):
+            (fieldtype, fmt, size), values = entries[tag]
+            if fmt == "s":
+                data = b"".join(value.encode("ascii") for value in values)
+                count = len(data)
+            else:
+                data = struct.pack("<%i%s" % (len(values), fmt), *values)
+                count = len(values)
+            header.append(struct.pack(entryformat, tag, fieldtype, count))
+            if len(data) <= inline:
+                header.append(data.ljust(inline, b"\0"))
+            else:
+                # values that don't fit in the entry go after the directory
+                header.append(struct.pack(offsetformat, overflow))
+                extra.append(data)
+                overflow += len(data) + len(data) % 2
+                if len(data) % 2:
+                    extra.append(b"\0")
+        self.file.write(b"".join(header))
+        next_offset_position = self.file.tell()
+        self.file.write(struct.pack(offsetformat, 0))
+        self.file.write(b"".join(extra))
+        return next_offset_position
+
+    def close(self):
+        """Write all image directories, chained in order, and close the file."""
+        next_offset_position = 8 if self.bigtiff else 4
+        self.file.seek(0, os.SEEK_END)
+        for entries in self.images:
+            next_offset_position = self._write_directory(entries, next_offset_position)
+            self.file.seek(0, os.SEEK_END)
+        self.file.close()
+
+
+def band_tiles(bands, tilesize):
+    """Yields tile arrays from in-memory bands, band by band and row by row."""
+    for band in bands:
+        width, height = band.img.size
+        for top in xrange(0, height, tilesize):
+            for left in xrange(0, width, tilesize):
+                box = (left, top, min(left + tilesize, width), min(top + tilesize, height))
+                yield numpy.asarray(band.img.crop(box), dtype=numpy.float32)
+
+
+def to_tiled_geotiff(filepath, info, bands=None, tiles=None, width=None, height=None,
+                     bandcount=None, overviews=None, tilesize=256, compression="deflate",
+                     bigtiff=None, workers=None):
+    """
+    Write a tiled, optionally compressed float32 geotiff with any number
+    of bands. Data comes from in-memory bands, or from an iterable of tile
+    arrays (band by band, row by row within each band) together with the
+    width, height and bandcount, so the whole raster never has to be in
+    memory at once. Compression is "deflate", "lzw" or None, and tiles are
+    compressed in parallel. BigTIFF is used when the data, overviews
+    included, may pass 4 GB, unless bigtiff is set explicitly. Overviews
+    {factor: bands} are added as reduced resolution images after the full
+    resolution one. If writing fails the partial file is removed.
+    """
+    if bands is not None:
+        width, height = bands[0].img.size
+        bandcount = len(bands)
+        tiles = band_tiles(bands, tilesize)
+    elif tiles is None or not (width and height and bandcount):
+        raise Exception("Need either the bands, or tiles together with width, height and bandcount")
+    if bigtiff is None:
+        # compressed size is unknown up front, so go by the raw size of the padded
+        # tiles of every image, leaving a little room for the directories
+        images = [(width, height, bandcount)] + [ovbands[0].img.size + (len(ovbands),)
+                                                 for ovbands in (overviews or {}).values()]
+        rawbytes = sum(-(-imgwidth // tilesize) * -(-imgheight // tilesize) * tilesize**2 * imgbands * 4
+                       for imgwidth, imgheight, imgbands in images)
+        bigtiff = rawbytes > CLASSIC_MAX_BYTES - CLASSIC_MAX_BYTES // 64
+
+    writer = TiledTiffWriter(filepath, tilesize, compression, bigtiff, workers)
+    try:
+        writer.write_image(tiles, width, height, bandcount, tags=geotiff_tags(info))
+        for factor, ovbands in sorted((overviews or {}).items()):
+            ovwidth, ovheight = ovbands[0].img.size
+            writer.write_image(band_tiles(ovbands, tilesize), ovwidth, ovheight,
+                               len(ovbands), overview=True)
+    except:
+        # don't leave a truncated file behind
+        writer.file.close()
+        os.remove(filepath)
+        raise
+    writer.close()
+
+
+def create_world_file(savepath, geotrans):
+    dir, filename_and_ext = os.path.split(savepath)
+    filename, extension = os.path.splitext(filename_and_ext)
+    world_file_path = os.path.join(dir, filename) + ".wld"
+    with open(world_file_path, "w") as writer:
+        # rearrange transform coefficients and write one per line
+        xscale,xskew,xoff,yskew,yscale,yoff = geotrans
+        writer.write("\n".join(repr(float(value)) for value in [xscale,yskew,xskew,yscale,xoff,yoff]) + "\n")
+
+
+def to_ascii(bands, info, filepath, **options):
+    # create header, positioned by the lower left corner of the grid
+    width, height = bands[0].img.size
+    xscale,xskew,xoff,yskew,yscale,yoff = info["transform_coeffs"]
+    xorig = xoff + height * xskew
+    yorig = yoff + height * yscale
+    header = ""
+    header += "NCOLS %s \n"%width
+    header += "NROWS %s \n"%height
+    header += "XLLCORNER %r \n"%xorig
+    header += "YLLCORNER %r \n"%yorig
+    header += "CELLSIZE %r \n"%abs(xscale)
+    if info.get("nodata_value") is not None:
+        header += "NODATA_VALUE %r \n"%info["nodata_value"]
+    # write bands, one file each with the band number added if there are several
+    filename_root, ext = os.path.splitext(filepath)
+    for i, band in enumerate(bands):
+        newpath = filepath if len(bands) == 1 else "%s_%i%s" % (filename_root, i, ext)
+        cells = band.cells
+        with open(newpath, "w") as tempfile:
+            # write header
+            tempfile.write(header)
+            # write cells
+            for y in xrange(height):
+                row = " ".join((repr(cells[x,y]) for x in xrange(width)))+"\n"
+                tempfile.write(row)
+        # finally create world file for the geotransform
+        create_world_file(newpath, info["transform_coeffs"])
+
+
+def to_geotiff(bands, info, filepath, overviews=None, tiled=False, **options):
+    if tiled or len(bands) not in (1, 3, 4) or any(band.img.mode != "L" for band in bands):
+        # PIL can only combine 8 bit bands into one image, so stream
+        # tiles for anything else, which handles any number of float bands
+        to_tiled_geotiff(filepath, info, bands=bands, overviews=overviews, **options)
+        return
+
+    # write directly to tag info
+    PIL.TiffImagePlugin.WRITE_LIBTIFF = False
+    tags = PIL.TiffImagePlugin.ImageFileDirectory()
+    if info.get("cell_anchor"):
+        # GTRasterTypeGeoKey, aka midpoint pixels vs topleft area pixels
+        if info.get("cell_anchor") == "center":
+            # is area
+            tags[1025] = 1.0
+            tags.tagtype[1025] = 12 #double, only works with PIL patch
+        elif info.get("cell_anchor") == "nw":
+            # is point
+            tags[1025] = 2.0
+            tags.tagtype[1025] = 12 #double, only works with PIL patch
+    if info.get("transform_coeffs"):
+        # ModelTransformationTag, the affine coeffs as a 4x4 matrix
+        a, b, c, d, e, f = map(float, info["transform_coeffs"])
+        tags[34264] = (a, b, 0.0, c, d, e, 0.0, f, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 1.0)
+        tags.tagtype[34264] = 12 #double, only works with PIL patch
+    else:
+        if info.get("xy_cell") and info.get("xy_geo"):
+            # ModelTiepointTag
+            x,y = info["xy_cell"]
+            geo_x,geo_y = info["xy_geo"]
+            tags[33922] = tuple(map(float,[x,y,0,geo_x,geo_y,0]))
+            tags.tagtype[33922] = 12 #double, only works with PIL patch
+        if info.get("cellwidth") and info.get("cellheight"):
+            # ModelPixelScaleTag
+            scalex,scaley = info["cellwidth"],info["cellheight"]
+            tags[33550] = tuple(map(float,[scalex,scaley,0]))
+            tags.tagtype[33550] = 12 #double, only works with PIL patch
+    if info.get("nodata_value") is not None:
+        tags[42113] = str(info.get("nodata_value"))
+        tags.tagtype[42113] = 2 #ascii
+        
+    # finally save the file using tiffinfo headers
+    img = combine_bands(bands)
+    if overviews:
+        # embed overview levels as extra pages after the full resolution image
+        levels = [combine_bands(ovbands) for factor, ovbands in sorted(overviews.items())]
+        img.save(filepath, tiffinfo=tags, save_all=True, append_images=levels)
+    else:
         img.save(filepath, tiffinfo=tags)
 
-    elif filepath.endswith((".jpg",".jpeg",".png",".bmp",".gif")):
-        # save
-        img = combine_bands(bands)
-        img.save(filepath)
-        # write world file
-        create_world_file(filepath, info["transform_coeffs"])
+
+def to_image_file(bands, info, filepath, **options):
+    # save
+    img = combine_bands(bands)
+    img.save(filepath)
+    # write world file
+    create_world_file(filepath, info["transform_coeffs"])
 
 
+def to_file(bands, info, filepath, overviews=None, tiled=False, **options):
+    driver = drivers.registry.find(filepath, "write")
+    if not driver:
+        raise Exception(
+            "Could not save the raster to the given filepath: "
+            "the filetype extension is either missing or not supported"
+            )
+    driver.write(bands, info, filepath, overviews=overviews, tiled=tiled, **options)
@@ -0,0 +1,115 @@
+# import internals
+from collections import OrderedDict
+
+# import numpy for the vectorized reductions
+import numpy
+
+from . import rasterize
+from .. import parallel
+
+
+# raster data shared with each worker process by _init_worker
+_shared = dict()
+
+
+def _init_worker(array, valid, inv_transform_coeffs):
+    _shared["array"] = array
+    _shared["valid"] = valid
+    _shared["inv_transform_coeffs"] = inv_transform_coeffs
+
+
+def summarize(values, stats):
+    """Reduce a 1D array of cell values to the requested statistics."""
+    result = OrderedDict()
+    for stat in stats:
+        if stat == "count":
+            result[stat] = int(values.size)
+        elif not values.size:
+            result[stat] = None
+        elif stat == "sum":
+            result[stat] = float(values.sum())
+        elif stat == "mean":
+            result[stat] = float(values.mean())
+        elif stat == "min":
+            result[stat] = float(values.min())
+        elif stat == "max":
+            result[stat] = float(values.max())
+        elif stat == "std":
+            result[stat] = float(values.std())
+        elif stat == "median":
+            result[stat] = float(numpy.median(values))
+        elif stat.startswith("percentile_"):
+            result[stat] = float(numpy.percentile(values, float(stat[len("percentile_"):])))
+        else:
+            raise Exception("Unknown zonal statistic: %s" % stat)
+    return result
+
+
+def _zonal_chunk(job):
+    # module level so it can be sent to worker processes
+    features, stats = job
+    array = _shared["array"]
+    valid = _shared["valid"]
+    inv_transform_coeffs = _shared["inv_transform_coeffs"]
+    height, width = array.shape
+    results = []
+    for id, geometry, bbox in features:
+        window = rasterize.bbox_window(inv_transform_coeffs, bbox, width, height)
+        if window is None:
+            values = numpy.empty(0)
+        else:
+            colstart, rowstart, colend, rowend = window
+            inside = rasterize.polygon_mask(rasterize.polygon_rings(geometry), window,
+                                            inv_transform_coeffs)
+            inside &= valid[rowstart:rowend, colstart:colend]
+            values = array[rowstart:rowend, colstart:colend][inside]
+        results.append((id, summarize(values, stats)))
+    return results
+
+
+def valid_cells(raster_data):
+    """
+    Boolean array of the cells left unmasked by the raster's mask, by the
+    same rules but compared with the nodata value as arrays instead of
+    cell by cell: float and int cells are valid if any band has data,
+    other modes only if every band has data.
+    """
+    if hasattr(raster_data, "_cached_mask"):
+        return numpy.asarray(raster_data._cached_mask, dtype=bool)
+    nodata = raster_data.info.get("nodata_value")
+    if nodata is None:
+        return numpy.ones((raster_data.height, raster_data.width), dtype=bool)
+    hasdata = [numpy.asarray(band.img) != nodata for band in raster_data.bands]
+    if raster_data.bands[0].img.mode in ("F", "I"):
+        return numpy.logical_or.reduce(hasdata)
+    return numpy.logical_and.reduce(hasdata)
+
+
+def zonal_stats(vector_data, raster_data, stats=("count", "sum", "mean", "min", "max"),
+                band=0, chunksize=256, workers=None):
+    """
+    Summarize the raster cells whose centres fall inside each polygon feature.
+
+    Available stats are count, sum, mean, min, max, std, median and
+    percentile_<q> (eg percentile_90). Cells that are nodata in the band
+    or masked out are ignored. Features are processed in chunks on a pool of worker processes.
+    Returns an OrderedDict of feature id to an OrderedDict of stat values.
+    """
+    if vector_data.type != "Polygon":
+        raise TypeError("Zonal statistics need polygon features, not %s" % vector_data.type)
+    stats = list(stats)
+
+    array = raster_data.bands[band].to_array()
+    valid = valid_cells(raster_data)
+    nodata = raster_data.info.get("nodata_value")
+    if nodata is not None:
+        # the summarized band's own nodata cells are left out even where other bands have data
+        valid &= array != nodata
+    inv_transform_coeffs = tuple(raster_data.inv_transform_coeffs)
+
+    features = [(feat.id, feat.geometry, feat.bbox) for feat in vector_data]
+    jobs = [(chunk, stats) for chunk in parallel.chunks(features, chunksize)]
+    results = parallel.map_processes(_zonal_chunk, jobs, workers,
+                                     initializer=_init_worker,
+                                     initargs=(array, valid, inv_transform_coeffs))
+    return OrderedDict(item for chunk in results for item in chunk)
@@ -0,0 +1,29 @@
+import shutil
+import sys
+import tempfile
+import unittest
+
+from ..benchmarks import run
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_small_suite(self):
+        directory = tempfile.mkdtemp()
+        stdout = sys.stdout
+        sys.stdout = tempfile.TemporaryFile(mode="w")
+        try:
+            results = run.run("small", directory=directory, repeats=1)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+            shutil.rmtree(directory)
+        self.assertTrue(results)
+        for result in results:
+            self.assertTrue(result["seconds"] >= 0, result["name"])
+        self.assertFalse(run.compare(results, results))
+
+    def test_peak_is_per_call(self):
+        # a large call before must not raise the peak of a small one after
+        run.measure(lambda: bytearray(64 * 1048576), repeats=1)
+        seconds, peak = run.measure(lambda: bytearray(1048576), repeats=1)
+        self.assertTrue(peak < 16 * 1048576, peak)
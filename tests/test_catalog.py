@@ -0,0 +1,49 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+import PIL.Image
+
+from ..raster.catalog import RasterCatalog
+from ..raster.data import RasterData, Band
+
+EXTENT = (-120.0, 30.0, -100.0, 45.0)
+
+
+class TestCatalog(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.rasterpath = os.path.join(self.directory, "raster.tif")
+        xmin, ymin, xmax, ymax = EXTENT
+        raster = RasterData(width=32, height=16, bands=0, nodata_value=-9999.0,
+                            transform_coeffs=[(xmax - xmin) / 32.0, 0, xmin, 0, (ymin - ymax) / 16.0, ymax])
+        raster.bands = [Band.from_array(numpy.arange(32 * 16).reshape(16, 32))]
+        raster.save(self.rasterpath)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_scan(self):
+        # a plain image is skipped, a broken file is reported
+        PIL.Image.new("L", (8, 8)).save(os.path.join(self.directory, "plain.png"))
+        brokenpath = os.path.join(self.directory, "broken.tif")
+        with open(brokenpath, "wb") as writer:
+            writer.write(b"not a tiff")
+        catalog = RasterCatalog(self.directory)
+        self.assertEqual([entry["filepath"] for entry in catalog], [self.rasterpath])
+        self.assertEqual([filepath for filepath, err in catalog.errors], [brokenpath])
+
+    def test_mosaic_nodata(self):
+        catalog = RasterCatalog(self.directory)
+        # twice as wide as the raster, so the right half has no data
+        xmin, ymin, xmax, ymax = EXTENT
+        bbox = xmin, ymax, xmax + (xmax - xmin), ymin
+        mosaic, mask = catalog.mosaic(bbox, 64, 16)
+        self.assertEqual(mosaic.info["nodata_value"], -9999.0)
+        self.assertEqual(mosaic.bands[0].cells[60, 8], -9999.0)
+        self.assertEqual(mask.getpixel((60, 8)), 0)
+
+        mosaic, mask = catalog.mosaic(bbox, 64, 16, nodata_value=-1.0)
+        self.assertEqual(mosaic.bands[0].cells[60, 8], -1.0)
@@ -0,0 +1,38 @@
+import shutil
+import tempfile
+import unittest
+
+from ..benchmarks import generate
+from ..raster import drivers as raster_drivers
+from ..raster import loader
+from ..vector import drivers as vector_drivers
+
+
+class TestNodataTag(unittest.TestCase):
+    def test_string_and_tuple(self):
+        self.assertEqual(loader.parse_nodata("-9999.0\0"), -9999.0)
+        self.assertEqual(loader.parse_nodata(("-9999",)), -9999.0)
+        self.assertEqual(loader.parse_nodata(" 0 "), 0.0)
+        self.assertEqual(loader.parse_nodata("\0"), None)
+
+    def test_read_generated_geotiff(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = generate.raster_file(directory, 32, 16)
+            info, bands, crs = loader.from_file(path)
+            self.assertEqual(info["nodata_value"], -9999.0)
+            self.assertEqual(bands[0][0].size, (32, 16))
+        finally:
+            shutil.rmtree(directory)
+
+
+class TestCapabilities(unittest.TestCase):
+    def test_builtin_readers_load_whole_files(self):
+        for registry in (raster_drivers.registry, vector_drivers.registry):
+            for driver in registry:
+                self.assertFalse(driver.streaming or driver.windowed, driver)
+
+    def test_find(self):
+        self.assertEqual(raster_drivers.registry.find("A.TIF").name, "geotiff")
+        self.assertEqual(vector_drivers.registry.find("a.geojson", "write").name, "geojson")
+        self.assertEqual(vector_drivers.registry.find("a.xyz"), None)
@@ -0,0 +1,113 @@
+import math
+import unittest
+
+import numpy
+
+from ..raster import focal
+from ..raster.data import RasterData, Band
+
+
+def brute_statistic(array, operation, size, kernel=None):
+    height, width = array.shape
+    halo = size // 2
+    output = numpy.full(array.shape, numpy.nan)
+    for row in range(height):
+        for col in range(width):
+            if math.isnan(array[row, col]):
+                continue
+            values, weights = [], []
+            for rowoffset in range(-halo, halo + 1):
+                for coloffset in range(-halo, halo + 1):
+                    r, c = row + rowoffset, col + coloffset
+                    if 0 <= r < height and 0 <= c < width and not math.isnan(array[r, c]):
+                        values.append(array[r, c])
+                        if kernel is not None:
+                            weights.append(kernel[rowoffset + halo][coloffset + halo])
+            if operation == "mean":
+                output[row, col] = sum(values) / len(values)
+            elif operation == "min":
+                output[row, col] = min(values)
+            elif operation == "max":
+                output[row, col] = max(values)
+            elif operation == "sum":
+                output[row, col] = sum(values)
+            elif operation == "std":
+                output[row, col] = numpy.std(values)
+            elif operation == "kernel":
+                output[row, col] = sum(v * w for v, w in zip(values, weights))
+    return output
+
+
+def brute_terrain(array, operation, cellwidth, cellheight):
+    height, width = array.shape
+    output = numpy.full(array.shape, numpy.nan)
+    for row in range(height):
+        for col in range(width):
+            centre = array[row, col]
+            if math.isnan(centre):
+                continue
+
+            def z(rowoffset, coloffset):
+                r, c = row + rowoffset, col + coloffset
+                if 0 <= r < height and 0 <= c < width and not math.isnan(array[r, c]):
+                    return array[r, c]
+                return centre
+            dzdx = ((z(-1, 1) + 2 * z(0, 1) + z(1, 1)) - (z(-1, -1) + 2 * z(0, -1) + z(1, -1))) / (8.0 * cellwidth)
+            dzdy = ((z(1, -1) + 2 * z(1, 0) + z(1, 1)) - (z(-1, -1) + 2 * z(-1, 0) + z(-1, 1))) / (8.0 * cellheight)
+            if operation == "slope":
+                output[row, col] = math.degrees(math.atan(math.hypot(dzdx, dzdy)))
+            elif dzdx == 0 and dzdy == 0:
+                output[row, col] = -1.0
+            else:
+                downslope = math.degrees(math.atan2(dzdy, -dzdx))
+                output[row, col] = (90.0 - downslope) % 360.0
+    return output
+
+
+class TestFocal(unittest.TestCase):
+    def setUp(self):
+        rand = numpy.random.RandomState(0)
+        self.array = rand.rand(11, 9) * 100
+        self.array[4, 3:6] = numpy.nan
+        self.array[0, 8] = numpy.nan
+
+    def assertSame(self, result, expected):
+        self.assertTrue(numpy.array_equal(numpy.isnan(result), numpy.isnan(expected)))
+        valid = ~numpy.isnan(expected)
+        self.assertTrue(numpy.allclose(result[valid], expected[valid]))
+
+    def test_statistics(self):
+        # tiles smaller than the raster, so the halos cross the tile seams
+        for operation in ("mean", "min", "max", "sum", "std"):
+            for size in (3, 5):
+                expected = brute_statistic(self.array, operation, size)
+                for workers in (1, 2):
+                    result = focal.focal(self.array, operation, size=size, tilesize=4, workers=workers)
+                    self.assertSame(result, expected)
+
+    def test_kernel(self):
+        kernel = [[0, 1, 0], [1, -4, 1], [0, 1, 0]]
+        result = focal.focal(self.array, "kernel", kernel=kernel, tilesize=4, workers=2)
+        self.assertSame(result, brute_statistic(self.array, "kernel", 3, kernel))
+
+    def test_terrain(self):
+        for operation in ("slope", "aspect"):
+            expected = brute_terrain(self.array, operation, 2.0, 3.0)
+            for tilesize in (4, 5, 512):
+                result = focal.focal(self.array, operation, cellsize=(2.0, -3.0), tilesize=tilesize, workers=2)
+                self.assertSame(result, expected)
+
+    def test_flat_aspect(self):
+        result = focal.focal(numpy.ones((5, 5)), "aspect", tilesize=2)
+        self.assertTrue((result == -1.0).all())
+
+    def test_raster_nodata(self):
+        raster = RasterData(width=9, height=11, bands=0, nodata_value=-9999.0,
+                            transform_coeffs=[2.0, 0, 0.0, 0, -3.0, 33.0])
+        raster.bands = [Band.from_array(self.array.astype(numpy.float32), nodata=-9999.0)]
+        result = raster.focal("slope", tilesize=4, workers=2)
+        array = numpy.asarray(result.bands[0].img)
+        expected = brute_terrain(raster.bands[0].to_array(-9999.0), "slope", 2.0, 3.0)
+        self.assertTrue(((array == -9999.0) == numpy.isnan(expected)).all())
+        valid = ~numpy.isnan(expected)
+        self.assertTrue(numpy.allclose(array[valid], expected[valid], atol=1e-4))
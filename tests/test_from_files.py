@@ -0,0 +1,43 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ..vector import saver
+from ..vector.data import VectorData
+
+
+def points(xs):
+    return [{"type": "Point", "coordinates": (x, 0.0)} for x in xs]
+
+
+class TestFromFiles(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # the second file lacks the kind field and adds a zone field
+        files = [(["name", "kind"], [["a", "road"], ["b", "rail"]]),
+                 (["zone", "name"], [["north", "c"]]),
+                 (["name", "kind"], [["d", "path"]])]
+        self.filepaths = []
+        for i, (fields, rows) in enumerate(files):
+            filepath = os.path.join(self.directory, "part%i.shp" % i)
+            saver.to_file(fields, rows, points(range(len(rows))), filepath)
+            self.filepaths.append(filepath)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_merged_schema(self):
+        for workers in (1, 2):
+            merged = VectorData.from_files(self.filepaths, workers=workers)
+            self.assertEqual(merged.fields, ["name", "kind", "zone"])
+            self.assertEqual([feat.row for feat in merged],
+                             [["a", "road", ""], ["b", "rail", ""], ["c", "", "north"],
+                              ["d", "path", ""]])
+            self.assertEqual(len(list(merged.spindex.intersection((0, 0, 0, 0)))), 3)
+
+    def test_same_schema(self):
+        merged = VectorData.from_files([self.filepaths[0], self.filepaths[2]])
+        self.assertEqual(merged.fields, ["name", "kind"])
+        self.assertEqual([feat.row for feat in merged],
+                         [["a", "road"], ["b", "rail"], ["d", "path"]])
@@ -0,0 +1,39 @@
+import shutil
+import tempfile
+import unittest
+
+from .. import instrument
+from ..benchmarks import generate
+from ..vector import loader
+from ..vector.data import VectorData
+
+
+class TestInstrument(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filepath = generate.vector_file(self.directory, "Point", 50, ".shp")
+
+    def tearDown(self):
+        instrument.disable()
+        shutil.rmtree(self.directory)
+
+    def test_shapefile_stages(self):
+        fields, rows, geometries, crs = loader.from_file(self.filepath)
+        sink = instrument.enable()
+        self.assertEqual(loader.from_file(self.filepath), (fields, rows, geometries, crs))
+        # parsing and decoding are timed apart
+        for name in ("vector.loader.parse_records", "vector.loader.decode"):
+            self.assertEqual(sink.stats[name]["calls"], 1)
+            self.assertEqual(sink.stats[name]["items"], 50)
+
+    def test_index_queries(self):
+        data = VectorData(self.filepath)
+        data.create_spatial_index()
+        bbox = generate.EXTENT
+        expected = [feat.id for feat in data.quick_overlap(bbox)]
+        self.assertEqual(len(expected), 50)
+        sink = instrument.enable()
+        self.assertEqual([feat.id for feat in data.quick_overlap(bbox)], expected)
+        self.assertEqual(len(list(data.quick_nearest(bbox, n=3))), 3)
+        self.assertEqual(sink.stats["vector.index.query"]["items"], 50)
+        self.assertEqual(sink.stats["vector.index.nearest"]["items"], 3)
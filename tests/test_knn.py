@@ -0,0 +1,62 @@
+import random
+import unittest
+
+import shapely.geometry
+
+from ..vector.data import VectorData
+
+
+class TestNearest(unittest.TestCase):
+    def setUp(self):
+        rand = random.Random(0)
+        self.layer = VectorData()
+        for _ in range(300):
+            x, y = rand.uniform(0, 100), rand.uniform(0, 100)
+            size = rand.uniform(0.1, 3)
+            self.layer.add_feature([], {"type": "Polygon", "coordinates": [
+                [(x, y), (x + size, y), (x + size, y + size * 2), (x, y)]]})
+        self.queries = [(rand.uniform(-10, 110), rand.uniform(-10, 110)) for _ in range(200)]
+
+    def brute_force(self, queries, k, max_distance=None):
+        shapes = [(shapely.geometry.shape(feat.geometry), feat.id) for feat in self.layer]
+        return [self.brute_force_one(query, shapes, k, max_distance) for query in queries]
+
+    def brute_force_one(self, query, shapes, k, max_distance):
+        point = shapely.geometry.Point(query)
+        found = sorted((point.distance(shape), id) for shape, id in shapes)
+        if max_distance is not None:
+            found = [item for item in found if item[0] <= max_distance]
+        return found[:k]
+
+    def check(self, results, expected):
+        self.assertEqual(len(results), len(expected))
+        for found, wanted in zip(results, expected):
+            self.assertEqual([feat.id for feat, distance in found], [id for distance, id in wanted])
+            for (feat, distance), (wanted_distance, id) in zip(found, wanted):
+                self.assertAlmostEqual(distance, wanted_distance)
+
+    def test_nearest(self):
+        for workers in (1, 3):
+            results = self.layer.nearest(self.queries, k=5, batchsize=16, workers=workers)
+            self.check(results, self.brute_force(self.queries, 5))
+
+    def test_within(self):
+        for workers in (1, 3):
+            results = self.layer.nearest(self.queries, k=3, max_distance=4.0, batchsize=16, workers=workers)
+            self.check(results, self.brute_force(self.queries, 3, 4.0))
+
+    def test_single(self):
+        found = self.layer.nearest((50, 50), k=2)
+        self.check([found], self.brute_force([(50, 50)], 2))
+
+    def test_candidates_run_out(self):
+        # thin slivers whose bboxes all cover the queries, so every round of
+        # candidates by bbox is exhausted before the exact search can stop
+        self.layer = VectorData()
+        for i in range(40):
+            offset = i * 0.5
+            self.layer.add_feature([], {"type": "Polygon", "coordinates": [
+                [(offset, 0), (offset + 100, 100), (offset + 100.1, 100), (offset, 0)]]})
+        queries = [(60, 10), (20, 80), (99, 1)]
+        results = self.layer.nearest(queries, k=2, batchsize=2, workers=2)
+        self.check(results, self.brute_force(queries, 2))
@@ -0,0 +1,98 @@
+import random
+import unittest
+
+import shapely.geometry
+import shapely.ops
+
+from ..vector.data import VectorData
+
+
+def square(x, y, size):
+    return {"type": "Polygon", "coordinates": [
+        [(x, y), (x + size, y), (x + size, y + size), (x, y + size), (x, y)]]}
+
+
+class TestOverlay(unittest.TestCase):
+    def setUp(self):
+        # a mask layer of two squares sharing an edge, with a gap beside them
+        self.mask = VectorData()
+        self.mask.fields = ["mask"]
+        self.mask.add_feature(["a"], square(0, 0, 10))
+        self.mask.add_feature(["b"], square(10, 0, 10))
+        self.mask.add_feature(["c"], square(30, 0, 10))
+
+        self.layer = VectorData()
+        self.layer.fields = ["name"]
+        # wholly inside, crossing the shared edge, crossing the outer boundary
+        self.layer.add_feature(["inside"], square(2, 2, 3))
+        self.layer.add_feature(["shared edge"], square(8, 4, 4))
+        self.layer.add_feature(["crossing"], square(17, 5, 6))
+        # touching the mask along an edge or at a corner without overlapping
+        self.layer.add_feature(["edge"], square(20, 2, 5))
+        self.layer.add_feature(["corner"], square(40, 10, 2))
+        self.layer.add_feature(["outside"], square(50, 50, 2))
+        rand = random.Random(0)
+        for i in range(30):
+            self.layer.add_feature(["random%d" % i],
+                                   square(rand.uniform(-5, 45), rand.uniform(-5, 15),
+                                          rand.uniform(0.5, 8)))
+
+    def shapes(self, layer):
+        return [(feat.row, shapely.geometry.shape(feat.geometry)) for feat in layer]
+
+    def check(self, result, expected):
+        found = self.shapes(result)
+        self.assertEqual([row for row, geom in found], [row for row, geom in expected])
+        for (row, geom), (row, wanted) in zip(found, expected):
+            self.assertEqual(geom.geom_type.replace("Multi", ""), "Polygon")
+            self.assertAlmostEqual(geom.symmetric_difference(wanted).area, 0)
+
+    def overlaid(self, operation):
+        union = shapely.ops.unary_union([geom for row, geom in self.shapes(self.mask)])
+        expected = []
+        for row, geom in self.shapes(self.layer):
+            result = getattr(geom, operation)(union)
+            if result.area > 0:
+                expected.append((row, result))
+        return expected
+
+    def test_clip(self):
+        expected = self.overlaid("intersection")
+        self.assertNotIn(["edge"], [row for row, geom in expected])
+        for workers in (1, 2):
+            self.check(self.layer.clip(self.mask, chunksize=4, workers=workers), expected)
+
+    def test_difference(self):
+        expected = self.overlaid("difference")
+        self.assertIn(["edge"], [row for row, geom in expected])
+        for workers in (1, 2):
+            self.check(self.layer.difference(self.mask, chunksize=4, workers=workers), expected)
+
+    def test_intersection(self):
+        expected = []
+        for row, geom in self.shapes(self.layer):
+            for otherrow, other in self.shapes(self.mask):
+                result = geom.intersection(other)
+                if result.area > 0:
+                    expected.append((row + otherrow, result))
+        for workers in (1, 2):
+            result = self.layer.intersection(self.mask, chunksize=4, workers=workers)
+            self.assertEqual(result.fields, ["name", "mask"])
+            self.check(result, expected)
+
+    def test_lines(self):
+        lines = VectorData()
+        lines.fields = ["name"]
+        lines.add_feature(["through"], {"type": "LineString", "coordinates": [(-5, 5), (45, 5)]})
+        lines.add_feature(["along"], {"type": "LineString", "coordinates": [(0, 10), (20, 10)]})
+        lines.add_feature(["away"], {"type": "LineString", "coordinates": [(0, 20), (20, 30)]})
+        result = lines.intersection(self.mask, workers=2)
+        self.assertEqual(result.type, "LineString")
+        mask = self.shapes(self.mask)
+        expected = [(row + otherrow, geom.intersection(other))
+                    for row, geom in self.shapes(lines) for otherrow, other in mask
+                    if geom.intersection(other).length > 0]
+        found = self.shapes(result)
+        self.assertEqual([row for row, geom in found], [row for row, geom in expected])
+        for (row, geom), (row, wanted) in zip(found, expected):
+            self.assertAlmostEqual(geom.symmetric_difference(wanted).length, 0)
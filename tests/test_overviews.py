@@ -0,0 +1,44 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ..raster.data import RasterData
+
+
+class TestOverviewRoundTrip(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def raster(self):
+        raster = RasterData(width=40, height=30, bands=1, nodata_value=-9999.0,
+                            transform_coeffs=[1.0, 0, 10.0, 0, -1.0, 50.0])
+        raster.build_overviews((2, 4))
+        return raster
+
+    def check(self, filepath):
+        rr = RasterData(filepath)
+        self.assertEqual(sorted(rr.overviews), [2, 4])
+        self.assertEqual(list(rr.info["transform_coeffs"]), [1.0, 0, 10.0, 0, -1.0, 50.0])
+        self.assertEqual(rr.info["nodata_value"], -9999.0)
+
+    def test_embedded(self):
+        filepath = os.path.join(self.directory, "embedded.tif")
+        self.raster().save(filepath, overviews=True)
+        self.check(filepath)
+
+    def test_embedded_tiled(self):
+        filepath = os.path.join(self.directory, "tiled.tif")
+        self.raster().save(filepath, overviews=True, tiled=True)
+        self.check(filepath)
+
+    def test_sidecar(self):
+        filepath = os.path.join(self.directory, "sidecar.tif")
+        raster = self.raster()
+        raster.save(filepath)
+        raster.save_overviews(filepath)
+        self.assertTrue(os.path.exists(filepath + ".ovr"))
+        self.check(filepath)
@@ -0,0 +1,71 @@
+import unittest
+
+import numpy
+import PIL.Image
+
+from .. import parallel
+from ..raster.cache import RenderCache
+from ..raster.data import RasterData, Band
+
+
+class TestThreadPool(unittest.TestCase):
+    def tearDown(self):
+        parallel.set_workers(None)
+
+    def test_shared_pool(self):
+        self.assertEqual(parallel.map_threads(lambda x: x * 2, range(10), 3), range(0, 20, 2))
+        pool = parallel.thread_pool(3)
+        parallel.map_threads(abs, range(10), 3)
+        self.assertTrue(parallel.thread_pool(3) is pool)
+        # only a different worker count builds a new pool
+        parallel.set_workers(2)
+        self.assertFalse(parallel.thread_pool() is pool)
+        self.assertTrue(parallel.thread_pool(2) is parallel.thread_pool())
+
+    def test_nested(self):
+        # a map from inside the pool runs in that thread instead of waiting on the pool
+        results = parallel.map_threads(lambda x: parallel.map_threads(lambda y: x * y, range(3), 2),
+                                       range(4), 2)
+        self.assertEqual(results, [[0, x, 2 * x] for x in range(4)])
+
+    def test_tiled_render_matches_serial(self):
+        raster = RasterData(width=100, height=80, bands=0, nodata_value=-9999.0,
+                            transform_coeffs=[0.3, 0, -120.7, 0, -0.3, 45.1])
+        array = numpy.random.RandomState(0).rand(80, 100).astype(numpy.float32)
+        array[10:20, 30:60] = -9999.0
+        raster.bands = [Band(img, img.load()) for img in
+                        (PIL.Image.fromarray(array, "F"), PIL.Image.fromarray(array * 2, "F"))]
+        bbox = -119.0, 44.0, -100.0, 28.0
+        views = [raster.positioned(70, 50, bbox, resample="bilinear", tiled=True, tilesize=16,
+                                   cache=RenderCache(), workers=workers) for workers in (1, 4)]
+        (serial, serialmask), (threaded, threadedmask) = views
+        self.assertEqual(serial.transform_coeffs, threaded.transform_coeffs)
+        self.assertEqual(list(serialmask.getdata()), list(threadedmask.getdata()))
+        for band, threadedband in zip(serial.bands, threaded.bands):
+            self.assertTrue(numpy.array_equal(numpy.asarray(band.img), numpy.asarray(threadedband.img)))
+
+
+class TestProcessPool(unittest.TestCase):
+    def test_shared_pool(self):
+        self.assertEqual(parallel.map_processes(abs, range(-5, 5), 2), map(abs, range(-5, 5)))
+        pool = parallel.process_pool(2)
+        parallel.map_processes(abs, range(-5, 5), 2)
+        self.assertTrue(parallel.process_pool(2) is pool)
+
+    def test_initializer(self):
+        # gets a pool of its own, so each call can share different data with its workers
+        for offset in (1, 2):
+            results = parallel.map_processes(_shared_offset, range(6), 2,
+                                             initializer=_set_offset, initargs=(offset,))
+            self.assertEqual(results, [x + offset for x in range(6)])
+
+
+_offset = []
+
+
+def _set_offset(offset):
+    _offset[:] = [offset]
+
+
+def _shared_offset(x):
+    return x + _offset[0]
@@ -0,0 +1,44 @@
+import unittest
+
+import numpy
+import shapely.geometry
+
+from ..raster import polygonize
+
+
+# regions that touch themselves or each other diagonally
+CASES = [
+    [[1, 1, 1, 1], [1, 0, 1, 1], [1, 1, 0, 1], [1, 1, 1, 1]],
+    [[0, 1, 1], [1, 0, 1], [1, 1, 1]],
+    [[1, 0], [0, 1]],
+    [[1, 0, 1], [0, 1, 0], [1, 0, 1]],
+    [[1, 1, 1, 1, 1], [1, 0, 0, 0, 1], [1, 0, 1, 0, 1], [1, 0, 0, 1, 1], [1, 1, 1, 1, 1]],
+    [[2, 2, 0, 0], [2, 1, 1, 0], [0, 1, 1, 2], [0, 0, 2, 2]],
+    ]
+
+
+class TestPolygonize(unittest.TestCase):
+    def shapes(self, values, connectivity):
+        values = numpy.array(values)
+        valid = numpy.ones(values.shape, dtype=bool)
+        for value, polygons in polygonize.polygonize(values, valid, connectivity):
+            for rings in polygons:
+                yield value, shapely.geometry.Polygon(rings[0], rings[1:])
+
+    def test_valid(self):
+        for values in CASES:
+            for connectivity in (4, 8):
+                shapes = list(self.shapes(values, connectivity))
+                for value, shape in shapes:
+                    self.assertTrue(shape.is_valid, (values, connectivity, shape.wkt))
+                # together the polygons cover every cell exactly once
+                self.assertEqual(sum(shape.area for value, shape in shapes), numpy.size(values))
+                for value in numpy.unique(values):
+                    area = sum(shape.area for shapevalue, shape in shapes if shapevalue == value)
+                    self.assertEqual(area, numpy.sum(numpy.array(values) == value))
+
+    def test_pinched_hole(self):
+        shapes = list(self.shapes(CASES[0], 4))
+        ones = [shape for value, shape in shapes if value == 1]
+        self.assertEqual(len(ones), 1)
+        self.assertEqual(len(ones[0].interiors), 2)
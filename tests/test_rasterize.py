@@ -0,0 +1,134 @@
+import unittest
+
+import numpy
+
+from ..raster import rasterize
+
+# 1 unit cells with the top left corner at (0, 12)
+INVERSE = (1.0, 0.0, 0.0, 0.0, -1.0, 12.0)
+SIZE = 12
+
+# a polygon with a hole, vertices kept off cell centres and edges
+OUTER = [(0.7, 1.3), (10.6, 0.8), (11.2, 9.7), (5.3, 11.4), (1.2, 7.6), (0.7, 1.3)]
+HOLE = [(3.8, 3.4), (7.7, 4.2), (6.9, 7.8), (3.6, 6.3), (3.8, 3.4)]
+POLYGON = {"type": "Polygon", "coordinates": [OUTER, HOLE]}
+
+
+def pixel_ring(ring):
+    return [(x, SIZE - y) for x, y in ring]
+
+
+def brute_inside(rings, x, y):
+    # even-odd ray casting over every ring
+    inside = False
+    for ring in rings:
+        for (x0, y0), (x1, y1) in zip(ring[:-1], ring[1:]):
+            if (y0 > y) != (y1 > y):
+                if x < x0 + (y - y0) * (x1 - x0) / (y1 - y0):
+                    inside = not inside
+    return inside
+
+
+def brute_polygon(rings):
+    rings = [pixel_ring(ring) for ring in rings]
+    return numpy.array([[brute_inside(rings, col + 0.5, row + 0.5) for col in range(SIZE)]
+                        for row in range(SIZE)])
+
+
+def brute_touched(line):
+    # cells whose interior a segment passes through, by clipping to each cell
+    touched = numpy.zeros((SIZE, SIZE), dtype=bool)
+    line = pixel_ring(line)
+    for (x0, y0), (x1, y1) in zip(line[:-1], line[1:]):
+        for row in range(SIZE):
+            for col in range(SIZE):
+                tmin, tmax = 0.0, 1.0
+                for p0, d, low in ((x0, x1 - x0, col), (y0, y1 - y0, row)):
+                    if d == 0:
+                        if not low < p0 < low + 1:
+                            tmax = -1.0
+                        continue
+                    ta, tb = sorted(((low - p0) / d, (low + 1 - p0) / d))
+                    tmin, tmax = max(tmin, ta), min(tmax, tb)
+                touched[row, col] |= tmax > tmin
+    return touched
+
+
+def cell_array(rows, cols):
+    array = numpy.zeros((SIZE, SIZE), dtype=bool)
+    array[rows, cols] = True
+    return array
+
+
+class TestPolygonMask(unittest.TestCase):
+    def test_hole(self):
+        window = (0, 0, SIZE, SIZE)
+        mask = rasterize.polygon_mask([OUTER, HOLE], window, INVERSE)
+        expected = brute_polygon([OUTER, HOLE])
+        self.assertTrue((mask == expected).all())
+        # the hole is left empty
+        self.assertFalse(mask[7, 5])
+        self.assertTrue(mask[9, 5])
+
+    def test_window(self):
+        window = (2, 3, 9, 10)
+        mask = rasterize.polygon_mask([OUTER, HOLE], window, INVERSE)
+        expected = brute_polygon([OUTER, HOLE])[3:10, 2:9]
+        self.assertTrue((mask == expected).all())
+
+
+class TestLineCells(unittest.TestCase):
+    line = [(0.3, 0.6), (4.7, 2.2), (9.4, 11.3), (11.6, 6.1), (2.2, 5.9)]
+
+    def test_supercover(self):
+        rows, cols = rasterize.line_cells([self.line], INVERSE, all_touched=True)
+        self.assertTrue((cell_array(rows, cols) == brute_touched(self.line)).all())
+
+    def test_default(self):
+        rows, cols = rasterize.line_cells([self.line], INVERSE)
+        cells = cell_array(rows, cols)
+        # every cell lies on the line and the vertices are always taken
+        self.assertFalse((cells & ~brute_touched(self.line)).any())
+        for x, y in self.line:
+            self.assertTrue(cells[int(SIZE - y), int(x)])
+
+
+class TestBurn(unittest.TestCase):
+    shapes = [(POLYGON, (0.7, 0.8, 11.2, 11.4), 1.0),
+              ({"type": "LineString", "coordinates": [(0.4, 5.5), (11.5, 6.6)]},
+               (0.4, 5.5, 11.5, 6.6), 2.0),
+              ({"type": "Point", "coordinates": (5.5, 5.5)}, (5.5, 5.5, 5.5, 5.5), 3.0)]
+
+    def burned(self, **kwargs):
+        array = numpy.zeros((SIZE, SIZE), dtype=numpy.float32)
+        return rasterize.burn(array, self.shapes, INVERSE, **kwargs)
+
+    def test_polygon(self):
+        array = rasterize.burn(numpy.zeros((SIZE, SIZE), dtype=numpy.float32),
+                               self.shapes[:1], INVERSE, stripheight=5, workers=3)
+        self.assertTrue(((array == 1) == brute_polygon([OUTER, HOLE])).all())
+
+    def test_polygon_all_touched(self):
+        array = rasterize.burn(numpy.zeros((SIZE, SIZE), dtype=numpy.float32),
+                               self.shapes[:1], INVERSE, all_touched=True, stripheight=5,
+                               workers=3)
+        expected = brute_polygon([OUTER, HOLE]) | brute_touched(OUTER) | brute_touched(HOLE)
+        self.assertTrue(((array == 1) == expected).all())
+
+    def test_strips_match_serial(self):
+        # strip boundaries cross the polygon, its hole and the line
+        serial = self.burned(workers=1)
+        for stripheight in (1, 4, 5):
+            for all_touched in (False, True):
+                self.assertTrue((self.burned(stripheight=stripheight, workers=3,
+                                             all_touched=all_touched) ==
+                                 self.burned(workers=1, all_touched=all_touched)).all())
+        # later shapes overwrite earlier ones
+        self.assertEqual(serial[6, 5], 3.0)
+        self.assertEqual(serial[6, 0], 2.0)
+
+    def test_outside(self):
+        shapes = [({"type": "Polygon", "coordinates": [[(20, 20), (30, 20), (30, 30), (20, 20)]]},
+                   (20, 20, 30, 30), 1.0)]
+        array = rasterize.burn(numpy.zeros((SIZE, SIZE), dtype=numpy.float32), shapes, INVERSE)
+        self.assertFalse(array.any())
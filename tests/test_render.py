@@ -0,0 +1,43 @@
+import unittest
+
+import numpy
+import PIL.Image
+
+from ..raster.cache import RenderCache
+from ..raster.data import RasterData, Band
+
+
+class TestTiledRender(unittest.TestCase):
+    def setUp(self):
+        # an origin and resolution that aren't round numbers
+        self.raster = RasterData(width=100, height=80, bands=0, nodata_value=-9999.0,
+                                 transform_coeffs=[0.3, 0, -120.7, 0, -0.3, 45.1])
+        array = numpy.arange(100 * 80, dtype=numpy.float32).reshape(80, 100)
+        img = PIL.Image.fromarray(array, "F")
+        self.raster.bands = [Band(img, img.load())]
+
+    def view(self, xoffset, yoffset, cache):
+        xleft, ytop = -120.7 + xoffset, 45.1 + yoffset
+        bbox = xleft, ytop, xleft + 0.3 * 40, ytop - 0.3 * 30
+        return self.raster.positioned(40, 30, bbox, tiled=True, tilesize=16, cache=cache)[0]
+
+    def test_panned_views_hit_cache(self):
+        cache = RenderCache()
+        first = self.view(0.35, -0.5, cache)
+        rendered = len(cache)
+        self.assertTrue(rendered > 0)
+        # panning a little within the same tiles renders nothing new
+        second = self.view(0.05, -0.2, cache)
+        self.assertEqual(len(cache), rendered)
+        # panning further only renders the newly covered tiles
+        self.view(0.35 + 0.3 * 16, -0.5, cache)
+        self.assertTrue(rendered < len(cache) < rendered * 2)
+
+    def test_view_matches_grid(self):
+        view = self.view(0.35, -0.5, RenderCache())
+        a, b, c, d, e, f = view.transform_coeffs
+        # snapped onto whole cells of the raster, so the values are the raster's own
+        col, row = int(round((c + 120.7) / 0.3)), int(round((45.1 - f) / 0.3))
+        self.assertEqual((col, row), (1, 2))
+        expected = numpy.asarray(self.raster.bands[0].img)[row:row + 30, col:col + 40]
+        self.assertTrue((numpy.asarray(view.bands[0].img) == expected).all())
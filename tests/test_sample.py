@@ -0,0 +1,61 @@
+import unittest
+
+import numpy
+import PIL.Image
+
+from ..raster.data import RasterData, Band
+from ..vector.data import VectorData
+
+
+class TestSample(unittest.TestCase):
+    def setUp(self):
+        # cell centres at x = col + 0.5, y = 3.5 - row
+        self.raster = RasterData(width=4, height=4, bands=0, nodata_value=-9999.0,
+                                 transform_coeffs=[1.0, 0, 0.0, 0, -1.0, 4.0])
+        array = numpy.arange(16, dtype=numpy.float32).reshape(4, 4)
+        array[1, 1] = -9999.0
+        self.raster.bands = [Band.from_array(array), Band.from_array(array * 2)]
+
+    def test_nearest(self):
+        values = self.raster.sample([0.5, 1.5, 3.5, 9.0], [3.5, 2.5, 0.5, 0.0], bands=1)
+        self.assertTrue(numpy.allclose(values[[0, 2]], [0.0, 30.0]))
+        # only the first band is nodata there, so the cell isn't masked
+        self.assertEqual(values[1], -19998.0)
+        self.assertTrue(numpy.isnan(values[3]))
+        values = self.raster.sample([1.5], [2.5], bands=0)
+        self.assertEqual(values[0], -9999.0)
+
+    def test_masked(self):
+        self.raster.bands[1] = Band.from_array(numpy.asarray(self.raster.bands[0].img))
+        for method in ("nearest", "bilinear"):
+            values = self.raster.sample([1.5, 2.5], [2.5, 0.5], method=method)
+            self.assertEqual(values.shape, (2, 2))
+            self.assertTrue(numpy.isnan(values[:, 0]).all())
+            self.assertFalse(numpy.isnan(values[:, 1]).any())
+        # same as through the full raster mask
+        self.raster.mask
+        self.assertTrue(numpy.isnan(self.raster.sample([1.5], [2.5], bands=0)[0]))
+
+    def test_byte_bands(self):
+        # like the mask, 8 bit cells need data in every band
+        first = numpy.arange(16, dtype=numpy.uint8).reshape(4, 4)
+        second = first.copy()
+        first[1, 1] = 255
+        self.raster.info["nodata_value"] = 255
+        self.raster.bands = [Band(img, img.load()) for img in
+                             (PIL.Image.fromarray(first), PIL.Image.fromarray(second))]
+        values = self.raster.sample([1.5, 2.5], [2.5, 2.5], bands=1)
+        self.assertTrue(numpy.isnan(values[0]))
+        self.assertEqual(values[1], 6.0)
+
+    def test_features(self):
+        points = VectorData()
+        points.add_feature([], {"type": "Point", "coordinates": (0.5, 3.5)})
+        points.add_feature([], {"type": "MultiPoint", "coordinates": [(0.5, 0.5), (1.5, 0.5)]})
+        points.add_feature([], {"type": "Point", "coordinates": (3.5, 0.5)})
+        values = self.raster.sample(points, bands=0)
+        self.assertEqual(len(values), 3)
+        self.assertEqual(values[0], 0.0)
+        self.assertTrue(numpy.isnan(values[1]))
+        self.assertEqual(values[2], 15.0)
+        self.assertEqual(self.raster.sample(points).shape, (2, 3))
@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+import PIL.Image
+
+from ..raster import saver
+from ..raster.data import RasterData, Band
+
+
+class TestGeotiffRoundTrip(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def roundtrip(self, arrays, **options):
+        raster = RasterData(width=40, height=30, bands=0, nodata_value=-9999.0,
+                            transform_coeffs=[1.0, 0, 10.0, 0, -1.0, 50.0])
+        raster.bands = [Band.from_array(array) for array in arrays]
+        filepath = os.path.join(self.directory, "roundtrip.tif")
+        raster.save(filepath, **options)
+        loaded = RasterData(filepath)
+        self.assertEqual(len(loaded.bands), len(arrays))
+        self.assertEqual(loaded.info["nodata_value"], -9999.0)
+        return [band.to_array() for band in loaded.bands]
+
+    def test_three_float_bands(self):
+        arrays = [numpy.random.RandomState(seed).rand(30, 40).astype(numpy.float32) for seed in xrange(3)]
+        for options in (dict(), dict(tiled=True, compression="lzw"), dict(tiled=True, bigtiff=True)):
+            for loaded, array in zip(self.roundtrip(arrays, **options), arrays):
+                self.assertTrue(numpy.allclose(loaded, array))
+
+    def test_three_byte_bands(self):
+        arrays = [numpy.random.RandomState(seed).randint(0, 256, (30, 40)).astype(numpy.uint8) for seed in xrange(3)]
+        for loaded, array in zip(self.roundtrip(arrays), arrays):
+            self.assertTrue(numpy.array_equal(loaded, array))
+
+
+class TestBigtiffChoice(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.directory, "nearlimit.tif")
+        self.raster = RasterData(width=64, height=64, bands=0, nodata_value=-9999.0,
+                                 transform_coeffs=[1.0, 0, 10.0, 0, -1.0, 50.0])
+        self.raster.bands = [Band.from_array(numpy.random.RandomState(0).rand(64, 64))]
+        self.raster.build_overviews((2, 4))
+        # pretend the classic limit is just above the full resolution image
+        self.limit = saver.CLASSIC_MAX_BYTES
+        saver.CLASSIC_MAX_BYTES = 17000
+
+    def tearDown(self):
+        saver.CLASSIC_MAX_BYTES = self.limit
+        shutil.rmtree(self.directory)
+
+    def test_overviews_count_towards_limit(self):
+        # alone the full resolution image fits in a classic tiff
+        self.raster.save(self.filepath, tiled=True, tilesize=16, compression=None)
+        with open(self.filepath, "rb") as reader:
+            self.assertEqual(reader.read(4), b"II*\0")
+        self.raster.save(self.filepath, overviews=True, tiled=True, tilesize=16, compression=None)
+        with open(self.filepath, "rb") as reader:
+            self.assertEqual(reader.read(4), b"II+\0")
+        loaded = RasterData(self.filepath)
+        self.assertEqual(sorted(loaded.overviews), [2, 4])
+        self.assertTrue(numpy.allclose(loaded.bands[0].to_array(), self.raster.bands[0].to_array()))
+
+    def test_partial_file_removed(self):
+        with self.assertRaises(Exception):
+            self.raster.save(self.filepath, overviews=True, tiled=True, tilesize=16,
+                             compression=None, bigtiff=False)
+        self.assertFalse(os.path.exists(self.filepath))
+
+
+class TestWriters(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def roundtrip(self, filename, bands):
+        raster = RasterData(width=5, height=3, bands=0, nodata_value=-9999.0,
+                            transform_coeffs=[0.5, 0, 10.0, 0, -0.25, 50.0])
+        raster.bands = bands
+        filepath = os.path.join(self.directory, filename)
+        raster.save(filepath)
+        loaded = RasterData(filepath)
+        self.assertEqual(list(loaded.info["transform_coeffs"]), [0.5, 0, 10.0, 0, -0.25, 50.0])
+        self.assertEqual(len(loaded.bands), len(bands))
+        for band, loadedband in zip(bands, loaded.bands):
+            self.assertTrue(numpy.array_equal(numpy.asarray(loadedband.img), numpy.asarray(band.img)))
+        return loaded
+
+    def test_ascii(self):
+        array = numpy.arange(15, dtype=numpy.float32).reshape(3, 5) / 4
+        array[1, 2] = -9999.0
+        loaded = self.roundtrip("grid.asc", [Band.from_array(array)])
+        self.assertEqual(loaded.info["nodata_value"], -9999.0)
+
+    def test_image(self):
+        arrays = [numpy.arange(15, dtype=numpy.uint8).reshape(3, 5) * (i + 1) for i in xrange(3)]
+        bands = [Band(img, img.load()) for img in (PIL.Image.fromarray(array) for array in arrays)]
+        self.roundtrip("gray.png", bands[:1])
+        self.roundtrip("rgb.png", bands)
@@ -0,0 +1,48 @@
+import unittest
+
+import numpy
+import PIL.Image
+
+from ..raster import zonal
+from ..raster.data import RasterData, Band
+from ..vector.data import VectorData
+
+
+class TestZonal(unittest.TestCase):
+    def setUp(self):
+        self.raster = RasterData(width=4, height=4, bands=0, nodata_value=-9999.0,
+                                 transform_coeffs=[1.0, 0, 0.0, 0, -1.0, 4.0])
+        first = numpy.arange(16, dtype=numpy.float32).reshape(4, 4)
+        second = first.copy()
+        first[0, :2] = -9999.0
+        second[0, 1:3] = -9999.0
+        self.raster.bands = [Band.from_array(first), Band.from_array(second)]
+
+    def test_valid_cells_match_mask(self):
+        valid = zonal.valid_cells(self.raster)
+        self.assertEqual(valid.sum(), 15)
+        self.assertTrue((valid == numpy.asarray(self.raster.mask, dtype=bool)).all())
+
+    def test_valid_cells_match_byte_mask(self):
+        # 8 bit bands are only valid where every band has data
+        first = numpy.arange(16, dtype=numpy.uint8).reshape(4, 4)
+        second = first.copy()
+        first[0, 1] = second[0, 2] = 255
+        self.raster.info["nodata_value"] = 255
+        self.raster.bands = [Band(img, img.load()) for img in
+                             (PIL.Image.fromarray(first), PIL.Image.fromarray(second))]
+        valid = zonal.valid_cells(self.raster)
+        self.assertEqual(valid.sum(), 14)
+        self.assertTrue((valid == numpy.asarray(self.raster.mask, dtype=bool)).all())
+
+    def test_stats(self):
+        polygons = VectorData()
+        polygons.add_feature([], {"type": "Polygon",
+                                  "coordinates": [[(0, 2), (4, 2), (4, 4), (0, 4), (0, 2)]]})
+        stats = zonal.zonal_stats(polygons, self.raster, band=1, workers=1)
+        result = stats.values()[0]
+        # the band's own nodata cells are left out, even where the other band has data
+        self.assertEqual(result["count"], 6)
+        self.assertEqual(result["sum"], 25.0)
+        self.assertEqual(result["min"], 0.0)
+        self.assertEqual(result["max"], 7.0)
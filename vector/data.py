@@ -6,13 +6,16 @@ import sys
 
 from collections import OrderedDict
 
-import shapely
-from shapely.geometry import asShape as geojson2shapely
-
-import rtree
-
+from . import knn
 from . import loader
+from . import overlay
 from . import saver
+from .. import instrument
+from ..drivers import lazy_import
+
+# geometry and index backends are only imported once they are needed
+shapely = lazy_import("shapely")
+rtree = lazy_import("rtree")
 
 
 class Feature:
@@ -80,7 +83,7 @@ class Feature:
         return self._cached_bbox
 
     def get_shapely(self):
-        return geojson2shapely(self.geometry)
+        return shapely.geometry.asShape(self.geometry)
 
     def copy(self):
         geoj = self.geometry
@@ -112,17 +115,36 @@ class VectorData:
         self.fields = fields
 
         self._id_generator = ID_generator()
-        
+        self._create_features(rows, geometries)
+    
+        self.crs = crs
+
+    @classmethod
+    def from_files(cls, filepaths, workers=None, feature_type=None, **kwargs):
+        """
+        Load and merge many files, eg one per county, into a single VectorData.
+        The files are parsed in parallel on a pool of worker processes (see
+        loader.from_files for how differing fields are reconciled), then the
+        features and their spatial index are built in one pass.
+        """
+        new = cls(feature_type=feature_type)
+        fields, rows, geometries, crs = loader.from_files(filepaths, workers=workers, **kwargs)
+        new.fields = fields
+        new.crs = crs
+        new._create_features(rows, geometries)
+        new.create_spatial_index()
+        return new
+
+    def _create_features(self, rows, geometries):
         # attach objectIDs
         ids_rows_geoms = itertools.izip(self._id_generator, rows, geometries)
         # Create the features
         featureobjs = (Feature(self, row, geom, id=id) for id, row, geom in ids_rows_geoms)
         # Store features in an OrderedDict keyed by objectID
-        self.features = OrderedDict([
-            (feat.id, feat) for feat in featureobjs
-            ])
-    
-        self.crs = crs
+        with instrument.stage("vector.features", items=len(rows)):
+            self.features = OrderedDict([
+                (feat.id, feat) for feat in featureobjs
+                ])
 
     def __len__(self):
         return len(self.features)
@@ -159,9 +181,13 @@ class VectorData:
 
     def create_spatial_index(self):
         """Allows quick overlap search methods"""
-        self.spindex = rtree.index.Index()
-        for feat in self:
-            self.spindex.insert(feat.id, feat.bbox)
+        with instrument.stage("vector.index.build", items=len(self)):
+            if len(self):
+                # bulk loading packs the tree in one go, much faster than one insert at a time
+                stream = ((feat.id, feat.bbox, None) for feat in self)
+                self.spindex = rtree.index.Index(stream)
+            else:
+                self.spindex = rtree.index.Index()
     
     def quick_overlap(self, bbox):
         """
@@ -173,8 +199,12 @@ class VectorData:
         xs = bbox[0], bbox[2]
         ys = bbox[1], bbox[3]
         bbox = [min(xs), min(ys), max(xs), max(ys)]
-        # return generator over results
-        results = self.spindex.intersection(bbox)
+        # return generator over results, only gathered up front to count them
+        if not instrument.enabled:
+            return (self[id] for id in self.spindex.intersection(bbox))
+        with instrument.stage("vector.index.query") as stage:
+            results = list(self.spindex.intersection(bbox))
+            stage.add(items=len(results))
         return (self[id] for id in results)
 
     def quick_nearest(self, bbox, n=1):
@@ -187,10 +217,71 @@ class VectorData:
         xs = bbox[0],bbox[2]
         ys = bbox[1],bbox[3]
         bbox = [min(xs),min(ys),max(xs),max(ys)]
-        # return generator over results
-        results = self.spindex.nearest(bbox, num_results=n)
+        # return generator over results, only gathered up front to count them
+        if not instrument.enabled:
+            return (self[id] for id in self.spindex.nearest(bbox, num_results=n))
+        with instrument.stage("vector.index.nearest") as stage:
+            results = list(self.spindex.nearest(bbox, num_results=n))
+            stage.add(items=len(results))
         return (self[id] for id in results)
 
+    def nearest(self, geoms_or_points, k=1, max_distance=None, batchsize=1024, workers=None):
+        """
+        The exact k nearest features to each query, unlike quick_nearest
+        which only ranks by bbox. Queries can be shapely geometries, geojson
+        dicts or (x, y) points, eg a numpy array of points. Returns a list
+        of [(feature, distance), ...] nearest first for each query, or just
+        that list when given a single query. With max_distance, features
+        further away are left out, so fewer than k may be returned.
+        """
+        single = knn.is_single(geoms_or_points)
+        queries = [geoms_or_points] if single else geoms_or_points
+        with instrument.stage("vector.index.nearest_exact", items=len(queries)):
+            results = knn.nearest(self, queries, k, max_distance, batchsize, workers)
+        results = [[(self[id], distance) for distance, id in found] for found in results]
+        return results[0] if single else results
+
+    def clip(self, mask_layer, chunksize=256, workers=None):
+        """
+        The parts of the features that fall inside the features of the mask
+        layer, keeping their attributes. Features wholly outside are dropped.
+        """
+        return self._overlay(mask_layer, "clip", chunksize, workers)
+
+    def intersection(self, other, chunksize=256, workers=None):
+        """
+        The overlapping parts of every pair of intersecting features from
+        the two layers, with the attributes of both. The result has the
+        geometry type of the lowest dimension, eg lines for lines and polygons.
+        """
+        return self._overlay(other, "intersection", chunksize, workers)
+
+    def difference(self, other, chunksize=256, workers=None):
+        """
+        The parts of the features that fall outside all features of the
+        other layer, keeping their attributes. Features wholly inside are dropped.
+        """
+        return self._overlay(other, "difference", chunksize, workers)
+
+    def _overlay(self, other, operation, chunksize=256, workers=None):
+        # see overlay.overlay for how the work is divided
+        if operation == "intersection":
+            geomtype = overlay.result_type(self.type, other.type)
+            fields = self.fields + other.fields
+        else:
+            geomtype = self.type
+            fields = list(self.fields)
+        new = VectorData(feature_type=geomtype)
+        new.fields = fields
+        new.crs = self.crs
+        with instrument.stage("vector.overlay." + operation, items=len(self)):
+            results = overlay.overlay(self, other, operation, geomtype, chunksize, workers)
+        for id, otherid, geometry in results:
+            feat = self[id]
+            row = feat.row if otherid is None else feat.row + other[otherid].row
+            new.add_feature(row, geometry or feat.geometry)
+        return new
+
     def save(self, savepath, **kwargs):
         fields = self.fields
         rowgeoms = ((feat.row, feat.geometry) for feat in self) 
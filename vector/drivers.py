@@ -0,0 +1,11 @@
+from .. import drivers
+
+
+# the vector formats, their backends are imported on first use
+# the built in readers load whole files, so none are streaming or windowed
+registry = drivers.Registry(__name__.rpartition(".")[0])
+
+registry.register("shapefile", (".shp",),
+                  read=".loader:from_shapefile", write=".saver:to_shapefile")
+registry.register("geojson", (".geojson", ".json"),
+                  read=".loader:from_geojson", write=".saver:to_geojson")
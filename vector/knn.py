@@ -0,0 +1,157 @@
+# import internals
+import bisect
+import heapq
+import math
+import numbers
+
+from .. import parallel
+from ..drivers import lazy_import
+
+shapely = lazy_import("shapely")
+
+
+def bbox_distance(first, second):
+    """Distance between two (xmin, ymin, xmax, ymax) bboxes, a lower bound of the distance between what they contain."""
+    dx = max(0, second[0] - first[2], first[0] - second[2])
+    dy = max(0, second[1] - first[3], first[1] - second[3])
+    return math.hypot(dx, dy)
+
+
+def is_single(query):
+    """Whether the query is one geometry or point rather than a sequence of them."""
+    if hasattr(query, "geom_type") or isinstance(query, dict):
+        return True
+    return len(query) == 2 and all(isinstance(value, numbers.Number) for value in query)
+
+
+def as_shapely(query):
+    """A shapely geometry from a shapely geometry, a geojson dict or an (x, y) point."""
+    if hasattr(query, "geom_type"):
+        return query
+    elif isinstance(query, dict):
+        return shapely.geometry.shape(query)
+    x, y = query
+    return shapely.geometry.Point(float(x), float(y))
+
+
+# geometries of the searched layer shared with each worker process by _init_worker
+_shared = dict()
+
+
+def _init_worker(geometries):
+    _shared["geometries"] = geometries
+    _shared["shapes"] = dict()
+
+
+def _shape(id):
+    """Shapely geometry of a feature of the searched layer, built once per worker."""
+    shapes = _shared["shapes"]
+    if id not in shapes:
+        shapes[id] = shapely.geometry.shape(_shared["geometries"][id])
+    return shapes[id]
+
+
+def refine_within(geom, k, max_distance, ids):
+    """The k nearest (distance, id) within max_distance, from the window candidates."""
+    found = []
+    for id in ids:
+        distance = geom.distance(_shape(id))
+        if distance <= max_distance:
+            found.append((distance, id))
+    return heapq.nsmallest(k, found)
+
+
+def refine_nearest(geom, k, ranked, num):
+    """
+    The k nearest (distance, id), from the num candidates nearest by bbox
+    as a sorted list of (bbox distance, id). Candidates are checked in
+    order of their bbox distance, which never exceeds the exact distance,
+    so once it passes the k-th best exact distance the rest can't be any
+    closer. Returns None if the candidates run out before that, unless
+    they were all the features there are.
+    """
+    best = []
+    for bound, id in ranked:
+        if len(best) >= k and bound > best[k - 1][0]:
+            return best[:k]
+        bisect.insort(best, (geom.distance(_shape(id)), id))
+    if len(ranked) < num:
+        # every feature has been checked
+        return best[:k]
+    return None
+
+
+def _refine_batch(job):
+    # module level so it can be sent to worker processes
+    k, max_distance, queries = job
+    results = []
+    for geometry, candidates, num in queries:
+        geom = shapely.geometry.shape(geometry)
+        if max_distance is None:
+            results.append(refine_nearest(geom, k, candidates, num))
+        else:
+            results.append(refine_within(geom, k, max_distance, candidates))
+    return results
+
+
+class Searcher(object):
+    """
+    Candidate features of one layer pruned by bbox from its spatial index,
+    without touching any geometries, so batches can run on threads.
+    """
+    def __init__(self, vector_data):
+        self.spindex = vector_data.spindex
+        self.features = vector_data.features
+
+    def ranked(self, bbox, num):
+        """The num nearest ids by bbox, as a sorted list of (bbox distance, id)."""
+        ids = self.spindex.nearest(bbox, num_results=num)
+        return sorted((bbox_distance(bbox, self.features[id].bbox), id) for id in ids)
+
+    def window(self, bbox, max_distance):
+        """The ids whose bbox is within max_distance of the bbox."""
+        xmin, ymin, xmax, ymax = bbox
+        window = [xmin - max_distance, ymin - max_distance, xmax + max_distance, ymax + max_distance]
+        return list(self.spindex.intersection(window))
+
+    def prune_batch(self, batch, max_distance=None):
+        """Candidates of each (bbox, num) in the batch."""
+        if max_distance is None:
+            return [self.ranked(bbox, num) for bbox, num in batch]
+        return [self.window(bbox, max_distance) for bbox, num in batch]
+
+
+def nearest(vector_data, queries, k=1, max_distance=None, batchsize=1024, workers=None):
+    """
+    The exact k nearest features of vector_data to each query, as a list
+    of [(distance, id), ...] lists sorted by distance. Batches of query
+    bboxes are pruned to candidates on a thread pool, as rtree releases the
+    GIL in its C library. The exact distances are then refined in batches
+    on a pool of worker processes, which each build their own shapely
+    geometries of the layer. Queries whose candidates ran out are pruned
+    and refined again with twice as many.
+    """
+    if not hasattr(vector_data, "spindex"):
+        vector_data.create_spatial_index()
+    searcher = Searcher(vector_data)
+    geoms = [as_shapely(query) for query in queries]
+    geometries = dict((feat.id, feat.geometry) for feat in vector_data)
+    results = [None] * len(geoms)
+    pending = range(len(geoms))
+    num = k * 4
+    while pending:
+        bboxes = [(geoms[index].bounds, num) for index in pending]
+        pruned = parallel.map_threads(lambda batch: searcher.prune_batch(batch, max_distance),
+                                      parallel.chunks(bboxes, batchsize), workers)
+        candidates = [found for batch in pruned for found in batch]
+        refine = [(shapely.geometry.mapping(geoms[index]), found, num)
+                  for index, found in zip(pending, candidates)]
+        jobs = [(k, max_distance, chunk) for chunk in parallel.chunks(refine, batchsize)]
+        refined = parallel.map_processes(_refine_batch, jobs, workers,
+                                         initializer=_init_worker, initargs=(geometries,))
+        refined = [found for batch in refined for found in batch]
+        for index, found in zip(pending, refined):
+            results[index] = found
+        pending = [index for index, found in zip(pending, refined) if found is None]
+        num *= 2
+    return results
@@ -1,64 +1,146 @@
+import itertools
 import os
+import timeit
 
-import shapefile as pyshp
-import pygeoj
+from . import drivers
+from .. import instrument
+from .. import parallel
+from ..drivers import lazy_import
 
+# backends are only imported once a file of their format is read
+pyshp = lazy_import("shapefile")
+pygeoj = lazy_import("pygeoj")
 
-def from_file(filepath, encoding="utf8"):
 
-    def decode(value):
-        if isinstance(value, str): 
-            return value.decode(encoding)
-        else:
-            return value
-    
-    # shapefile
-    if filepath.lower().endswith(".shp"):
+def decode(value, encoding):
+    if isinstance(value, str): 
+        return value.decode(encoding)
+    else:
+        return value
+
+
+def _timed_records(filepath, encoding):
+    """
+    Read and decode the records one at a time like from_shapefile, but
+    timing the parsing and the decoding apart without holding the raw records.
+    """
+    timer = timeit.default_timer
+    start = timer()
+    shapereader = pyshp.Reader(filepath)
+    records = shapereader.iterRecords()
+    parsetime = timer() - start
+    start = timer()
+    fields = [decode(field[0], encoding) for field in shapereader.fields[1:]]
+    decodetime = timer() - start
+    rows = []
+    while True:
+        start = timer()
+        record = next(records, None)
+        parsed = timer()
+        parsetime += parsed - start
+        if record is None:
+            break
+        rows.append([decode(value, encoding) for value in record])
+        decodetime += timer() - parsed
+    instrument.record("vector.loader.parse_records", parsetime, items=len(rows))
+    instrument.record("vector.loader.decode", decodetime, items=len(rows))
+    return shapereader, fields, rows
+
+
+def from_shapefile(filepath, encoding="utf8"):
+    # load fields, rows, and geometries
+    # Field name is first value in field, first value in shapereader is delete flag
+    if instrument.enabled:
+        shapereader, fields, rows = _timed_records(filepath, encoding)
+    else:
         shapereader = pyshp.Reader(filepath)
-        
-        # load fields, rows, and geometries
-        # Field name is first value in field, first value in shapereader is delete flag
-        fields = [decode(field[0]) for field in shapereader.fields[1:]]
-        rows = [ [decode(value) for value in record] for record in shapereader.iterRecords()]
-        def getgeoj(obj):
-            """ Get list of geojson features and capture bbox if alreaday calculated"""
-            # .__Geo_interface__ returns geojson dict
-            geoj = obj.__geo_interface__
-            # Shapefiles store feature bounding boxes - except points obvy
-            if hasattr(obj, "bbox"):
-                geoj["bbox"] = obj.bbox
-            return geoj
+        fields = [decode(field[0], encoding) for field in shapereader.fields[1:]]
+        rows = [ [decode(value, encoding) for value in record] for record in shapereader.iterRecords()]
+    def getgeoj(obj):
+        """ Get list of geojson features and capture bbox if alreaday calculated"""
+        # .__Geo_interface__ returns geojson dict
+        geoj = obj.__geo_interface__
+        # Shapefiles store feature bounding boxes - except points obvy
+        if hasattr(obj, "bbox"):
+            geoj["bbox"] = obj.bbox
+        return geoj
+    with instrument.stage("vector.loader.parse_shapes", items=len(rows), nbytes=os.path.getsize(filepath)):
         geometries = [getgeoj(shape) for shape in shapereader.iterShapes()]
-        
-        # load projection string from .prj file if exists
-        if os.path.lexists(filepath[:-4] + ".prj"):
-            crs = open(filepath[:-4] + ".prj", "r").read()
-        else: crs = "+proj=longlat +ellps=WGS84 +datum=WGS84 +no_defs"
-        
-        return fields, rows, geometries, crs
-
-    # geojson file
-    elif filepath.lower().endswith((".geojson",".json")):
+    
+    # load projection string from .prj file if exists
+    if os.path.lexists(filepath[:-4] + ".prj"):
+        crs = open(filepath[:-4] + ".prj", "r").read()
+    else: crs = "+proj=longlat +ellps=WGS84 +datum=WGS84 +no_defs"
+    
+    return fields, rows, geometries, crs
+
+
+def from_geojson(filepath, encoding="utf8"):
+    with instrument.stage("vector.loader.parse_geojson", nbytes=os.path.getsize(filepath)) as stage:
         geojfile = pygeoj.load(filepath)
+        stage.add(items=len(geojfile))
 
-        # load fields, rows, and geometries
-        fields = [decode(field) for field in geojfile.common_attributes]
-        rows = [[decode(feat.properties[field]) for field in fields] for feat in geojfile]
+    # load fields, rows, and geometries
+    with instrument.stage("vector.loader.decode", items=len(geojfile)):
+        fields = [decode(field, encoding) for field in geojfile.common_attributes]
+        rows = [[decode(feat.properties[field], encoding) for field in fields] for feat in geojfile]
         geometries = [feat.geometry.__geo_interface__ for feat in geojfile]
 
-        # load crs
-        crs = geojfile.crs
-        
-        return fields, rows, geometries, crs
+    # load crs
+    crs = geojfile.crs
     
-    else:
+    return fields, rows, geometries, crs
+
+
+def from_file(filepath, encoding="utf8"):
+    driver = drivers.registry.find(filepath, "read")
+    if not driver:
         raise Exception(
             "Could not create vector data from the given filepath:"
             " the filetype extension is either missing or not supported"
             )
+    return driver.read(filepath, encoding=encoding)
+
 
+def _from_file_job(job):
+    # module level so it can be sent to worker processes
+    filepath, encoding = job
+    return from_file(filepath, encoding=encoding)
 
 
+def from_files(filepaths, encoding="utf8", workers=None):
+    """
+    Read several files on a pool of worker processes and merge them into
+    one set of fields, rows and geometries. The fields are the union of
+    the files' fields in the order first seen, and rows from files that
+    lack a field get an empty value for it. The crs is that of the first file.
+    """
+    jobs = [(filepath, encoding) for filepath in filepaths]
+    loaded = parallel.map_processes(_from_file_job, jobs, workers)
 
+    with instrument.stage("vector.loader.merge", items=len(loaded)) as stage:
+        fields = []
+        positions = dict()
+        for filefields, filerows, filegeometries, filecrs in loaded:
+            for field in filefields:
+                if field not in positions:
+                    positions[field] = len(fields)
+                    fields.append(field)
 
+        rows, geometries = [], []
+        for filefields, filerows, filegeometries, filecrs in loaded:
+            if filefields == fields:
+                rows.extend(filerows)
+            else:
+                # spread the values out to where their fields are in the merged schema
+                filepositions = [positions[field] for field in filefields]
+                for row in filerows:
+                    newrow = [""] * len(fields)
+                    for position, value in itertools.izip(filepositions, row):
+                        newrow[position] = value
+                    rows.append(newrow)
+            geometries.extend(filegeometries)
+        stage.add(items=len(rows))
 
+    crs = loaded[0][3] if loaded else "+proj=longlat +ellps=WGS84 +datum=WGS84 +no_defs"
+    return fields, rows, geometries, crs
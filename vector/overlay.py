@@ -0,0 +1,138 @@
+# import internals
+from .. import parallel
+from ..drivers import lazy_import
+
+shapely = lazy_import("shapely")
+
+
+DIMENSIONS = {"Point": 0, "LineString": 1, "Polygon": 2}
+
+OPERATIONS = ("clip", "intersection", "difference")
+
+
+# geometries of the other layer shared with each worker process by _init_worker
+_shared = dict()
+
+
+def _init_worker(geometries):
+    _shared["geometries"] = geometries
+    _shared["shapes"] = dict()
+
+
+def _other_shape(id):
+    """Shapely and prepared geometry of a feature of the other layer, built once per worker."""
+    shapes = _shared["shapes"]
+    if id not in shapes:
+        geom = shapely.geometry.shape(_shared["geometries"][id])
+        shapes[id] = geom, shapely.prepared.prep(geom)
+    return shapes[id]
+
+
+def result_type(firsttype, secondtype):
+    """The geometry type of an intersection, ie the lowest dimension of the two."""
+    return min(firsttype, secondtype, key=DIMENSIONS.get)
+
+
+def _parts(geom):
+    if geom.geom_type.startswith("Multi") or geom.geom_type == "GeometryCollection":
+        return [part for multi in geom.geoms for part in _parts(multi)]
+    return [geom]
+
+
+def extract(geom, geomtype):
+    """
+    Geojson of only the parts of a shapely geometry that are of the given
+    type, eg the polygons where two polygons meet along an edge as well,
+    or None if there are none.
+    """
+    parts = [part for part in _parts(geom) if part.geom_type == geomtype and not part.is_empty]
+    if not parts:
+        return None
+    elif len(parts) == 1:
+        return shapely.geometry.mapping(parts[0])
+    return {"type": "Multi" + geomtype,
+            "coordinates": [shapely.geometry.mapping(part)["coordinates"] for part in parts]}
+
+
+def _overlay_chunk(job):
+    # module level so it can be sent to worker processes
+    operation, geomtype, features = job
+    results = []
+    for id, geometry, candidates in features:
+        if not candidates:
+            # outside the other layer, no geometry work needed
+            if operation == "difference":
+                results.append((id, None, None))
+            continue
+        geom = shapely.geometry.shape(geometry)
+
+        if operation == "intersection":
+            for otherid in candidates:
+                other, prepared = _other_shape(otherid)
+                if not prepared.intersects(geom):
+                    continue
+                if prepared.contains(geom):
+                    # wholly inside, so the intersection is the feature itself
+                    results.append((id, otherid, None))
+                    continue
+                result = extract(geom.intersection(other), geomtype)
+                if result:
+                    results.append((id, otherid, result))
+            continue
+
+        # clip and difference work against the union of the overlapping features
+        overlapping = []
+        inside = False
+        for otherid in candidates:
+            other, prepared = _other_shape(otherid)
+            if prepared.contains(geom):
+                inside = True
+                break
+            if prepared.intersects(geom):
+                overlapping.append(other)
+        if inside:
+            if operation == "clip":
+                results.append((id, None, None))
+        elif not overlapping:
+            if operation == "difference":
+                results.append((id, None, None))
+        else:
+            union = shapely.ops.unary_union(overlapping)
+            if operation == "clip":
+                result = extract(geom.intersection(union), geomtype)
+            else:
+                result = extract(geom.difference(union), geomtype)
+            if result:
+                results.append((id, None, result))
+    return results
+
+
+def overlay(vector_data, other, operation, geomtype, chunksize=256, workers=None):
+    """
+    Overlay the features of vector_data with those of other, returning a
+    list of (id, otherid, geometry) in feature order. otherid is only given
+    by intersection, which pairs up features, while clip and difference
+    compare each feature with the other layer as a whole. A geometry of
+    None means the feature is kept unchanged.
+
+    Candidate pairs come from the other layer's spatial index. Features
+    found to be wholly inside or outside the other layer's features by
+    prepared geometry tests are kept or dropped without computing an
+    overlay, and only those that cross a boundary are computed exactly.
+    Features are processed in chunks on a pool of worker processes.
+    """
+    if operation not in OPERATIONS:
+        raise Exception("Overlay operation must be one of %s" % ", ".join(OPERATIONS))
+    if not hasattr(other, "spindex"):
+        other.create_spatial_index()
+
+    features = []
+    for feat in vector_data:
+        candidates = sorted(other.spindex.intersection(feat.bbox))
+        features.append((feat.id, feat.geometry, candidates))
+    geometries = dict((feat.id, feat.geometry) for feat in other)
+
+    jobs = [(operation, geomtype, chunk) for chunk in parallel.chunks(features, chunksize)]
+    results = parallel.map_processes(_overlay_chunk, jobs, workers,
+                                     initializer=_init_worker, initargs=(geometries,))
+    return [item for chunk in results for item in chunk]